@@ -0,0 +1,121 @@
+# benchmarks/common.py
+'''
+Общие вспомогательные функции для бенчмарков.
+
+Бенчмарки запускаются локально (вне Docker), поэтому здесь:
+    - настраиваются переменные окружения по умолчанию на localhost,
+    - в sys.path добавляются каталоги сервисов (fastapi/ и worker/),
+    - поднимается API-сервис в отдельном потоке (uvicorn),
+    - считаются перцентили и печатается отчет.
+'''
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import threading
+import logging
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.join(ROOT_DIR, "fastapi")
+WORKER_DIR = os.path.join(ROOT_DIR, "worker")
+
+logger = logging.getLogger("benchmarks")
+
+
+def setup_local_environment(api_port: int = 8800):
+    # Значения по умолчанию для локального запуска (docker-compose up -d postgresql redis)
+    os.environ.setdefault("POSTGRES_HOST", "localhost")
+    os.environ.setdefault("REDIS_HOST", "localhost")
+    os.environ.setdefault("REDIS_PORT", "6379")
+    os.environ.setdefault("API_HOST", "127.0.0.1")
+    os.environ["API_PORT"] = str(api_port)
+    # Workflow запускает сам бенчмарк, фоновая сверка расписаний API не нужна
+    os.environ.setdefault("RECONCILE_INTERVAL_SECONDS", "0")
+
+    for path in (API_DIR, WORKER_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def percentile(values, pct: float):
+    # Перцентиль по методу nearest-rank, None для пустой выборки
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    # Сводка по выборке длительностей (в миллисекундах)
+    return {
+        "count": len(values),
+        "p50_ms": _round(percentile(values, 50)),
+        "p99_ms": _round(percentile(values, 99)),
+        "max_ms": _round(max(values) if values else None),
+        "mean_ms": _round(sum(values) / len(values) if values else None),
+    }
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+class StageRecorder:
+    # Потокобезопасный сборщик длительностей по этапам
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def record(self, stage: str, duration_ms: float):
+        with self._lock:
+            self.stages.setdefault(stage, []).append(duration_ms)
+
+    def report(self):
+        with self._lock:
+            return {stage: summarize(values) for stage, values in sorted(self.stages.items())}
+
+
+class ApiServerThread:
+    # Запуск FastAPI приложения через uvicorn в отдельном потоке со своим event loop.
+    # Отдельный поток нужен, чтобы блокирующие вызовы в Activity не останавливали API.
+    def __init__(self, app, port: int):
+        import uvicorn
+        self.config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(self.config)
+        self.thread = threading.Thread(target=self.server.run, name="bench-api", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 30
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("API server failed to start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def print_report(title: str, report: dict, output_path: str = None):
+    print(f"\n=== {title} ===")
+    print(json.dumps(report, indent=2, ensure_ascii=False, default=str))
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+        print(f"Report written to {output_path}")
+
+
+async def gather_limited(coros, limit: int):
+    # asyncio.gather с ограничением числа одновременно выполняемых корутин
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros))
@@ -0,0 +1,354 @@
+# benchmarks/load_throughput.py
+'''
+Сквозной нагрузочный бенчмарк: API -> Temporal Workflow -> Redis -> Executor -> API.
+
+Что делает:
+    1. Поднимает time-skipping окружение Temporal (temporalio.testing.WorkflowEnvironment)
+       и Worker с ScheduleExecutionWorkflow и настоящими Activity.
+    2. Поднимает API-сервис (fastapi/app) в отдельном потоке на localhost.
+    3. Создает через API N устройств, команд и (неактивных) расписаний.
+    4. Запускает фейковый Executor (потоки, читающие поток 'tasks' в Redis) с настраиваемой
+       задержкой, вероятностью ошибки и размером вывода.
+    5. Запускает Workflow для каждого расписания (все сразу или равномерно в окне)
+       и дожидается результатов.
+    6. Печатает executions/sec и p50/p99 по этапам.
+
+Требования: локальные PostgreSQL и Redis, например:
+    docker-compose up -d postgresql redis
+
+Пример:
+    python benchmarks/load_throughput.py --devices 50 --commands-per-device 2 --executor-delay-ms 200:800
+'''
+import argparse
+import asyncio
+import ipaddress
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from common import (
+    ApiServerThread,
+    StageRecorder,
+    gather_limited,
+    print_report,
+    setup_local_environment,
+)
+
+logger = logging.getLogger("benchmarks.load_throughput")
+
+# Потоки задач по приоритетам, как в worker/workflows/schedule_workflow.py
+TASK_STREAMS = {"high": "tasks:high", "normal": "tasks", "low": "tasks:low"}
+
+
+def all_task_streams() -> list:
+    # С учетом шардирования по device_id (TASK_PARTITIONS), фейковый Executor читает все партиции
+    partitions = max(1, int(os.getenv("TASK_PARTITIONS", "1")))
+    if partitions == 1:
+        return list(TASK_STREAMS.values())
+    return [f"{stream}:p{p}" for stream in TASK_STREAMS.values() for p in range(partitions)]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="End-to-end load and throughput benchmark")
+    parser.add_argument("--devices", type=int, default=20, help="Количество устройств")
+    parser.add_argument("--commands-per-device", type=int, default=1)
+    parser.add_argument("--schedules-per-command", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=1, help="Сколько раз выполнить каждое расписание")
+    parser.add_argument("--arrival", choices=["burst", "uniform"], default="burst",
+                        help="burst - все Workflow стартуют одновременно, uniform - равномерно в окне --window")
+    parser.add_argument("--window", type=float, default=10.0, help="Окно (сек) для режима uniform")
+    parser.add_argument("--executor-delay-ms", default="50:200",
+                        help="Задержка фейкового Executor'а: 'N' или 'MIN:MAX' (равномерно)")
+    parser.add_argument("--executor-failure-rate", type=float, default=0.0)
+    parser.add_argument("--executor-output-bytes", type=int, default=256)
+    parser.add_argument("--executor-concurrency", type=int, default=4, help="Количество потоков фейкового Executor'а")
+    parser.add_argument("--worker-activities", type=int, default=100, help="max_concurrent_activities Worker'а")
+    parser.add_argument("--priority", choices=["high", "normal", "low"], default="normal",
+                        help="Приоритет задач (поток tasks:high, tasks или tasks:low)")
+    parser.add_argument("--completion", choices=["poll", "signal"], default="poll",
+                        help="Ожидание результата: poll - Activity ждет ответ в потоке запуска results:run:{run_id}, "
+                             "signal - сигнал Workflow")
+    parser.add_argument("--task-queue", default="bench-scheduled-tasks")
+    parser.add_argument("--api-port", type=int, default=8800)
+    parser.add_argument("--seed-concurrency", type=int, default=20)
+    parser.add_argument("--reset-streams", action="store_true",
+                        help="Удалить потоки задач и результатов (results:run:*, results:completions) в Redis перед запуском")
+    parser.add_argument("--output", help="Путь для сохранения отчета в JSON")
+    return parser.parse_args()
+
+
+def parse_delay(spec: str):
+    if ":" in spec:
+        low, high = spec.split(":", 1)
+        return float(low), float(high)
+    return float(spec), float(spec)
+
+
+class FakeExecutor:
+    '''
+    Фейковый Executor: тот же протокол, что и executor/main.py
+    (группа executor_group на потоке tasks, результат в поток из поля reply_to задачи),
+    но с настраиваемым поведением и замером этапов.
+    '''
+
+    def __init__(self, recorder: StageRecorder, delay_ms, failure_rate: float, output_bytes: int, concurrency: int):
+        self.recorder = recorder
+        self.delay_ms = delay_ms
+        self.failure_rate = failure_rate
+        self.output_bytes = output_bytes
+        self.concurrency = concurrency
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def _redis(self):
+        import redis
+        return redis.Redis(host=os.environ["REDIS_HOST"], port=int(os.environ["REDIS_PORT"]), db=0,
+                           decode_responses=True)
+
+    def start(self):
+        import redis
+        r = self._redis()
+        for stream in all_task_streams():
+            try:
+                r.xgroup_create(stream, "executor_group", id="0", mkstream=True)
+            except redis.exceptions.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._run, args=(f"bench_executor_{i}",), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout=5)
+
+    def _run(self, consumer_name: str):
+        r = self._redis()
+        while not self.stop_event.is_set():
+            streams = {stream: ">" for stream in all_task_streams()}
+            messages = r.xreadgroup("executor_group", consumer_name, streams, count=1, block=500)
+            for stream, message_list in messages or []:
+                for message_id, task in message_list:
+                    self._handle(r, stream, message_id, task)
+
+    def _handle(self, r, stream, message_id, task):
+        picked_at = time.time()
+        published_at = _parse_timestamp(task.get("timestamp"))
+        if published_at is not None:
+            self.recorder.record("executor.queue_wait", (picked_at - published_at) * 1000)
+
+        delay = random.uniform(*self.delay_ms) / 1000.0
+        time.sleep(delay)
+        failed = random.random() < self.failure_rate
+        output = ("x" * self.output_bytes) if not failed else "Connection timeout"
+        self.recorder.record("executor.execute", (time.time() - picked_at) * 1000)
+
+        r.xadd(task.get("reply_to") or "results", {
+            "schedule_id": task.get("schedule_id"),
+            "command_id": task.get("command_id"),
+            "device_id": task.get("device_id"),
+            "output": output,
+            "status": "failed" if failed else "success",
+            "idempotency_key": task.get("idempotency_key") or "",
+            "workflow_id": task.get("workflow_id") or "",
+            "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        r.xack(stream, "executor_group", message_id)
+
+
+def _parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.rstrip("Z")).replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+
+def make_stage_interceptor(recorder: StageRecorder):
+    # Interceptor Worker'а, который замеряет длительность каждой Activity
+    from temporalio import activity
+    from temporalio.worker import ActivityInboundInterceptor, Interceptor
+
+    class _StageTimingActivityInbound(ActivityInboundInterceptor):
+        async def execute_activity(self, input):
+            started = time.perf_counter()
+            try:
+                return await super().execute_activity(input)
+            finally:
+                stage = f"activity.{activity.info().activity_type}"
+                recorder.record(stage, (time.perf_counter() - started) * 1000)
+
+    class _StageTimingInterceptor(Interceptor):
+        def intercept_activity(self, next):
+            return _StageTimingActivityInbound(next)
+
+    return _StageTimingInterceptor()
+
+
+async def seed(api_base_url: str, args) -> list:
+    # Создание устройств, команд и расписаний через API. Возвращает входные данные для Workflow.
+    import httpx
+
+    # Случайная база в 10.0.0.0/8, чтобы повторные запуски не конфликтовали по уникальному IP
+    base = int(ipaddress.IPv4Address("10.0.0.0")) + random.randint(0, 2 ** 24 - 1 - args.devices)
+    workflow_inputs = []
+
+    async with httpx.AsyncClient(base_url=api_base_url, timeout=30.0) as client:
+        async def create_device(i):
+            ip = str(ipaddress.IPv4Address(base + i))
+            response = await client.post("/devices/", json={"ip_address": ip, "device_type": "router"})
+            response.raise_for_status()
+            return response.json()
+
+        async def create_command(device, i):
+            response = await client.post(f"/devices/{device['id']}/commands/",
+                                         json={"command_string": f"show bench {i}"})
+            response.raise_for_status()
+            return device, response.json()
+
+        async def create_schedule(device, command):
+            # Расписания создаются неактивными: Workflow запускает сам бенчмарк, а не API
+            response = await client.post(
+                f"/devices/{device['id']}/commands/{command['id']}/schedules/",
+                json={"cron_expression": "*/1 * * * *", "is_active": False},
+            )
+            response.raise_for_status()
+            schedule = response.json()
+            return {
+                "schedule_id": schedule["id"],
+                "command_id": command["id"],
+                "device_id": device["id"],
+                "cron_expression": schedule["cron_expression"],
+                "priority": args.priority,
+            }
+
+        devices = await gather_limited([create_device(i) for i in range(args.devices)], args.seed_concurrency)
+        pairs = await gather_limited(
+            [create_command(d, i) for d in devices for i in range(args.commands_per_device)], args.seed_concurrency)
+        workflow_inputs = await gather_limited(
+            [create_schedule(d, c) for d, c in pairs for _ in range(args.schedules_per_command)],
+            args.seed_concurrency)
+
+    return workflow_inputs
+
+
+async def run_benchmark(args):
+    setup_local_environment(args.api_port)
+    # Читается Activity публикации задачи (см. worker/workflows/completions.py)
+    os.environ["RESULT_COMPLETION_MODE"] = args.completion
+
+    import redis
+    from temporalio.testing import WorkflowEnvironment
+    from temporalio.worker import Worker
+
+    import app.temporal_client as api_temporal_client
+    from app.database import engine
+    from app.main import app as api_app
+    from workflows.completions import COMPLETIONS_STREAM, RUN_RESULTS_PREFIX, ResultCompletionConsumer
+    from workflows.schedule_workflow import (
+        ScheduleExecutionWorkflow,
+        fetch_command_details,
+        publish_task_to_redis,
+        save_result_to_api,
+        wait_for_result_from_redis,
+    )
+
+    # echo=True в database.py заливает вывод SQL-запросами и искажает замеры
+    engine.echo = False
+
+    if args.reset_streams:
+        r = redis.Redis(host=os.environ["REDIS_HOST"], port=int(os.environ["REDIS_PORT"]), db=0)
+        r.delete(*all_task_streams(), "results", COMPLETIONS_STREAM, *r.scan_iter(f"{RUN_RESULTS_PREFIX}*"))
+
+    recorder = StageRecorder()
+    executor = FakeExecutor(recorder, parse_delay(args.executor_delay_ms), args.executor_failure_rate,
+                            args.executor_output_bytes, args.executor_concurrency)
+
+    logger.info("Starting Temporal time-skipping environment...")
+    async with await WorkflowEnvironment.start_time_skipping() as env:
+        # API использует тот же Temporal, что и бенчмарк
+        api_temporal_client.temporal_client = env.client
+
+        with ApiServerThread(api_app, args.api_port):
+            seed_started = time.perf_counter()
+            workflow_inputs = await seed(f"http://127.0.0.1:{args.api_port}", args)
+            seed_seconds = time.perf_counter() - seed_started
+            logger.info(f"Seeded {len(workflow_inputs)} schedules in {seed_seconds:.2f}s")
+
+            executor.start()
+            statuses = {}
+            consumer_task = None
+            if args.completion == "signal":
+                consumer = ResultCompletionConsumer(env.client, os.environ["REDIS_HOST"], int(os.environ["REDIS_PORT"]))
+                consumer_task = asyncio.create_task(consumer.run())
+            try:
+                async with Worker(
+                    env.client,
+                    task_queue=args.task_queue,
+                    workflows=[ScheduleExecutionWorkflow],
+                    activities=[publish_task_to_redis, wait_for_result_from_redis, save_result_to_api,
+                                fetch_command_details],
+                    interceptors=[make_stage_interceptor(recorder)],
+                    max_concurrent_activities=args.worker_activities,
+                ):
+                    runs = [(workflow_input, round_no) for round_no in range(args.rounds)
+                            for workflow_input in workflow_inputs]
+                    step = args.window / len(runs) if args.arrival == "uniform" and runs else 0.0
+                    bench_started = time.perf_counter()
+
+                    async def drive(index, workflow_input, round_no):
+                        if step:
+                            await asyncio.sleep(index * step)
+                        started = time.perf_counter()
+                        result = await env.client.execute_workflow(
+                            ScheduleExecutionWorkflow.run,
+                            workflow_input,
+                            id=f"bench-{workflow_input['schedule_id']}-{round_no}-{uuid.uuid4().hex[:8]}",
+                            task_queue=args.task_queue,
+                        )
+                        recorder.record("workflow.end_to_end", (time.perf_counter() - started) * 1000)
+                        status = result.get("status", "unknown")
+                        statuses[status] = statuses.get(status, 0) + 1
+
+                    if args.completion == "signal":
+                        # Пока Workflow ждут сигнал, Activity не выполняются, и time-skipping сразу
+                        # промотал бы время до таймаута ожидания
+                        with env.auto_time_skipping_disabled():
+                            await asyncio.gather(*(drive(i, wi, rn) for i, (wi, rn) in enumerate(runs)))
+                    else:
+                        await asyncio.gather(*(drive(i, wi, rn) for i, (wi, rn) in enumerate(runs)))
+                    wall_seconds = time.perf_counter() - bench_started
+            finally:
+                executor.stop()
+                if consumer_task is not None:
+                    consumer_task.cancel()
+
+    completed = sum(statuses.values())
+    return {
+        "config": vars(args),
+        "schedules": len(workflow_inputs),
+        "executions": completed,
+        "statuses": statuses,
+        "seed_seconds": round(seed_seconds, 2),
+        "wall_seconds": round(wall_seconds, 2),
+        "executions_per_second": round(completed / wall_seconds, 2) if wall_seconds else None,
+        "stages": recorder.report(),
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    report = asyncio.run(run_benchmark(args))
+    print_report("Load and throughput benchmark", report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+# benchmarks/query_volume.py
+'''
+Бенчмарк запросов API на больших объемах данных.
+
+Что делает:
+    1. Создает (если нужно) отдельную БД для бенчмарка и пересоздает в ней таблицы.
+    2. Массово генерирует устройства, команды, расписания и результаты средствами самого
+       PostgreSQL (INSERT ... SELECT generate_series), порциями, до каждого из заданных масштабов.
+    3. На каждом масштабе замеряет эндпоинты чтения (p50/p99) через ASGI-транспорт httpx.
+    4. Для каждого эндпоинта сохраняет EXPLAIN (ANALYZE, BUFFERS) всех SQL-запросов, которые он выполнил,
+       и отмечает последовательные сканирования (Seq Scan) по большим таблицам.
+
+Требования: локальный PostgreSQL, например:
+    docker-compose up -d postgresql
+
+Пример:
+    python benchmarks/query_volume.py --scales 100000,1000000,10000000 --devices 5000 --output plans.json
+'''
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from common import print_report, setup_local_environment, summarize
+
+logger = logging.getLogger("benchmarks.query_volume")
+
+# Таблицы, последовательное сканирование которых на больших объемах считается регрессией
+LARGE_TABLES = ("command_results",)
+
+# Период статистики: сгенерированные результаты начинаются с 2020-01-01
+STATS_SINCE = "2020-01-01T00:00:00Z"
+STATS_UNTIL = "2020-01-08T00:00:00Z"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Data-volume query benchmark for the results API")
+    parser.add_argument("--database", default="scheduled_commands_bench",
+                        help="Отдельная БД для бенчмарка (будет создана и очищена)")
+    parser.add_argument("--scales", default="10000,100000,1000000",
+                        help="Количество строк command_results на каждом шаге, через запятую")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--commands-per-device", type=int, default=3)
+    parser.add_argument("--schedules-per-command", type=int, default=1)
+    parser.add_argument("--output-bytes", type=int, default=512, help="Средний размер вывода команды")
+    parser.add_argument("--batch-size", type=int, default=500000, help="Строк результатов на один INSERT")
+    parser.add_argument("--iterations", type=int, default=20, help="Повторов каждого запроса на масштабе")
+    parser.add_argument("--deep-offset", type=int, default=5000, help="skip для замера глубокой пагинации")
+    parser.add_argument("--output", help="Путь для сохранения отчета в JSON")
+    return parser.parse_args()
+
+
+async def ensure_database(name: str):
+    # Создает БД для бенчмарка, подключаясь к служебной БД postgres
+    import asyncpg
+    conn = await asyncpg.connect(
+        user=os.getenv("POSTGRES_USER", "postgres"),
+        password=os.getenv("POSTGRES_PASSWORD", "postgres"),
+        host=os.getenv("POSTGRES_HOST", "localhost"),
+        port=int(os.getenv("POSTGRES_PORT", "5432")),
+        database="postgres",
+    )
+    try:
+        exists = await conn.fetchval("SELECT 1 FROM pg_database WHERE datname = $1", name)
+        if not exists:
+            await conn.execute(f'CREATE DATABASE "{name}"')
+            logger.info(f"Created benchmark database '{name}'")
+    finally:
+        await conn.close()
+
+
+async def seed_inventory(engine, args):
+    # Устройства, команды и расписания - небольшие таблицы, создаются одним запросом каждая
+    from sqlalchemy import text
+
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            INSERT INTO devices (id, ip_address, device_type, username, password, created_at, updated_at)
+            SELECT gen_random_uuid(),
+                   '100.64.0.0'::inet + g,
+                   (ARRAY['router', 'switch', 'firewall'])[1 + g % 3],
+                   'bench', 'bench', now(), now()
+            FROM generate_series(1, :devices) AS g
+        """), {"devices": args.devices})
+        await conn.execute(text("""
+            INSERT INTO commands (id, device_id, command_string, description, created_at, updated_at)
+            SELECT gen_random_uuid(), d.id, 'show bench ' || g, NULL, now(), now()
+            FROM devices d CROSS JOIN generate_series(1, :per_device) AS g
+        """), {"per_device": args.commands_per_device})
+        await conn.execute(text("""
+            INSERT INTO schedules (id, command_id, cron_expression, is_active, created_at, updated_at)
+            SELECT gen_random_uuid(), c.id, '*/5 * * * *', true, now(), now()
+            FROM commands c CROSS JOIN generate_series(1, :per_command) AS g
+        """), {"per_command": args.schedules_per_command})
+        for table in ("devices", "commands", "schedules"):
+            await conn.execute(text(f"ANALYZE {table}"))
+
+
+async def grow_results(engine, current: int, target: int, args):
+    # Догенерация command_results до target строк порциями по batch_size
+    from sqlalchemy import text
+
+    while current < target:
+        batch = min(args.batch_size, target - current)
+        started = time.perf_counter()
+        async with engine.begin() as conn:
+            await conn.execute(text("""
+                WITH s AS (
+                    SELECT schedules.id, commands.device_id,
+                           (row_number() OVER (ORDER BY schedules.id)) - 1 AS rn, count(*) OVER () AS total
+                    FROM schedules JOIN commands ON commands.id = schedules.command_id
+                )
+                INSERT INTO command_results (id, schedule_id, device_id, output, status, duration_ms,
+                                             executed_at, created_at)
+                SELECT gen_random_uuid(),
+                       s.id,
+                       s.device_id,
+                       repeat(md5(g::text), greatest(1, :output_bytes / 32)),
+                       CASE WHEN g % 10 = 0 THEN 'failed' ELSE 'success' END,
+                       3000 + (g * 7919) % 4000,
+                       '2020-01-01'::timestamptz + make_interval(secs => g * 60.0 / s.total),
+                       '2020-01-01'::timestamptz + make_interval(secs => g * 60.0 / s.total)
+                FROM generate_series(:start, :stop) AS g
+                JOIN s ON s.rn = g % s.total
+            """), {"start": current + 1, "stop": current + batch, "output_bytes": args.output_bytes})
+        current += batch
+        logger.info(f"command_results: {current}/{target} rows ({time.perf_counter() - started:.1f}s per batch)")
+
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE command_results"))
+    return current
+
+
+async def rebuild_projections(engine):
+    # Проекции обновляются на пути приема результата через API; для сгенерированных в SQL результатов
+    # latest_results и result_rollups пересчитываются целиком
+    from sqlalchemy import text
+    from app.rollups import DURATION_BUCKETS_MS, GRANULARITIES, HISTOGRAM_COLUMNS
+
+    bounds = [0, *DURATION_BUCKETS_MS]
+    histogram = [
+        f"count(*) FILTER (WHERE r.duration_ms > {lower} AND r.duration_ms <= {upper})"
+        for lower, upper in zip(bounds, bounds[1:])
+    ] + [f"count(*) FILTER (WHERE r.duration_ms > {bounds[-1]})"]
+
+    started = time.perf_counter()
+    async with engine.begin() as conn:
+        await conn.execute(text("TRUNCATE latest_results, result_rollups"))
+        await conn.execute(text("""
+            INSERT INTO latest_results (schedule_id, device_id, command_id, result_id, status, parsed, executed_at)
+            SELECT DISTINCT ON (r.schedule_id) r.schedule_id, r.device_id, s.command_id, r.id, r.status, r.parsed,
+                   r.executed_at
+            FROM command_results r JOIN schedules s ON s.id = r.schedule_id
+            ORDER BY r.schedule_id, r.executed_at DESC
+        """))
+        for granularity, seconds in GRANULARITIES.items():
+            await conn.execute(text(f"""
+                INSERT INTO result_rollups (granularity, bucket_start, device_id, command_id, device_type,
+                                            total, success, failed, duration_count, duration_sum_ms,
+                                            duration_max_ms, {", ".join(HISTOGRAM_COLUMNS)})
+                SELECT '{granularity}', to_timestamp(floor(extract(epoch FROM r.executed_at) / {seconds}) * {seconds}),
+                       r.device_id, s.command_id, d.device_type,
+                       count(*), count(*) FILTER (WHERE r.status = 'success'),
+                       count(*) FILTER (WHERE r.status = 'failed'),
+                       count(r.duration_ms), coalesce(sum(r.duration_ms), 0), max(r.duration_ms),
+                       {", ".join(histogram)}
+                FROM command_results r
+                JOIN schedules s ON s.id = r.schedule_id
+                LEFT JOIN devices d ON d.id = r.device_id
+                GROUP BY 2, r.device_id, s.command_id, d.device_type
+            """))
+        await conn.execute(text("ANALYZE latest_results"))
+        await conn.execute(text("ANALYZE result_rollups"))
+    logger.info(f"Projections rebuilt in {time.perf_counter() - started:.1f}s")
+
+
+async def pick_targets(engine):
+    # Случайные существующие идентификаторы для параметров запросов
+    from sqlalchemy import text
+
+    async with engine.connect() as conn:
+        row = (await conn.execute(text("""
+            SELECT c.device_id, c.id AS command_id, s.id AS schedule_id
+            FROM schedules s JOIN commands c ON c.id = s.command_id
+            ORDER BY random() LIMIT 1
+        """))).one()
+        result_id = (await conn.execute(text(
+            "SELECT id FROM command_results WHERE schedule_id = :sid LIMIT 1"), {"sid": row.schedule_id}
+        )).scalar()
+    return {
+        "device_id": row.device_id,
+        "command_id": row.command_id,
+        "schedule_id": row.schedule_id,
+        "result_id": result_id,
+    }
+
+
+def endpoints(targets, args):
+    d, c, s, r = targets["device_id"], targets["command_id"], targets["schedule_id"], targets["result_id"]
+    return {
+        "read_devices": "/devices/",
+        "query_devices_subnet": "/devices/query/?subnet=100.64.0.0/22&device_type=switch",
+        "read_commands_for_device": f"/devices/{d}/commands/",
+        "read_schedules_for_command": f"/devices/{d}/commands/{c}/schedules/",
+        "read_results_for_device": f"/devices/{d}/results/",
+        "read_results_for_device_deep": f"/devices/{d}/results/?skip={args.deep_offset}",
+        "read_result_by_id": f"/devices/{d}/schedules/{s}/result/{r}",
+        "read_result_output_tail": f"/devices/{d}/schedules/{s}/result/{r}/output?tail=50",
+        "read_command_by_id": f"/commands/{c}",
+        "read_latest_results_for_device": f"/devices/{d}/latest/",
+        "read_fleet_state": "/fleet/state/",
+        "search_results_device": f"/results/search/?q=c4ca42&device_id={d}",
+        "search_results_fleet": f"/results/search/?q=c4ca4238a0b9",
+        "stats_by_device_type": f"/stats/?since={STATS_SINCE}&until={STATS_UNTIL}",
+        "stats_device_series": f"/stats/?group_by=bucket&device_id={d}&since={STATS_SINCE}&until={STATS_UNTIL}",
+    }
+
+
+class StatementCapture:
+    # Перехват SQL-запросов, выполненных движком, для последующего EXPLAIN
+    def __init__(self, engine):
+        self.engine = engine
+        self.enabled = False
+        self.statements = []
+
+    def install(self):
+        from sqlalchemy import event
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.enabled:
+            self.statements.append((statement, parameters))
+
+    def capture(self):
+        self.statements = []
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+        return list(self.statements)
+
+
+async def explain(engine, statements):
+    plans = []
+    async with engine.connect() as conn:
+        for statement, parameters in statements:
+            rows = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+            plan = [row[0] for row in rows]
+            seq_scans = [line.strip() for line in plan
+                         if "Seq Scan" in line and any(table in line for table in LARGE_TABLES)]
+            plans.append({"statement": " ".join(statement.split()), "plan": plan, "seq_scans_on_large_tables": seq_scans})
+        await conn.rollback()
+    return plans
+
+
+async def measure_scale(client, engine, capture, targets, args):
+    report = {}
+    for name, url in endpoints(targets, args).items():
+        # Один прогрев с перехватом запросов для EXPLAIN
+        capture.capture()
+        response = await client.get(url)
+        statements = capture.stop()
+        if response.status_code != 200:
+            report[name] = {"url": url, "error": f"HTTP {response.status_code}: {response.text[:200]}"}
+            continue
+
+        durations = []
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            response = await client.get(url)
+            durations.append((time.perf_counter() - started) * 1000)
+
+        report[name] = {
+            "url": url,
+            "queries_per_request": len(statements),
+            "latency": summarize(durations),
+            "explain": await explain(engine, statements),
+        }
+    return report
+
+
+async def run_benchmark(args):
+    setup_local_environment()
+    os.environ["POSTGRES_DB"] = args.database
+    await ensure_database(args.database)
+
+    import httpx
+    from app.database import Base, engine
+    from app.main import app as api_app
+
+    # echo=True в database.py заливает вывод SQL-запросами и искажает замеры
+    engine.echo = False
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    started = time.perf_counter()
+    await seed_inventory(engine, args)
+    logger.info(f"Inventory seeded in {time.perf_counter() - started:.1f}s")
+
+    capture = StatementCapture(engine)
+    capture.install()
+
+    scales = sorted(int(s) for s in args.scales.split(","))
+    report = {"config": vars(args), "scales": {}}
+    current = 0
+    transport = httpx.ASGITransport(app=api_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for scale in scales:
+            started = time.perf_counter()
+            current = await grow_results(engine, current, scale, args)
+            await rebuild_projections(engine)
+            seed_seconds = time.perf_counter() - started
+            targets = await pick_targets(engine)
+            report["scales"][str(scale)] = {
+                "seed_seconds": round(seed_seconds, 2),
+                "endpoints": await measure_scale(client, engine, capture, targets, args),
+            }
+
+    await engine.dispose()
+    return report
+
+
+def print_summary(report):
+    # Краткая таблица: масштаб x эндпоинт -> p50/p99, число запросов и признак Seq Scan
+    print(f"\n{'scale':>12} {'endpoint':<32} {'p50 ms':>9} {'p99 ms':>9} {'queries':>8}  seq-scan")
+    for scale, data in report["scales"].items():
+        for name, result in data["endpoints"].items():
+            if "error" in result:
+                print(f"{scale:>12} {name:<32} {result['error']}")
+                continue
+            seq = any(p["seq_scans_on_large_tables"] for p in result["explain"])
+            print(f"{scale:>12} {name:<32} {result['latency']['p50_ms']:>9} {result['latency']['p99_ms']:>9} "
+                  f"{result['queries_per_request']:>8}  {'YES' if seq else '-'}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    report = asyncio.run(run_benchmark(args))
+    if args.output:
+        print_report("Data-volume query benchmark", report, args.output)
+    print_summary(report)
+
+
+if __name__ == "__main__":
+    main()
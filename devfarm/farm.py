@@ -0,0 +1,175 @@
+# devfarm/farm.py
+'''
+Ферма виртуальных устройств: тысячи CLI-эндпоинтов (TCP) в одном asyncio-процессе.
+
+Устройства различаются адресом: ферма слушает один порт на всех адресах (0.0.0.0), а устройство
+определяется локальным адресом принятого соединения. В Linux весь диапазон 127.0.0.0/8 принадлежит
+loopback, поэтому устройства 127.1.0.1, 127.1.0.2, ... доступны без настройки интерфейсов и без
+отдельного сокета на каждое устройство.
+
+Протокол - упрощенный CLI в стиле telnet:
+    ферма:  баннер, затем приглашение "{hostname}#"
+    клиент: строка команды
+    ферма:  вывод команды, затем снова приглашение
+    клиент: "exit" - закрыть сессию
+Ошибка команды возвращается выводом, начинающимся с "% " (как в Cisco IOS).
+'''
+import asyncio
+import ipaddress
+import logging
+import random
+import time
+import zlib
+from dataclasses import dataclass, field
+
+from outputs import render
+from profiles import DeviceProfile, assign_profiles
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class VirtualDevice:
+    address: str
+    hostname: str
+    serial: str
+    profile: DeviceProfile
+    unreachable: bool = False
+    sessions: int = 0
+
+
+@dataclass
+class FarmStats:
+    connections: int = 0
+    active_sessions: int = 0
+    rejected_sessions: int = 0
+    silent_connections: int = 0
+    commands: int = 0
+    failed_commands: int = 0
+    hung_commands: int = 0
+    bytes_sent: int = 0
+    started_at: float = field(default_factory=time.time)
+
+    def line(self) -> str:
+        return (f"connections={self.connections} active={self.active_sessions} rejected={self.rejected_sessions} "
+                f"silent={self.silent_connections} commands={self.commands} failed={self.failed_commands} "
+                f"hung={self.hung_commands} sent={self.bytes_sent / 1e6:.1f}MB")
+
+
+def farm_addresses(network: str, count: int) -> list:
+    # Первые count адресов сети (без адреса сети), например 127.1.0.0/16 -> 127.1.0.1, 127.1.0.2, ...
+    hosts = ipaddress.ip_network(network).hosts()
+    addresses = []
+    for address in hosts:
+        if len(addresses) >= count:
+            break
+        addresses.append(str(address))
+    if len(addresses) < count:
+        raise ValueError(f"Network {network} has only {len(addresses)} host addresses, {count} requested")
+    return addresses
+
+
+class DeviceFarm:
+    def __init__(self, addresses: list, profiles: list, seed: int = 0, port: int = 10023, host: str = "0.0.0.0"):
+        self.host = host
+        self.port = port
+        self.stats = FarmStats()
+        self._rng = random.Random(seed)
+        rng = random.Random(seed + 1)
+        self.devices = {}
+        for address, profile in assign_profiles(addresses, profiles, seed).items():
+            suffix = address.replace(".", "-")
+            self.devices[address] = VirtualDevice(
+                address=address,
+                hostname=f"{profile.name}-{suffix}",
+                serial=f"FOC{zlib.crc32(address.encode()):08X}",
+                profile=profile,
+                unreachable=rng.random() < profile.unreachable_rate,
+            )
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=4096)
+        logger.info(f"Device farm with {len(self.devices)} devices listening on {self.host}:{self.port}")
+
+    async def serve_forever(self, report_seconds: float = 10.0):
+        await self.start()
+        async with self._server:
+            while True:
+                await asyncio.sleep(report_seconds)
+                logger.info(f"Farm stats: {self.stats.line()}")
+
+    async def _sleep_ms(self, distribution):
+        await asyncio.sleep(max(0.0, distribution.sample(self._rng)) / 1000.0)
+
+    async def _send(self, writer, text: str):
+        data = text.encode()
+        writer.write(data)
+        self.stats.bytes_sent += len(data)
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats.connections += 1
+        local_address = writer.get_extra_info("sockname")[0]
+        device = self.devices.get(local_address)
+        try:
+            if device is None:
+                return
+            if device.unreachable:
+                # Недоступное устройство: соединение принято, но ответа нет, клиент выходит по таймауту
+                self.stats.silent_connections += 1
+                await reader.read()
+                return
+            if device.sessions >= device.profile.max_sessions:
+                self.stats.rejected_sessions += 1
+                await self._send(writer, "% Connection refused: too many sessions\r\n")
+                return
+
+            device.sessions += 1
+            self.stats.active_sessions += 1
+            try:
+                await self._session(device, reader, writer)
+            finally:
+                device.sessions -= 1
+                self.stats.active_sessions -= 1
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _session(self, device: VirtualDevice, reader, writer):
+        profile = device.profile
+        prompt = f"{device.hostname}#"
+        await self._sleep_ms(profile.connect_ms)
+        await self._send(writer, f"\r\n{device.hostname} virtual {profile.device_type} ({profile.name})\r\n\r\n{prompt}")
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip()
+            if not command:
+                await self._send(writer, f"\r\n{prompt}")
+                continue
+            if command in ("exit", "quit", "logout"):
+                return
+
+            self.stats.commands += 1
+            roll = self._rng.random()
+            if roll < profile.hang_rate:
+                # Зависшая команда: ничего не отвечаем до закрытия соединения клиентом
+                self.stats.hung_commands += 1
+                await reader.read()
+                return
+            await self._sleep_ms(profile.command_ms)
+            if roll < profile.hang_rate + profile.failure_rate:
+                self.stats.failed_commands += 1
+                output = f"% Error executing '{command}': resource temporarily unavailable\r\n"
+            else:
+                size = int(profile.output_bytes.sample(self._rng))
+                output = render(command, device.hostname, device.serial, size, self._rng)
+            await self._send(writer, f"{output}\r\n{prompt}")
@@ -0,0 +1,117 @@
+# devfarm/main.py
+'''
+Запуск фермы виртуальных устройств и регистрация ее устройств в API.
+
+Примеры:
+    # 2000 устройств на 127.1.0.1 ... 127.1.7.208, порт 10023, профили по умолчанию
+    python devfarm/main.py --devices 2000
+
+    # то же, плюс регистрация устройств, команд и расписаний через API
+    python devfarm/main.py --devices 2000 --register http://localhost:8000 \
+        --commands "show version,show ip interface brief" --cron "*/1 * * * *"
+
+    # свои профили поведения (см. profiles.py)
+    python devfarm/main.py --devices 5000 --profiles devfarm/profiles.example.json
+
+Executor подключается к устройствам при EXECUTOR_DEVICE_TRANSPORT=tcp и EXECUTOR_DEVICE_PORT, равном --port.
+Регистрация идемпотентна: устройство, уже зарегистрированное с тем же IP, пропускается (ответ 400).
+'''
+import argparse
+import asyncio
+import logging
+import os
+import resource
+
+from farm import DeviceFarm, farm_addresses
+from profiles import load_profiles
+
+logger = logging.getLogger("devfarm")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Virtual network device farm")
+    parser.add_argument("--devices", type=int, default=int(os.getenv("DEVFARM_DEVICES", "1000")))
+    parser.add_argument("--network", default=os.getenv("DEVFARM_NETWORK", "127.1.0.0/16"),
+                        help="Сеть адресов устройств (в Linux подходит любая часть 127.0.0.0/8)")
+    parser.add_argument("--port", type=int, default=int(os.getenv("DEVFARM_PORT", "10023")))
+    parser.add_argument("--profiles", default=os.getenv("DEVFARM_PROFILES"), help="JSON-файл профилей")
+    parser.add_argument("--seed", type=int, default=int(os.getenv("DEVFARM_SEED", "1")))
+    parser.add_argument("--register", default=os.getenv("DEVFARM_REGISTER_API"),
+                        help="URL API для регистрации устройств, например http://localhost:8000")
+    parser.add_argument("--commands", default="show version",
+                        help="Команды, создаваемые на каждом устройстве при регистрации (через запятую)")
+    parser.add_argument("--cron", default=None, help="Создать расписание с этим cron для каждой команды")
+    parser.add_argument("--priority", default="normal", choices=["high", "normal", "low"])
+    parser.add_argument("--register-concurrency", type=int, default=32)
+    parser.add_argument("--report-seconds", type=float, default=10.0)
+    return parser.parse_args()
+
+
+def raise_file_limit():
+    # Тысячи одновременных сессий требуют столько же файловых дескрипторов
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        logger.info(f"Raised open files limit from {soft} to {hard}")
+
+
+async def register(farm: DeviceFarm, args):
+    import httpx
+
+    commands = [command.strip() for command in args.commands.split(",") if command.strip()]
+    semaphore = asyncio.Semaphore(args.register_concurrency)
+    counters = {"devices": 0, "skipped": 0, "commands": 0, "schedules": 0}
+
+    async with httpx.AsyncClient(base_url=args.register, timeout=30.0) as client:
+        async def register_device(device):
+            async with semaphore:
+                response = await client.post("/devices/", json={
+                    "ip_address": device.address,
+                    "device_type": device.profile.device_type,
+                })
+                if response.status_code == 400:
+                    # Уже зарегистрировано при прошлом запуске
+                    counters["skipped"] += 1
+                    return
+                response.raise_for_status()
+                device_id = response.json()["id"]
+                counters["devices"] += 1
+                for command_string in commands:
+                    response = await client.post(f"/devices/{device_id}/commands/",
+                                                 json={"command_string": command_string})
+                    response.raise_for_status()
+                    counters["commands"] += 1
+                    if args.cron:
+                        command_id = response.json()["id"]
+                        response = await client.post(
+                            f"/devices/{device_id}/commands/{command_id}/schedules/",
+                            json={"cron_expression": args.cron, "priority": args.priority},
+                        )
+                        response.raise_for_status()
+                        counters["schedules"] += 1
+
+        await asyncio.gather(*(register_device(device) for device in farm.devices.values()))
+    logger.info(f"Registered via {args.register}: {counters}")
+
+
+async def run(args):
+    farm = DeviceFarm(farm_addresses(args.network, args.devices), load_profiles(args.profiles),
+                      seed=args.seed, port=args.port)
+    serving = asyncio.create_task(farm.serve_forever(args.report_seconds))
+    if args.register:
+        await register(farm, args)
+    await serving
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    args = parse_args()
+    raise_file_limit()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        logger.info("Device farm stopped.")
+
+
+if __name__ == "__main__":
+    main()
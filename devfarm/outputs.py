@@ -0,0 +1,61 @@
+# devfarm/outputs.py
+'''
+Генерация правдоподобного вывода CLI-команд.
+
+Для команд, которые разбирают парсеры Executor'а (show version, show ip interface brief), вывод
+повторяет формат Cisco IOS, чтобы через ферму проходил и путь разбора. Для остальных команд
+генерируется конфигурация нужного размера (размер задается распределением output_bytes профиля).
+'''
+import random
+import re
+
+_IP_INT_BRIEF = re.compile(r"sh(ow)? ip int(erface)? br(ief)?", re.IGNORECASE)
+_VERSION = re.compile(r"sh(ow)? ver(sion)?", re.IGNORECASE)
+
+
+def show_version(hostname: str, serial: str, rng: random.Random) -> str:
+    days, hours = rng.randint(0, 900), rng.randint(0, 23)
+    return (
+        "Cisco IOS Software, C2960 Software (C2960-LANBASEK9-M), Version 15.0(2)SE4, RELEASE SOFTWARE (fc1)\r\n"
+        "Technical Support: http://www.cisco.com/techsupport\r\n"
+        f"{hostname} uptime is {days} days, {hours} hours\r\n"
+        "System image file is \"flash:c2960-lanbasek9-mz.150-2.SE4.bin\"\r\n"
+        "cisco WS-C2960-24TT-L (PowerPC405) processor (revision B0) with 65536K bytes of memory.\r\n"
+        f"Processor board ID {serial}\r\n"
+    )
+
+
+def show_ip_interface_brief(interfaces: int, rng: random.Random) -> str:
+    lines = ["Interface              IP-Address      OK? Method Status                Protocol"]
+    for index in range(1, interfaces + 1):
+        down = rng.random() < 0.1
+        status = "administratively down" if down and rng.random() < 0.5 else ("down" if down else "up")
+        address = f"10.{index // 250}.{index % 250}.1" if index % 4 == 0 else "unassigned"
+        lines.append(f"GigabitEthernet0/{index:<10} {address:<15} YES manual {status:<21} {'down' if down else 'up'}")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def running_config(hostname: str, size: int, rng: random.Random) -> str:
+    parts = [f"hostname {hostname}\r\n!\r\n"]
+    length = len(parts[0])
+    index = 0
+    while length < size:
+        index += 1
+        block = (
+            f"interface GigabitEthernet0/{index}\r\n"
+            f" description uplink-{rng.randint(1000, 9999)}\r\n"
+            f" switchport access vlan {rng.randint(2, 4000)}\r\n"
+            " spanning-tree portfast\r\n!\r\n"
+        )
+        parts.append(block)
+        length += len(block)
+    return "".join(parts)[:max(size, 0)] + "\r\nend\r\n"
+
+
+def render(command: str, hostname: str, serial: str, output_bytes: int, rng: random.Random) -> str:
+    command = " ".join(command.split())
+    if _VERSION.fullmatch(command):
+        return show_version(hostname, serial, rng)
+    if _IP_INT_BRIEF.fullmatch(command):
+        return show_ip_interface_brief(max(4, min(output_bytes // 80, 512)), rng)
+    return running_config(hostname, output_bytes, rng)
@@ -0,0 +1,107 @@
+# devfarm/profiles.py
+'''
+Профили поведения виртуальных устройств.
+
+Профиль задает тип устройства (device_type в API) и распределения:
+    connect_ms    - задержка перед приглашением после подключения (авторизация);
+    command_ms    - время выполнения команды;
+    output_bytes  - размер вывода команд без встроенного шаблона (например, show running-config);
+а также доли устройств/команд с ошибками:
+    failure_rate      - команда завершается ошибкой CLI ("% Error ...");
+    hang_rate         - команда не отвечает (клиент должен выйти по таймауту);
+    unreachable_rate  - доля устройств профиля, которые принимают соединение, но молчат (недоступное устройство);
+    max_sessions      - одновременных сессий на устройство, лишние отклоняются.
+
+Распределения записываются строкой:
+    "fixed:100"             - всегда 100
+    "uniform:50:200"        - равномерно от 50 до 200
+    "lognormal:200:0.6"     - логнормальное с медианой 200 и sigma 0.6 (длинный хвост)
+
+Файл профилей (--profiles) - JSON-список объектов с полями DeviceProfile и весом weight, например:
+    [{"name": "edge", "device_type": "router", "weight": 3, "command_ms": "lognormal:300:0.8"},
+     {"name": "slow-core", "device_type": "switch", "weight": 1, "command_ms": "uniform:2000:8000",
+      "hang_rate": 0.02, "max_sessions": 1}]
+'''
+import json
+import math
+import random
+from dataclasses import dataclass, field, fields
+
+
+@dataclass(frozen=True)
+class Distribution:
+    kind: str
+    a: float
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec) -> "Distribution":
+        if isinstance(spec, (int, float)):
+            return cls("fixed", float(spec))
+        kind, *args = str(spec).split(":")
+        values = [float(arg) for arg in args]
+        if kind == "fixed" and len(values) == 1:
+            return cls(kind, values[0])
+        if kind in ("uniform", "lognormal") and len(values) == 2:
+            return cls(kind, values[0], values[1])
+        raise ValueError(f"Invalid distribution '{spec}', expected fixed:X, uniform:A:B or lognormal:MEDIAN:SIGMA")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.a
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        return rng.lognormvariate(math.log(self.a), self.b)
+
+
+@dataclass
+class DeviceProfile:
+    name: str = "default"
+    device_type: str = "router"
+    weight: float = 1.0
+    connect_ms: Distribution = field(default_factory=lambda: Distribution.parse("uniform:20:100"))
+    command_ms: Distribution = field(default_factory=lambda: Distribution.parse("lognormal:300:0.6"))
+    output_bytes: Distribution = field(default_factory=lambda: Distribution.parse("lognormal:4096:1.0"))
+    failure_rate: float = 0.02
+    hang_rate: float = 0.0
+    unreachable_rate: float = 0.0
+    max_sessions: int = 4
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DeviceProfile":
+        known = {f.name for f in fields(cls)}
+        unknown = set(data) - known
+        if unknown:
+            raise ValueError(f"Unknown profile fields: {sorted(unknown)}")
+        values = dict(data)
+        for name in ("connect_ms", "command_ms", "output_bytes"):
+            if name in values:
+                values[name] = Distribution.parse(values[name])
+        return cls(**values)
+
+
+# Набор по умолчанию: в основном быстрые устройства, немного медленных и проблемных
+DEFAULT_PROFILES = [
+    DeviceProfile(name="access-switch", device_type="switch", weight=6),
+    DeviceProfile(name="edge-router", device_type="router", weight=3,
+                  command_ms=Distribution.parse("lognormal:800:0.8"),
+                  output_bytes=Distribution.parse("lognormal:65536:1.2")),
+    DeviceProfile(name="legacy", device_type="router", weight=1,
+                  connect_ms=Distribution.parse("uniform:1000:5000"),
+                  command_ms=Distribution.parse("uniform:3000:15000"),
+                  failure_rate=0.1, hang_rate=0.02, unreachable_rate=0.05, max_sessions=1),
+]
+
+
+def load_profiles(path: str = None) -> list:
+    if not path:
+        return list(DEFAULT_PROFILES)
+    with open(path) as f:
+        return [DeviceProfile.from_dict(item) for item in json.load(f)]
+
+
+def assign_profiles(addresses, profiles, seed: int) -> dict:
+    # Детерминированное распределение профилей по адресам с учетом весов (повторный запуск - те же устройства)
+    rng = random.Random(seed)
+    weights = [profile.weight for profile in profiles]
+    return {address: rng.choices(profiles, weights=weights)[0] for address in addresses}
@@ -0,0 +1,64 @@
+# executor/idempotency.py
+'''
+Идемпотентность выполнения задач.
+
+Каждая задача несет idempotency_key - ключ запуска Workflow (run_id), одинаковый для всех копий задачи:
+повторной публикации после таймаута Activity и повторной доставки pending-сообщения (XAUTOCLAIM после падения
+реплики). Перед выполнением Executor отмечает ключ в Redis:
+    execution:{key} = running:{токен} (SET NX, TTL EXECUTOR_IDEMPOTENCY_CLAIM_SECONDS) - выполняется;
+    execution:{key} = done:{status}   (TTL EXECUTOR_IDEMPOTENCY_TTL_SECONDS)            - выполнено.
+Копия задачи с выполненным ключом подтверждается без выполнения: результат уже опубликован первой копией.
+Копия с ключом, который выполняет другая реплика, откладывается: если та реплика упала, отметка истечет
+по TTL, и копия выполнит команду. Токен - consumer и ID сообщения, поэтому задача, отложенная ограничителем
+нагрузки, при повторной попытке узнает свою отметку.
+Задачи без ключа (от старых Workflow) выполняются как раньше.
+'''
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "execution:"
+
+RUN, DONE, BUSY = "run", "done", "busy"
+
+# Удаление отметки, только если она принадлежит этой копии задачи
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class ExecutionLedger:
+    def __init__(self, r, claim_seconds: int = None, ttl_seconds: int = None):
+        self.r = r
+        self.claim_seconds = claim_seconds or int(os.getenv("EXECUTOR_IDEMPOTENCY_CLAIM_SECONDS", "300"))
+        self.ttl_seconds = ttl_seconds or int(os.getenv("EXECUTOR_IDEMPOTENCY_TTL_SECONDS", "86400"))
+
+    def begin(self, key: str, token: str) -> str:
+        # RUN - выполнять, DONE - уже выполнено, BUSY - выполняется другой копией задачи
+        name = f"{KEY_PREFIX}{key}"
+        running = f"running:{token}"
+        if self.r.set(name, running, nx=True, ex=self.claim_seconds):
+            return RUN
+        value = self.r.get(name)
+        if value == running:
+            return RUN
+        if value is not None and value.startswith("done:"):
+            return DONE
+        return BUSY
+
+    def retry_after(self, key: str) -> float:
+        # Через сколько секунд истечет отметка другой копии (не дольше 30 секунд между проверками)
+        ttl = self.r.ttl(f"{KEY_PREFIX}{key}")
+        return float(min(max(ttl, 1), 30))
+
+    def complete(self, key: str, status: str):
+        self.r.set(f"{KEY_PREFIX}{key}", f"done:{status}", ex=self.ttl_seconds)
+
+    def abandon(self, key: str, token: str):
+        # Выполнение не завершилось (ошибка до публикации результата, задача отдана другой реплике):
+        # снимаем только свою отметку, и копия задачи сможет выполнить команду
+        self.r.eval(RELEASE_SCRIPT, 1, f"{KEY_PREFIX}{key}", f"running:{token}")
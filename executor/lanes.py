@@ -0,0 +1,133 @@
+# executor/lanes.py
+'''
+Приоритетные очереди (lanes) задач.
+
+Каждый приоритет - отдельный поток Redis:
+    high   -> tasks:high  (интерактивные задачи, запуск по требованию)
+    normal -> tasks       (обычные расписания, поток по умолчанию)
+    low    -> tasks:low   (фоновый массовый сбор)
+
+Executor читает потоки по взвешенному справедливому алгоритму (smooth weighted round-robin, как в nginx):
+при весах high=8, normal=3, low=1 и заполненных очередях из 12 задач 8 берутся из high, 3 из normal и 1 из low.
+Если очередной выбранный поток пуст, берется задача из следующего по весу непустого потока,
+поэтому Executor не простаивает. Когда пусты все потоки, выполняется одно блокирующее чтение сразу по всем.
+
+При шардировании (см. partitions.py) у каждого приоритета N потоков, и читаются только потоки партиций,
+которыми владеет реплика.
+'''
+import logging
+import os
+import time
+
+import redis
+
+from partitions import partition_stream
+
+logger = logging.getLogger(__name__)
+
+LANE_STREAMS = {
+    "high": "tasks:high",
+    "normal": "tasks",
+    "low": "tasks:low",
+}
+
+DEFAULT_WEIGHTS = "high=8,normal=3,low=1"
+
+
+def parse_weights(spec: str) -> dict:
+    # "high=8,normal=3,low=1" -> {"high": 8, "normal": 3, "low": 1}
+    weights = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        lane, weight = item.split("=", 1)
+        lane = lane.strip()
+        if lane not in LANE_STREAMS:
+            raise ValueError(f"Unknown priority lane '{lane}', expected one of {list(LANE_STREAMS)}")
+        weights[lane] = int(weight)
+    return {lane: weight for lane, weight in weights.items() if weight > 0}
+
+
+class WeightedLaneReader:
+    def __init__(self, r: redis.Redis, consumer_group: str, consumer_name: str, weights: dict = None,
+                 membership=None):
+        self.r = r
+        self.consumer_group = consumer_group
+        self.consumer_name = consumer_name
+        self.weights = weights if weights is not None else parse_weights(
+            os.getenv("EXECUTOR_LANE_WEIGHTS", DEFAULT_WEIGHTS))
+        # PartitionMembership: при шардировании читаются только потоки своих партиций
+        self.membership = membership
+        self._current = {lane: 0 for lane in self.weights}
+
+    def lane_streams(self, lane: str, partitions=None) -> list:
+        stream = LANE_STREAMS[lane]
+        if self.membership is None or not self.membership.sharded:
+            return [stream]
+        if partitions is None:
+            partitions = self.membership.owned
+        return [partition_stream(stream, p, self.membership.partitions) for p in sorted(partitions)]
+
+    def streams_for(self, partitions=None) -> list:
+        return [stream for lane in self.weights for stream in self.lane_streams(lane, partitions)]
+
+    @property
+    def streams(self):
+        return self.streams_for()
+
+    def ensure_groups(self):
+        # Группы создаются сразу для всех партиций, чтобы задачи не терялись до появления владельца
+        all_partitions = range(self.membership.partitions) if self.membership is not None else None
+        for stream in self.streams_for(all_partitions):
+            try:
+                self.r.xgroup_create(stream, self.consumer_group, id='0', mkstream=True)
+                logger.info(f"Created consumer group '{self.consumer_group}' for stream '{stream}'")
+            except redis.exceptions.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+                logger.info(f"Consumer group '{self.consumer_group}' already exists for stream '{stream}'")
+
+    def _pick(self) -> str:
+        # Smooth weighted round-robin
+        total = sum(self.weights.values())
+        for lane, weight in self.weights.items():
+            self._current[lane] += weight
+        lane = max(self._current, key=self._current.get)
+        self._current[lane] -= total
+        return lane
+
+    def order(self) -> list:
+        # Сначала поток, выбранный WRR, затем остальные по убыванию веса
+        preferred = self._pick()
+        rest = sorted((lane for lane in self.weights if lane != preferred), key=self.weights.get, reverse=True)
+        return [preferred] + rest
+
+    def read(self, block_ms: int = 5000) -> list:
+        # Возвращает список (stream, message_id, message_dict); пустой список, если задач нет
+        for lane in self.order():
+            streams = self.lane_streams(lane)
+            if not streams:
+                continue
+            messages = self.r.xreadgroup(
+                self.consumer_group, self.consumer_name, {stream: '>' for stream in streams}, count=1)
+            if messages:
+                return self._flatten(messages)
+
+        streams = self.streams
+        if not streams:
+            # Реплике пока не досталось ни одной партиции
+            time.sleep(block_ms / 1000.0)
+            return []
+        messages = self.r.xreadgroup(
+            self.consumer_group, self.consumer_name, {stream: '>' for stream in streams},
+            count=1, block=block_ms,
+        )
+        return self._flatten(messages)
+
+    @staticmethod
+    def _flatten(messages) -> list:
+        return [
+            (stream, message_id, message_dict)
+            for stream, message_list in messages or []
+            for message_id, message_dict in message_list
+        ]
@@ -7,10 +7,123 @@ import json
 import time
 import uuid
 import random
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from idempotency import BUSY, DONE, ExecutionLedger
+from lanes import WeightedLaneReader
+from parsers import create_parser_pool, parse_in_pool
+from partitions import PartitionMembership, PendingReclaimer
+from profiling import TaskProfiler
+from ratelimit import DeferredTasks, DeviceRateLimiter
+from retention import start_retention_thread
+from sessions import DeviceSessionCache, session_factory_from_env
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Префикс потоков ответов одного запуска Workflow, должен совпадать с worker/workflows/completions.py
+RUN_RESULTS_PREFIX = "results:run:"
+
+
+def emulate_command(command_string, device_id):
+    # Эмуляция выполнения команды (транспорт emulated)
+    delay = random.randint(3, 7)
+    logger.info(f"Simulating execution delay of {delay} seconds...")
+    time.sleep(delay)
+
+    # Генерация результата
+    simulated_output = f"Command '{command_string}' executed successfully on device {device_id} at {time.strftime('%Y-%m-%d %H:%M:%S')}"
+    simulated_status = "success"
+
+    # С вероятностью 10% ошибка
+    if random.random() < 0.1:
+        simulated_output = f"Failed to execute command '{command_string}' on device {device_id}: Connection timeout"
+        simulated_status = "failed"
+    return simulated_output, simulated_status
+
+
+def process_task(r, sessions, parser_pool, message_dict, results_stream):
+    # Извлечение данных задачи
+    schedule_id = message_dict.get("schedule_id")
+    command_id = message_dict.get("command_id")
+    device_id = message_dict.get("device_id")
+    command_string = message_dict.get("command_string", "")
+
+    # Задача запуска по требованию (POST /commands/{command_id}/run) не связана с расписанием,
+    # API ждет ее результат в списке reply_list
+    reply_list = message_dict.get("reply_list")
+
+    if not schedule_id and not reply_list:
+        logger.warning(f"Received task without schedule_id: {message_dict}")
+        return
+
+    # Длительность выполнения (с получением сессии) передается в результате для статистики
+    started = time.monotonic()
+
+    logger.info(
+        f"Executing command '{command_string}' for device {device_id} (schedule {schedule_id})")
+    try:
+        # Сессия к устройству переиспользуется между задачами
+        session = sessions.get(device_id, message_dict.get("device_address"))
+        session.commands += 1
+        if hasattr(session, "run"):
+            # Реальная CLI-сессия: ошибка команды на устройстве - вывод, начинающийся с "% "
+            output = session.run(command_string)
+            result_status = "failed" if output.lstrip().startswith("% ") else "success"
+        else:
+            output, result_status = emulate_command(command_string, device_id)
+    except OSError as e:
+        # Устройство недоступно, не ответило вовремя или закрыло сессию: сессию больше не используем
+        sessions.discard(device_id)
+        output = f"Failed to execute command '{command_string}' on device {device_id}: {e}"
+        result_status = "failed"
+
+    logger.info(f"Command execution completed with status '{result_status}' ({len(output)} bytes)")
+
+    # Разбор вывода в структурированные данные (в пуле процессов)
+    parsed = None
+    if result_status == "success":
+        parsed = parse_in_pool(parser_pool, message_dict.get("device_type"), command_string, output)
+
+    # Отправка результата в Redis Stream 'results'
+    result_message = {
+        "schedule_id": schedule_id or "",
+        "command_id": command_id,
+        "device_id": device_id,
+        "output": output,
+        "status": result_status,
+        "parsed": json.dumps(parsed) if parsed is not None else "",
+        "duration_ms": int((time.monotonic() - started) * 1000),
+        "idempotency_key": message_dict.get("idempotency_key") or "",
+        "workflow_id": message_dict.get("workflow_id") or "",
+        "timestamp": time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+    if reply_list:
+        # API ждет результат блокирующим BLPOP; список удаляется по TTL, если ответ никто не забрал
+        pipe = r.pipeline()
+        pipe.lpush(reply_list, json.dumps(result_message))
+        pipe.expire(reply_list, int(os.getenv("EXECUTOR_REPLY_TTL_SECONDS", "300")))
+        pipe.execute()
+        logger.info(f"Result of on-demand run pushed to '{reply_list}'")
+        return result_status
+
+    # Публикация результата: в поток, указанный Worker'ом (reply_to, режим signal), или в общий 'results'
+    reply_to = message_dict.get("reply_to")
+    if reply_to and reply_to.startswith("results"):
+        results_stream = reply_to
+    if results_stream.startswith(RUN_RESULTS_PREFIX):
+        # Поток ответов одного запуска (режим poll): Worker удаляет его после чтения, а ответ,
+        # пришедший после таймаута ожидания, удаляется по TTL
+        pipe = r.pipeline()
+        pipe.xadd(results_stream, result_message)
+        pipe.expire(results_stream, int(os.getenv("EXECUTOR_REPLY_TTL_SECONDS", "300")))
+        result_msg_id = pipe.execute()[0]
+    else:
+        result_msg_id = r.xadd(results_stream, result_message)
+    logger.info(f"Result published to Redis Stream '{results_stream}' with ID: {result_msg_id}")
+    return result_status
+
 
 def main():
     # Параметры подключения к Redis
@@ -31,90 +144,143 @@ def main():
     logger.info("Executor is running and waiting for tasks from Redis Stream 'tasks'...")
 
     # Настройка Redis Streams
-    tasks_stream = "tasks"
     results_stream = "results"
     consumer_group = "executor_group"
     consumer_name = f"executor_{uuid.uuid4().hex}"
 
-    # Создание группы потребителей
+    # Членство реплики и владение партициями (при TASK_PARTITIONS > 1)
+    membership = PartitionMembership(r, consumer_name)
+    # Открытые сессии к устройствам этой реплики
+    sessions = DeviceSessionCache(session_factory=session_factory_from_env())
+
+    # Чтение приоритетных потоков задач (tasks:high, tasks, tasks:low) по весам
+    reader = WeightedLaneReader(r, consumer_group, consumer_name, membership=membership)
+
+    # Создание групп потребителей
     try:
-        r.xgroup_create(tasks_stream, consumer_group, id='0', mkstream=True)
-        logger.info(f"Created consumer group '{consumer_group}' for stream '{tasks_stream}'")
-    except redis.exceptions.ResponseError as e:
-        if "BUSYGROUP" in str(e):
-            logger.info(f"Consumer group '{consumer_group}' already exists for stream '{tasks_stream}'")
-        else:
-            logger.error(f"Failed to create consumer group: {e}")
-            return
+        reader.ensure_groups()
+        membership.start()
     except Exception as e:
-        logger.error(f"Unexpected error while creating consumer group: {e}")
+        logger.error(f"Failed to create consumer groups: {e}")
         return
 
+    # Фоновая обрезка потоков и удаление осиротевших групп/потребителей
+    retention_stop = start_retention_thread(r)
+
+    # Ограничения нагрузки на устройства (общие для всех реплик) и отложенные задачи
+    limiter = DeviceRateLimiter(r)
+    deferred = DeferredTasks()
+    max_deferred = int(os.getenv("EXECUTOR_MAX_DEFERRED", "1000"))
+    # Отметки выполненных задач: копии одной задачи не выполняются на устройстве повторно
+    ledger = ExecutionLedger(r)
+
+    # Пул потоков для параллельного выполнения задач (1 - последовательно, как раньше)
+    concurrency = max(1, int(os.getenv("EXECUTOR_CONCURRENCY", "1")))
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="executor-task")
+    in_flight = set()
+    # (поток, ID) задач, которые реплика уже выполняет или отложила (XAUTOCLAIM не берет их повторно);
+    # ID сообщений разных потоков могут совпадать
+    held = set()
+    # Зависшие pending-задачи своих потоков забираются периодически (см. partitions.py)
+    reclaimer = PendingReclaimer(membership, reader.streams_for, consumer_group)
+    # Пул процессов для разбора вывода (CPU-нагрузка не должна тормозить потоки, ждущие устройства)
+    parser_pool = create_parser_pool()
+    # Профилирование N следующих задач (EXECUTOR_PROFILE_TASKS или POST /admin/profiles/arm в API)
+    profiler = TaskProfiler(r)
+
+    def run_task(tasks_stream, message_id, message_dict, permit):
+        idempotency_key = message_dict.get("idempotency_key")
+        try:
+            label = f"{message_dict.get('command_string')} @ {message_dict.get('device_address') or message_dict.get('device_id')}"
+            with profiler.profile(label):
+                result_status = process_task(r, sessions, parser_pool, message_dict, results_stream)
+            if idempotency_key and result_status:
+                ledger.complete(idempotency_key, result_status)
+        except Exception as e:
+            logger.error(f"Error processing task {message_id}: {e}")
+            if idempotency_key:
+                ledger.abandon(idempotency_key, f"{consumer_name}:{message_id}")
+
+        finally:
+            limiter.release(permit)
+            # Подтверждение обработки сообщения (ACK)
+            r.xack(tasks_stream, consumer_group, message_id)
+            held.discard((tasks_stream, message_id))
+            logger.info(f"Task {message_id} acknowledged")
+
+    def dispatch(item):
+        tasks_stream, message_id, message_dict = item
+        held.add((tasks_stream, message_id))
+        idempotency_key = message_dict.get("idempotency_key")
+        if idempotency_key:
+            state = ledger.begin(idempotency_key, f"{consumer_name}:{message_id}")
+            if state == DONE:
+                # Копия уже выполненной задачи: результат опубликован, устройство не трогаем
+                logger.info(f"Task {message_id} skipped: execution {idempotency_key} is already completed")
+                r.xack(tasks_stream, consumer_group, message_id)
+                held.discard((tasks_stream, message_id))
+                return
+            if state == BUSY:
+                retry_after = ledger.retry_after(idempotency_key)
+                logger.info(f"Task {message_id} deferred for {retry_after:.0f}s: execution {idempotency_key} "
+                            f"is in progress elsewhere")
+                deferred.push(retry_after, item)
+                return
+        # Перед выполнением спрашиваем разрешение у ограничителя; если нельзя - откладываем, а не падаем
+        permit, retry_after = limiter.acquire(message_dict.get("device_id"), message_dict.get("device_type"))
+        if permit is None:
+            logger.info(f"Task {message_id} deferred by rate limit for {retry_after:.2f}s "
+                        f"(device {message_dict.get('device_id')})")
+            deferred.push(retry_after, item)
+            return
+        in_flight.add(pool.submit(run_task, tasks_stream, message_id, message_dict, permit))
+
+    def handle(messages):
+        for item in messages:
+            logger.info(f"Received task from Redis '{item[0]}': ID={item[1]}, Data={item[2]}")
+            dispatch(item)
+
     # Основной цикл
     try:
         while True:
-            # Чтение сообщений из потока 'tasks'
-            messages = r.xreadgroup(consumer_group, consumer_name, {tasks_stream: '>'}, count=1, block=5000)
+            # Перебалансировка: закрываем сессии к чужим устройствам, забираем зависшие задачи новых партиций
+            acquired, released = membership.take_changes()
+            if released:
+                closed = sessions.release(lambda device_id: not membership.owns_device(device_id))
+                # Отложенные задачи отданных партиций заберет новый владелец
+                dropped = deferred.drop(lambda item: not membership.owns_device(item[2].get("device_id")))
+                for tasks_stream, message_id, message_dict in dropped:
+                    held.discard((tasks_stream, message_id))
+                    # Отметка выполнения снимается, иначе новый владелец ждал бы ее истечения
+                    if message_dict.get("idempotency_key"):
+                        ledger.abandon(message_dict["idempotency_key"], f"{consumer_name}:{message_id}")
+                logger.info(f"Released partitions {sorted(released)}, closed {closed} device sessions, "
+                            f"dropped {len(dropped)} deferred tasks")
+            if acquired:
+                claimed = membership.claim_pending(reader.streams_for(acquired), consumer_group)
+                handle([item for item in claimed if item[:2] not in held])
+            handle(reclaimer.poll(held))
+            sessions.expire_idle()
 
-            if messages:
-                for stream, message_list in messages:
-                    for message_id, message_dict in message_list:
-                        logger.info(f"Received task from Redis: ID={message_id}, Data={message_dict}")
-
-                        try:
-                            # Извлечение данных задачи
-                            schedule_id = message_dict.get("schedule_id")
-                            command_id = message_dict.get("command_id")
-                            device_id = message_dict.get("device_id")
-                            command_string = message_dict.get("command_string", "")
-
-                            if not schedule_id:
-                                logger.warning(f"Received task without schedule_id: {message_dict}")
-                                r.xack(tasks_stream, consumer_group, message_id)
-                                continue
-
-                            # Эмуляция выполнения команды
-                            logger.info(
-                                f"Executing command '{command_string}' for device {device_id} (schedule {schedule_id})")
-
-                            # Симуляция задержки
-                            delay = random.randint(3, 7)
-                            logger.info(f"Simulating execution delay of {delay} seconds...")
-                            time.sleep(delay)
-
-                            # Генерация результата
-                            simulated_output = f"Command '{command_string}' executed successfully on device {device_id} at {time.strftime('%Y-%m-%d %H:%M:%S')}"
-                            simulated_status = "success"
-
-                            # С вероятностью 10% ошибка
-                            if random.random() < 0.1:
-                                simulated_output = f"Failed to execute command '{command_string}' on device {device_id}: Connection timeout"
-                                simulated_status = "failed"
-
-                            logger.info(f"Command execution completed. Output: {simulated_output}")
-
-                            # Отправка результата в Redis Stream 'results'
-                            result_message = {
-                                "schedule_id": schedule_id,
-                                "command_id": command_id,
-                                "device_id": device_id,
-                                "output": simulated_output,
-                                "status": simulated_status,
-                                "timestamp": time.strftime('%Y-%m-%d %H:%M:%S')
-                            }
-
-                            # Публикация результата
-                            result_msg_id = r.xadd(results_stream, result_message)
-                            logger.info(f"Result published to Redis Stream '{results_stream}' with ID: {result_msg_id}")
-
-                        except Exception as e:
-                            logger.error(f"Error processing task {message_id}: {e}")
-
-                        finally:
-                            # Подтверждение обработки сообщения (ACK)
-                            r.xack(tasks_stream, consumer_group, message_id)
-                            logger.info(f"Task {message_id} acknowledged")
+            in_flight.difference_update([future for future in in_flight if future.done()])
+            for item in deferred.pop_ready():
+                dispatch(item)
+
+            # Все потоки пула заняты или отложенных задач слишком много - новые задачи не забираем
+            if len(in_flight) >= concurrency:
+                wait(in_flight, timeout=1, return_when=FIRST_COMPLETED)
+                continue
+            if len(deferred) >= max_deferred:
+                time.sleep(min(1.0, deferred.next_delay() or 0.1))
+                continue
 
+            # Чтение сообщений из потоков задач; блокируемся не дольше, чем до ближайшей отложенной задачи
+            next_delay = deferred.next_delay()
+            block_ms = 5000 if next_delay is None else max(10, min(5000, int(next_delay * 1000)))
+            messages = reader.read(block_ms=block_ms)
+
+            if messages:
+                handle(messages)
             else:
                 logger.debug("No new tasks received, checking again...")
 
@@ -123,6 +289,12 @@ def main():
     except Exception as e:
         logger.error(f"Unexpected error in executor main loop: {e}")
     finally:
+        if retention_stop is not None:
+            retention_stop.set()
+        membership.leave()
+        pool.shutdown(wait=False)
+        if parser_pool is not None:
+            parser_pool.shutdown(wait=False)
         logger.info("Executor shutting down.")
 
 
@@ -0,0 +1,120 @@
+# executor/parsers.py
+'''
+Разбор вывода CLI-команд в структурированные данные.
+
+Реестр парсеров: каждый парсер регистрируется декоратором @parser с регулярным выражением для команды
+и списком типов устройств ("*" - любой тип). Для задачи выбирается первый подходящий парсер
+(сначала парсеры конкретного типа устройства, затем общие).
+
+Парсер получает текст вывода и возвращает dict (или None, если вывод не распознан). Результат хранится
+в API в колонке command_results.parsed (JSONB с GIN-индексом), поэтому запросы вида
+"все интерфейсы в состоянии down по всему парку" выполняются в БД:
+    GET /results/parsed/?contains={"interfaces": [{"status": "down"}]}
+
+Разбор выполняется в пуле процессов Executor'а (EXECUTOR_PARSER_PROCESSES), чтобы разбор больших
+выводов не занимал GIL и не тормозил потоки, которые ждут устройства.
+'''
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# (тип устройства или "*", скомпилированное выражение команды, имя, функция)
+PARSERS = []
+
+
+def parser(command_pattern: str, device_types=("*",), name: str = None):
+    def register(func):
+        for device_type in device_types:
+            PARSERS.append((device_type, re.compile(command_pattern, re.IGNORECASE), name or func.__name__, func))
+        return func
+    return register
+
+
+def find_parser(device_type: str, command_string: str):
+    command = " ".join(command_string.split())
+    for wanted_type in (device_type, "*"):
+        for parser_type, pattern, name, func in PARSERS:
+            if parser_type == wanted_type and pattern.fullmatch(command):
+                return name, func
+    return None
+
+
+def parse_output(device_type: str, command_string: str, output: str):
+    # Выполняется в дочернем процессе пула
+    found = find_parser(device_type or "", command_string or "")
+    if found is None or not output:
+        return None
+    name, func = found
+    parsed = func(output)
+    if parsed is None:
+        return None
+    return {"parser": name, **parsed}
+
+
+# Встроенные парсеры
+
+IP_OR_UNASSIGNED = re.compile(r"unassigned|\d{1,3}(\.\d{1,3}){3}", re.IGNORECASE)
+
+@parser(r"sh(ow)? ip int(erface)? br(ief)?")
+def ip_interface_brief(output: str):
+    # Cisco-подобная таблица: Interface IP-Address OK? Method Status Protocol
+    interfaces = []
+    for line in output.splitlines():
+        columns = line.split()
+        if len(columns) < 6 or columns[0].lower() == "interface":
+            continue
+        # Строки ошибок CLI ("% Invalid input ...") и прочий текст - не строки таблицы
+        if columns[2].upper() not in ("YES", "NO") or not IP_OR_UNASSIGNED.fullmatch(columns[1]):
+            continue
+        # Статус может состоять из двух слов: "administratively down"
+        protocol = columns[-1]
+        status = " ".join(columns[4:-1])
+        interfaces.append({
+            "name": columns[0],
+            "ip_address": None if columns[1].lower() == "unassigned" else columns[1],
+            "status": "admin-down" if status == "administratively down" else status,
+            "protocol": protocol,
+        })
+    return {"interfaces": interfaces} if interfaces else None
+
+
+@parser(r"sh(ow)? ver(sion)?")
+def show_version(output: str):
+    result = {}
+    version = re.search(r"Version\s+([\w.()\-]+)", output)
+    if version:
+        result["version"] = version.group(1).rstrip(",")
+    serial = re.search(r"(?:Processor board ID|System serial number\s*:)\s*(\S+)", output, re.IGNORECASE)
+    if serial:
+        result["serial"] = serial.group(1)
+    uptime = re.search(r"uptime is (.+)", output)
+    if uptime:
+        result["uptime"] = uptime.group(1).strip()
+    model = re.search(r"^[Cc]isco (\S+) .*processor", output, re.MULTILINE)
+    if model:
+        result["model"] = model.group(1)
+    return result or None
+
+
+def create_parser_pool():
+    processes = int(os.getenv("EXECUTOR_PARSER_PROCESSES", "2"))
+    if processes <= 0:
+        return None
+    return ProcessPoolExecutor(max_workers=processes)
+
+
+def parse_in_pool(pool, device_type: str, command_string: str, output: str):
+    # Ошибка разбора не должна ломать выполнение задачи: сырой вывод сохраняется в любом случае
+    if find_parser(device_type or "", command_string or "") is None:
+        return None
+    try:
+        if pool is None:
+            return parse_output(device_type, command_string, output)
+        timeout = float(os.getenv("EXECUTOR_PARSER_TIMEOUT_SECONDS", "30"))
+        return pool.submit(parse_output, device_type, command_string, output).result(timeout=timeout)
+    except Exception as e:
+        logger.warning(f"Failed to parse output of '{command_string}' ({device_type}): {e}")
+        return None
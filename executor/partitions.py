@@ -0,0 +1,170 @@
+# executor/partitions.py
+'''
+Шардирование потоков задач по устройствам.
+
+При TASK_PARTITIONS=N > 1 задачи каждого приоритета раскладываются по N потокам
+по хешу device_id (crc32(device_id) % N):
+    tasks:p0 ... tasks:p{N-1}, tasks:high:p0 ..., tasks:low:p0 ...
+Разные ключи распределяются по ядрам/узлам Redis (в т.ч. по слотам Redis Cluster), а не упираются в один горячий ключ.
+
+Каждая реплика Executor'а:
+    - раз в EXECUTOR_HEARTBEAT_SECONDS отмечается в ZSET executor:members (score - время heartbeat);
+    - считает живыми участников с heartbeat не старше EXECUTOR_MEMBER_TTL_SECONDS;
+    - владеет партициями, для которых она победитель rendezvous-хеширования среди живых участников.
+При входе или выходе реплики меняется владелец только у части партиций. Новый владелец забирает
+(XAUTOCLAIM) зависшие pending-задачи ушедшей реплики. Все задачи одного устройства обрабатывает одна реплика
+по порядку, и она держит открытыми сессии к своим устройствам.
+
+При TASK_PARTITIONS=1 (по умолчанию) шардирования нет: все реплики читают общие потоки.
+
+Кроме забора при получении партиции, реплика периодически (PendingReclaimer) забирает задачи своих потоков,
+которые простаивают в pending дольше EXECUTOR_CLAIM_IDLE_SECONDS: без шардирования это задачи упавших реплик,
+при шардировании - задачи, слишком свежие для забора при перебалансировке, и отложенные задачи, которые
+прежний владелец отпустил уже после этого забора.
+'''
+import logging
+import os
+import threading
+import time
+import zlib
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+MEMBERS_KEY = "executor:members"
+
+
+def task_partitions() -> int:
+    return max(1, int(os.getenv("TASK_PARTITIONS", "1")))
+
+
+def partition_for(device_id, partitions: int) -> int:
+    # Стабильный хеш (одинаковый в Worker'е и Executor'е, не зависит от PYTHONHASHSEED)
+    return zlib.crc32(str(device_id).encode()) % partitions
+
+
+def partition_stream(lane_stream: str, partition: int, partitions: int) -> str:
+    if partitions <= 1:
+        return lane_stream
+    return f"{lane_stream}:p{partition}"
+
+
+def _rendezvous_score(member: str, partition: int) -> int:
+    return zlib.crc32(f"{member}:{partition}".encode())
+
+
+class PartitionMembership:
+    def __init__(self, r: redis.Redis, member: str, partitions: int = None,
+                 heartbeat_seconds: int = None, ttl_seconds: int = None):
+        self.r = r
+        self.member = member
+        self.partitions = partitions if partitions is not None else task_partitions()
+        self.heartbeat_seconds = heartbeat_seconds or int(os.getenv("EXECUTOR_HEARTBEAT_SECONDS", "5"))
+        self.ttl_seconds = ttl_seconds or int(os.getenv("EXECUTOR_MEMBER_TTL_SECONDS", "15"))
+        self._lock = threading.Lock()
+        self._owned = set(range(self.partitions)) if self.partitions <= 1 else set()
+        self._acquired = set()
+        self._released = set()
+        self._stop_event = threading.Event()
+
+    @property
+    def sharded(self) -> bool:
+        return self.partitions > 1
+
+    @property
+    def owned(self) -> set:
+        with self._lock:
+            return set(self._owned)
+
+    def owns_device(self, device_id) -> bool:
+        return partition_for(device_id, self.partitions) in self.owned
+
+    def take_changes(self):
+        # Партиции, полученные и отданные с прошлого вызова (для XAUTOCLAIM и закрытия сессий)
+        with self._lock:
+            acquired, released = self._acquired, self._released
+            self._acquired, self._released = set(), set()
+        return acquired, released
+
+    def live_members(self) -> list:
+        now = time.time()
+        self.r.zremrangebyscore(MEMBERS_KEY, "-inf", now - self.ttl_seconds)
+        return self.r.zrangebyscore(MEMBERS_KEY, now - self.ttl_seconds, "+inf")
+
+    def heartbeat(self):
+        self.r.zadd(MEMBERS_KEY, {self.member: time.time()})
+        members = self.live_members()
+        if self.member not in members:
+            members.append(self.member)
+        owned = {
+            p for p in range(self.partitions)
+            if max(members, key=lambda m: (_rendezvous_score(m, p), m)) == self.member
+        }
+        with self._lock:
+            if owned != self._owned:
+                acquired, released = owned - self._owned, self._owned - owned
+                self._acquired |= acquired
+                self._released |= released
+                self._acquired -= released
+                logger.info(f"Partition rebalance: members={len(members)}, owned={sorted(owned)}, "
+                            f"acquired={sorted(acquired)}, released={sorted(released)}")
+                self._owned = owned
+
+    def leave(self):
+        self._stop_event.set()
+        try:
+            self.r.zrem(MEMBERS_KEY, self.member)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Failed to leave executor membership: {e}")
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.error(f"Executor heartbeat failed: {e}")
+            self._stop_event.wait(self.heartbeat_seconds)
+
+    def start(self):
+        # Без шардирования членство не нужно: все реплики читают общие потоки
+        if not self.sharded:
+            return
+        self.heartbeat()
+        threading.Thread(target=self._run, name="executor-membership", daemon=True).start()
+
+    def claim_pending(self, streams, consumer_group: str, min_idle_ms: int = None) -> list:
+        # Забрать зависшие pending-задачи (ушедшей реплики) из потоков полученных партиций
+        claimed = []
+        min_idle_ms = min_idle_ms or self.ttl_seconds * 1000
+        for stream in streams:
+            start_id = "0-0"
+            while True:
+                response = self.r.xautoclaim(stream, consumer_group, self.member, min_idle_ms, start_id, count=100)
+                start_id, messages = response[0], response[1]
+                claimed.extend((stream, message_id, fields) for message_id, fields in messages if fields)
+                if start_id == "0-0":
+                    break
+        if claimed:
+            logger.info(f"Claimed {len(claimed)} pending tasks idle for at least {min_idle_ms} ms")
+        return claimed
+
+
+class PendingReclaimer:
+    # Периодический XAUTOCLAIM зависших задач в потоках своих партиций. Порог должен быть больше времени
+    # выполнения и откладывания задачи, иначе задача живой реплики уйдет к другой
+    def __init__(self, membership: PartitionMembership, streams_for, consumer_group: str, idle_seconds: int = None):
+        self.membership = membership
+        self.streams_for = streams_for
+        self.consumer_group = consumer_group
+        self.idle_ms = 1000 * (idle_seconds or int(os.getenv("EXECUTOR_CLAIM_IDLE_SECONDS", "300")))
+        self.next_claim = time.monotonic() + self.idle_ms / 1000.0 / 2
+
+    def poll(self, held) -> list:
+        # Забранные задачи, кроме тех, что реплика уже выполняет или отложила (held - пары (поток, ID))
+        if time.monotonic() < self.next_claim:
+            return []
+        self.next_claim = time.monotonic() + self.idle_ms / 1000.0 / 2
+        claimed = self.membership.claim_pending(
+            self.streams_for(self.membership.owned), self.consumer_group, self.idle_ms)
+        return [item for item in claimed if item[:2] not in held]
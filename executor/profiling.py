@@ -0,0 +1,114 @@
+# executor/profiling.py
+'''
+Профилирование выполнения задач по запросу (см. также routers/app/profiling.py).
+
+Профилируются N следующих задач этой реплики:
+    EXECUTOR_PROFILE_TASKS              - сколько задач профилировать после старта (по умолчанию 0);
+    profiling:arm:executor в Redis      - общий для всех реплик счетчик, задается POST /admin/profiles/arm.
+Каждая задача, взятая на профилирование, уменьшает счетчик на единицу. Профиль (сэмплирующий pyinstrument,
+формат speedscope) сохраняется в Redis и читается через GET /admin/profiles/{id}.
+Без pyinstrument профилирование выключено, задачи выполняются как обычно.
+'''
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Ключи должны совпадать с routers/app/profiling.py
+ARM_KEY = "profiling:arm:executor"
+INDEX_KEY = "profiles:index"
+PROFILE_KEY_PREFIX = "profile:"
+
+# Уменьшение счетчика, только если он положительный
+TAKE_SCRIPT = """
+local left = tonumber(redis.call('GET', KEYS[1]) or '0')
+if left > 0 then
+    redis.call('DECR', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+
+class TaskProfiler:
+    def __init__(self, r, service: str = "executor"):
+        self.r = r
+        self.service = service
+        self.local_left = int(os.getenv("EXECUTOR_PROFILE_TASKS", "0"))
+        self.interval = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.001"))
+        self.ttl_seconds = int(os.getenv("PROFILE_TTL_SECONDS", "86400"))
+        self.max_stored = int(os.getenv("PROFILE_MAX_STORED", "200"))
+        # Счетчик в Redis проверяется не чаще раза в секунду, пока он пуст
+        self._idle_until = 0.0
+        self._lock = threading.Lock()
+        self._available = None
+
+    def _profiler_available(self) -> bool:
+        if self._available is None:
+            try:
+                import pyinstrument  # noqa: F401
+                self._available = True
+            except ImportError:
+                logger.warning("Task profiling requested, but pyinstrument is not installed")
+                self._available = False
+        return self._available
+
+    def _take(self) -> bool:
+        # Брать ли следующую задачу на профилирование
+        with self._lock:
+            if self.local_left > 0:
+                self.local_left -= 1
+                return self._profiler_available()
+            if time.monotonic() < self._idle_until:
+                return False
+        try:
+            taken = bool(self.r.eval(TAKE_SCRIPT, 1, ARM_KEY))
+        except Exception as e:
+            logger.warning(f"Failed to check profiling counter: {e}")
+            taken = False
+        if not taken:
+            with self._lock:
+                self._idle_until = time.monotonic() + 1.0
+            return False
+        return self._profiler_available()
+
+    @contextmanager
+    def profile(self, label: str):
+        if not self._take():
+            yield
+            return
+        from pyinstrument import Profiler
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        # Задача выполняется в своем потоке пула: профилируется только он
+        profiler = Profiler(interval=self.interval, async_mode="disabled")
+        started = time.monotonic()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            duration_ms = int((time.monotonic() - started) * 1000)
+            try:
+                profile_id = self._save(label, duration_ms, profiler.output(renderer=SpeedscopeRenderer()))
+                logger.info(f"Saved profile {profile_id} of '{label}' ({duration_ms} ms)")
+            except Exception as e:
+                logger.warning(f"Failed to save profile of '{label}': {e}")
+
+    def _save(self, label: str, duration_ms: int, data: str) -> str:
+        profile_id = uuid.uuid4().hex
+        meta = {"id": profile_id, "service": self.service, "label": label, "duration_ms": duration_ms,
+                "created_at": time.time(), "format": "speedscope"}
+        key = f"{PROFILE_KEY_PREFIX}{profile_id}"
+        pipe = self.r.pipeline()
+        pipe.hset(key, mapping={"meta": json.dumps(meta), "data": data})
+        pipe.expire(key, self.ttl_seconds)
+        pipe.zadd(INDEX_KEY, {profile_id: meta["created_at"]})
+        pipe.zremrangebyrank(INDEX_KEY, 0, -self.max_stored - 1)
+        pipe.execute()
+        return profile_id
@@ -0,0 +1,213 @@
+# executor/ratelimit.py
+'''
+Распределенное ограничение нагрузки на устройства (общее для всех реплик Executor'а, хранится в Redis).
+
+Два вида ограничений, каждый по двум ключам - по устройству (device_id) и по типу устройства (device_type):
+    - concurrency - максимум одновременно выполняемых задач (семафор: ZSET с арендами, score = время истечения
+      аренды). Это не число сессий: реплика держит одну сессию на устройство (sessions.DeviceSessionCache)
+      и выполняет в ней команды по очереди, а лимит считает задачи всех реплик вместе, включая ожидающие
+      своей очереди в сессии;
+    - rate/burst  - скорость команд в секунду (token bucket: HASH с количеством токенов и временем пополнения).
+
+Все четыре проверки выполняются одним Lua-скриптом атомарно: либо разрешение получено по всем ключам
+и токены/аренды списаны, либо не списано ничего и возвращается время, через которое стоит попробовать снова.
+Executor в этом случае не выполняет задачу с ошибкой, а откладывает ее (см. DeferredTasks).
+
+Настройка (по умолчанию ограничений нет, как до появления ограничителя):
+    RATE_LIMIT_DEVICE_CONCURRENCY=0    одновременных задач на устройство (0 - без ограничения)
+    RATE_LIMIT_DEVICE_RATE=0           команд в секунду на устройство (0 - без ограничения)
+    RATE_LIMIT_DEVICE_BURST            размер корзины токенов на устройство (по умолчанию - rate, не меньше 1)
+    RATE_LIMIT_DEVICE_TYPES='{"router": {"concurrency": 50, "rate": 20, "burst": 40}, "*": {"concurrency": 200}}'
+                                       ограничения по типу устройства, "*" - для остальных типов
+    RATE_LIMIT_LEASE_SECONDS=300       аренда места задачи (освобождается явно, истекает при падении реплики)
+'''
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "ratelimit:"
+
+# KEYS: пары (семафор, корзина) для каждого ограничения
+# ARGV: now_ms, lease_ms, token, затем для каждого ограничения: concurrency, rate, burst
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local lease = tonumber(ARGV[2])
+local token = ARGV[3]
+local n = #KEYS / 2
+local wait = 0
+
+for i = 1, n do
+    local sem, bucket = KEYS[2 * i - 1], KEYS[2 * i]
+    local concurrency = tonumber(ARGV[3 + 3 * i - 2])
+    local rate = tonumber(ARGV[3 + 3 * i - 1])
+    local burst = tonumber(ARGV[3 + 3 * i])
+
+    if concurrency > 0 then
+        redis.call('ZREMRANGEBYSCORE', sem, '-inf', now)
+        if redis.call('ZCARD', sem) >= concurrency then
+            local first = redis.call('ZRANGE', sem, 0, 0, 'WITHSCORES')
+            wait = math.max(wait, math.min(tonumber(first[2]) - now, 1000))
+        end
+    end
+    if rate > 0 then
+        local state = redis.call('HMGET', bucket, 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or burst
+        local ts = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+        if tokens < 1 then
+            wait = math.max(wait, math.ceil((1 - tokens) * 1000 / rate))
+        end
+    end
+end
+
+if wait > 0 then
+    return wait
+end
+
+for i = 1, n do
+    local sem, bucket = KEYS[2 * i - 1], KEYS[2 * i]
+    local concurrency = tonumber(ARGV[3 + 3 * i - 2])
+    local rate = tonumber(ARGV[3 + 3 * i - 1])
+    local burst = tonumber(ARGV[3 + 3 * i])
+
+    if concurrency > 0 then
+        redis.call('ZADD', sem, now + lease, token)
+        redis.call('PEXPIRE', sem, lease)
+    end
+    if rate > 0 then
+        local state = redis.call('HMGET', bucket, 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or burst
+        local ts = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + (now - ts) * rate / 1000) - 1
+        redis.call('HSET', bucket, 'tokens', tokens, 'ts', now)
+        redis.call('PEXPIRE', bucket, math.ceil(burst * 1000 / rate) + 1000)
+    end
+end
+return 0
+"""
+
+
+@dataclass
+class Limit:
+    concurrency: int = 0
+    rate: float = 0.0
+    burst: int = 1
+
+    @property
+    def enabled(self) -> bool:
+        return self.concurrency > 0 or self.rate > 0
+
+
+@dataclass
+class Permit:
+    token: str
+    semaphores: list = field(default_factory=list)
+
+
+def _limit_from_dict(data: dict) -> Limit:
+    rate = float(data.get("rate", 0))
+    return Limit(
+        concurrency=int(data.get("concurrency", 0)),
+        rate=rate,
+        burst=int(data.get("burst", max(1, int(rate)))),
+    )
+
+
+class DeviceRateLimiter:
+    def __init__(self, r, device_limit: Limit = None, type_limits: dict = None, lease_seconds: int = None):
+        self.r = r
+        if device_limit is None:
+            rate = float(os.getenv("RATE_LIMIT_DEVICE_RATE", "0"))
+            device_limit = Limit(
+                concurrency=int(os.getenv("RATE_LIMIT_DEVICE_CONCURRENCY", "0")),
+                rate=rate,
+                burst=int(os.getenv("RATE_LIMIT_DEVICE_BURST", str(max(1, int(rate))))),
+            )
+        self.device_limit = device_limit
+        if type_limits is None:
+            raw = json.loads(os.getenv("RATE_LIMIT_DEVICE_TYPES", "{}"))
+            type_limits = {device_type: _limit_from_dict(data) for device_type, data in raw.items()}
+        self.type_limits = type_limits
+        self.lease_ms = 1000 * (lease_seconds or int(os.getenv("RATE_LIMIT_LEASE_SECONDS", "300")))
+        self._script = r.register_script(ACQUIRE_SCRIPT)
+
+    def _limits_for(self, device_id: str, device_type: Optional[str]):
+        limits = []
+        if device_id and self.device_limit.enabled:
+            limits.append((f"device:{device_id}", self.device_limit))
+        type_limit = self.type_limits.get(device_type) if device_type else None
+        if type_limit is None:
+            type_limit = self.type_limits.get("*")
+        if type_limit is not None and type_limit.enabled:
+            limits.append((f"type:{device_type or 'unknown'}", type_limit))
+        return limits
+
+    def acquire(self, device_id: str, device_type: Optional[str]):
+        # Возвращает (Permit, 0) при успехе или (None, секунды до следующей попытки)
+        limits = self._limits_for(device_id, device_type)
+        token = uuid.uuid4().hex
+        if not limits:
+            return Permit(token), 0.0
+
+        keys, args = [], [int(time.time() * 1000), self.lease_ms, token]
+        for scope, limit in limits:
+            keys += [f"{KEY_PREFIX}sem:{scope}", f"{KEY_PREFIX}bucket:{scope}"]
+            args += [limit.concurrency, limit.rate, limit.burst]
+
+        wait_ms = int(self._script(keys=keys, args=args))
+        if wait_ms > 0:
+            return None, wait_ms / 1000.0
+        semaphores = [f"{KEY_PREFIX}sem:{scope}" for scope, limit in limits if limit.concurrency > 0]
+        return Permit(token, semaphores), 0.0
+
+    def release(self, permit: Optional[Permit]):
+        if permit is None:
+            return
+        for key in permit.semaphores:
+            try:
+                self.r.zrem(key, permit.token)
+            except Exception as e:
+                # Аренда истечет сама через RATE_LIMIT_LEASE_SECONDS
+                logger.warning(f"Failed to release rate limit lease {key}: {e}")
+
+
+class DeferredTasks:
+    # Отложенные задачи реплики: остаются неподтвержденными (pending) в Redis до выполнения
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, delay_seconds: float, item):
+        heapq.heappush(self._heap, (time.monotonic() + delay_seconds, next(self._counter), item))
+
+    def pop_ready(self) -> list:
+        ready = []
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= now:
+            ready.append(heapq.heappop(self._heap)[2])
+        return ready
+
+    def next_delay(self) -> Optional[float]:
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def drop(self, predicate) -> list:
+        # Убрать задачи (например, партиций, перешедших к другой реплике): их заберет новый владелец
+        kept, dropped = [], []
+        for entry in self._heap:
+            (dropped if predicate(entry[2]) else kept).append(entry)
+        self._heap = kept
+        heapq.heapify(self._heap)
+        return [entry[2] for entry in dropped]
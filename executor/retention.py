@@ -0,0 +1,223 @@
+# executor/retention.py
+'''
+Подсистема хранения (retention) для Redis Streams.
+
+Без нее память Redis растет бесконечно:
+    - записи потока 'tasks' подтверждаются (XACK), но не удаляются;
+    - результаты в потоке 'results', которые никто не забрал (например, Workflow упал по таймауту), остаются навсегда;
+    - группы потребителей worker_group_{schedule_id} остаются после завершения Activity;
+    - потребители executor_{uuid} остаются после перезапуска реплик Executor'а.
+
+Что делает один проход (run_once):
+    1. Обрезает потоки задач по MINID до самой старой записи, которую еще не подтвердили все группы
+       (безопасная обрезка), и дополнительно по MAXLEN как жесткий предел.
+    2. Обрезает потоки результатов по возрасту (MINID = сейчас - max_age) и по MAXLEN.
+    3. Удаляет осиротевшие группы worker_group_* (все потребители давно неактивны или их нет).
+    4. Удаляет неактивных потребителей без незавершенных (pending) сообщений.
+    5. Собирает отчет о памяти: used_memory, размер и длина каждого потока, число групп.
+
+Проходы выполняются в фоновом потоке Executor'а. Если реплик несколько, проход в каждом интервале
+выполняет только одна из них (блокировка через SET NX).
+
+Ручной запуск одного прохода с выводом отчета:
+    python retention.py
+'''
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "retention:lock"
+REPORT_KEY = "retention:report"
+
+
+@dataclass
+class StreamPolicy:
+    # Политика хранения для потоков, имя которых начинается с prefix
+    prefix: str
+    maxlen: Optional[int] = None  # жесткий предел длины (MAXLEN ~)
+    max_age_seconds: Optional[int] = None  # удалять записи старше (MINID ~ по времени)
+    trim_acked: bool = False  # удалять записи, подтвержденные всеми группами (MINID ~ по группам)
+    reap_group_prefix: Optional[str] = None  # группы с этим префиксом удаляются, если осиротели
+
+
+def policies_from_env():
+    return [
+        StreamPolicy(
+            prefix="tasks",
+            maxlen=int(os.getenv("RETENTION_TASKS_MAXLEN", "100000")),
+            trim_acked=True,
+        ),
+        StreamPolicy(
+            prefix="results",
+            maxlen=int(os.getenv("RETENTION_RESULTS_MAXLEN", "100000")),
+            max_age_seconds=int(os.getenv("RETENTION_RESULTS_MAX_AGE_SECONDS", "3600")),
+            reap_group_prefix="worker_group_",
+        ),
+    ]
+
+
+def _next_id(stream_id: str) -> str:
+    # Следующий возможный ID потока после stream_id ("ms-seq")
+    ms, seq = stream_id.split("-")
+    return f"{ms}-{int(seq) + 1}"
+
+
+def _id_key(stream_id: str):
+    ms, seq = stream_id.split("-")
+    return int(ms), int(seq)
+
+
+class StreamRetention:
+    def __init__(self, r: redis.Redis, policies=None, group_idle_seconds: int = None, consumer_idle_seconds: int = None):
+        self.r = r
+        self.policies = policies if policies is not None else policies_from_env()
+        self.group_idle_ms = 1000 * (group_idle_seconds if group_idle_seconds is not None
+                                     else int(os.getenv("RETENTION_GROUP_IDLE_SECONDS", "900")))
+        self.consumer_idle_ms = 1000 * (consumer_idle_seconds if consumer_idle_seconds is not None
+                                        else int(os.getenv("RETENTION_CONSUMER_IDLE_SECONDS", "3600")))
+        # Группы без потребителей удаляются только если были такими и на прошлом проходе:
+        # между XGROUP CREATE и первым XREADGROUP группа тоже не имеет потребителей
+        self._empty_groups_seen = set()
+
+    def streams_for(self, policy: StreamPolicy):
+        return sorted(self.r.scan_iter(match=f"{policy.prefix}*", _type="stream"))
+
+    def acked_min_id(self, stream: str) -> Optional[str]:
+        # Самый старый ID, который еще нужен хотя бы одной группе. Все, что старше, можно удалить.
+        groups = self.r.xinfo_groups(stream)
+        if not groups:
+            return None
+        candidates = []
+        for group in groups:
+            if group["pending"]:
+                summary = self.r.xpending(stream, group["name"])
+                candidates.append(summary["min"])
+            else:
+                candidates.append(_next_id(group["last-delivered-id"]))
+        return min(candidates, key=_id_key)
+
+    def trim_stream(self, stream: str, policy: StreamPolicy) -> int:
+        trimmed = 0
+        if policy.trim_acked:
+            min_id = self.acked_min_id(stream)
+            if min_id is not None:
+                trimmed += self.r.xtrim(stream, minid=min_id, approximate=True)
+        if policy.max_age_seconds:
+            min_id = f"{int((time.time() - policy.max_age_seconds) * 1000)}-0"
+            trimmed += self.r.xtrim(stream, minid=min_id, approximate=True)
+        if policy.maxlen:
+            trimmed += self.r.xtrim(stream, maxlen=policy.maxlen, approximate=True)
+        return trimmed
+
+    def reap_groups(self, stream: str, prefix: str) -> int:
+        reaped = 0
+        for group in self.r.xinfo_groups(stream):
+            name = group["name"]
+            if not name.startswith(prefix):
+                continue
+            key = (stream, name)
+            if group["consumers"] == 0:
+                if key in self._empty_groups_seen:
+                    self.r.xgroup_destroy(stream, name)
+                    self._empty_groups_seen.discard(key)
+                    reaped += 1
+                else:
+                    self._empty_groups_seen.add(key)
+                continue
+            self._empty_groups_seen.discard(key)
+            consumers = self.r.xinfo_consumers(stream, name)
+            if consumers and min(c["idle"] for c in consumers) > self.group_idle_ms:
+                self.r.xgroup_destroy(stream, name)
+                reaped += 1
+        return reaped
+
+    def reap_consumers(self, stream: str) -> int:
+        # Удаляем только потребителей без pending-сообщений: чужие pending забираются через XAUTOCLAIM
+        reaped = 0
+        for group in self.r.xinfo_groups(stream):
+            for consumer in self.r.xinfo_consumers(stream, group["name"]):
+                if consumer["pending"] == 0 and consumer["idle"] > self.consumer_idle_ms:
+                    self.r.xgroup_delconsumer(stream, group["name"], consumer["name"])
+                    reaped += 1
+        return reaped
+
+    def memory_report(self) -> dict:
+        info = self.r.info("memory")
+        streams = {}
+        for policy in self.policies:
+            for stream in self.streams_for(policy):
+                streams[stream] = {
+                    "length": self.r.xlen(stream),
+                    "memory_bytes": self.r.memory_usage(stream),
+                    "groups": len(self.r.xinfo_groups(stream)),
+                }
+        return {
+            "used_memory": info.get("used_memory"),
+            "used_memory_peak": info.get("used_memory_peak"),
+            "streams": streams,
+        }
+
+    def run_once(self) -> dict:
+        summary = {"trimmed": 0, "groups_reaped": 0, "consumers_reaped": 0}
+        for policy in self.policies:
+            for stream in self.streams_for(policy):
+                try:
+                    if policy.reap_group_prefix:
+                        summary["groups_reaped"] += self.reap_groups(stream, policy.reap_group_prefix)
+                    summary["consumers_reaped"] += self.reap_consumers(stream)
+                    summary["trimmed"] += self.trim_stream(stream, policy)
+                except redis.exceptions.ResponseError as e:
+                    # Поток мог быть удален или пересоздан между SCAN и командами
+                    logger.warning(f"Retention pass failed for stream '{stream}': {e}")
+        summary["memory"] = self.memory_report()
+        summary["timestamp"] = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.r.set(REPORT_KEY, json.dumps(summary))
+        return summary
+
+
+def run_retention_loop(r: redis.Redis, stop_event: threading.Event, interval_seconds: int = None):
+    interval = interval_seconds or int(os.getenv("RETENTION_INTERVAL_SECONDS", "60"))
+    retention = StreamRetention(r)
+    logger.info(f"Stream retention started, interval {interval}s")
+
+    while not stop_event.is_set():
+        try:
+            # Один проход за интервал на все реплики Executor'а
+            if r.set(LOCK_KEY, os.getpid(), nx=True, ex=max(1, interval - 1)):
+                summary = retention.run_once()
+                memory = summary["memory"]
+                logger.info(
+                    f"Retention pass: trimmed={summary['trimmed']}, groups_reaped={summary['groups_reaped']}, "
+                    f"consumers_reaped={summary['consumers_reaped']}, used_memory={memory['used_memory']}, "
+                    f"streams={ {k: v['length'] for k, v in memory['streams'].items()} }"
+                )
+        except Exception as e:
+            logger.error(f"Retention pass failed: {e}")
+        stop_event.wait(interval)
+
+
+def start_retention_thread(r: redis.Redis) -> Optional[threading.Event]:
+    # Запуск фонового потока retention, если он не отключен через RETENTION_ENABLED=false
+    if os.getenv("RETENTION_ENABLED", "true").lower() != "true":
+        logger.info("Stream retention is disabled")
+        return None
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_retention_loop, args=(r, stop_event), name="stream-retention", daemon=True)
+    thread.start()
+    return stop_event
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    REDIS_HOST = os.getenv("REDIS_HOST", "scheduled_commands_redis")
+    REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+    client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
+    print(json.dumps(StreamRetention(client).run_once(), indent=2))
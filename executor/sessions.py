@@ -0,0 +1,162 @@
+# executor/sessions.py
+'''
+Кэш сессий к устройствам.
+
+Открытие CLI-сессии к устройству (TCP/SSH, авторизация) - самая дорогая часть короткой команды.
+Executor держит открытыми сессии к устройствам, задачи которых он обрабатывает (при шардировании -
+к устройствам своих партиций), и закрывает их:
+    - при простое дольше EXECUTOR_SESSION_IDLE_SECONDS;
+    - при превышении EXECUTOR_MAX_SESSIONS (вытесняется самая давно использованная);
+    - когда партиция устройства переходит к другой реплике.
+
+Транспорт выбирается переменной EXECUTOR_DEVICE_TRANSPORT:
+    emulated - сессия эмулируется: открытие стоит EXECUTOR_EMULATED_CONNECT_SECONDS секунд (по умолчанию);
+    tcp      - CLI-сессия по TCP к адресу устройства и порту EXECUTOR_DEVICE_PORT (например, к ферме
+               виртуальных устройств devfarm/), с таймаутами EXECUTOR_CONNECT_TIMEOUT_SECONDS и
+               EXECUTOR_COMMAND_TIMEOUT_SECONDS.
+'''
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class EmulatedSession:
+    def __init__(self, device_id: str, address: str = None):
+        self.device_id = device_id
+        self.opened_at = time.time()
+        self.last_used = self.opened_at
+        self.commands = 0
+        connect_delay = float(os.getenv("EXECUTOR_EMULATED_CONNECT_SECONDS", "0.5"))
+        if connect_delay > 0:
+            time.sleep(connect_delay)
+
+    def close(self):
+        pass
+
+
+class TcpCliSession:
+    # CLI-сессия по TCP: после подключения устройство присылает баннер и приглашение ("hostname#"),
+    # каждая команда - строка, ответ - вывод до следующего приглашения
+    def __init__(self, device_id: str, address: str = None):
+        if not address:
+            raise ConnectionError(f"Device {device_id} has no address")
+        self.device_id = device_id
+        self.opened_at = time.time()
+        self.last_used = self.opened_at
+        self.commands = 0
+        # Сессия одна на устройство в реплике, команды в ней выполняются по очереди
+        self.lock = threading.Lock()
+        self.command_timeout = float(os.getenv("EXECUTOR_COMMAND_TIMEOUT_SECONDS", "60"))
+        port = int(os.getenv("EXECUTOR_DEVICE_PORT", "10023"))
+        self._sock = socket.create_connection(
+            (address, port), timeout=float(os.getenv("EXECUTOR_CONNECT_TIMEOUT_SECONDS", "10")))
+        try:
+            banner = self._read_until(b"#", self._sock.gettimeout())
+        except Exception:
+            self._sock.close()
+            raise
+        # Приглашение - последняя строка баннера
+        self.prompt = b"\n" + banner.rsplit(b"\n", 1)[-1]
+
+    def _read_until(self, suffix: bytes, timeout: float) -> bytes:
+        deadline = time.monotonic() + timeout
+        chunks, tail = [], b""
+        while not tail.endswith(suffix):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Device {self.device_id} did not respond in {timeout:.0f}s")
+            self._sock.settimeout(remaining)
+            chunk = self._sock.recv(65536)
+            if not chunk:
+                raise ConnectionError(f"Device {self.device_id} closed the session: {b''.join(chunks)[-200:]!r}")
+            chunks.append(chunk)
+            tail = (tail + chunk)[-len(suffix) - 256:]
+        return b"".join(chunks)
+
+    def run(self, command: str) -> str:
+        with self.lock:
+            self._sock.sendall(command.encode() + b"\n")
+            data = self._read_until(self.prompt, self.command_timeout)
+        return data[:-len(self.prompt)].decode(errors="replace").strip("\r\n")
+
+    def close(self):
+        try:
+            self._sock.sendall(b"exit\n")
+        except OSError:
+            pass
+        self._sock.close()
+
+
+SESSION_TRANSPORTS = {
+    "emulated": EmulatedSession,
+    "tcp": TcpCliSession,
+}
+
+
+def session_factory_from_env():
+    transport = os.getenv("EXECUTOR_DEVICE_TRANSPORT", "emulated")
+    if transport not in SESSION_TRANSPORTS:
+        raise ValueError(f"Unknown EXECUTOR_DEVICE_TRANSPORT '{transport}', expected one of {list(SESSION_TRANSPORTS)}")
+    return SESSION_TRANSPORTS[transport]
+
+
+class DeviceSessionCache:
+    def __init__(self, max_sessions: int = None, idle_seconds: int = None, session_factory=EmulatedSession):
+        self.max_sessions = max_sessions or int(os.getenv("EXECUTOR_MAX_SESSIONS", "1000"))
+        self.idle_seconds = idle_seconds or int(os.getenv("EXECUTOR_SESSION_IDLE_SECONDS", "300"))
+        self.session_factory = session_factory
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, device_id: str, address: str = None):
+        with self._lock:
+            session = self._sessions.get(device_id)
+            if session is not None:
+                self._sessions.move_to_end(device_id)
+        if session is None:
+            # Открытие сессии (долгое) - вне блокировки
+            logger.info(f"Opening session to device {device_id} ({address})")
+            opened = self.session_factory(device_id, address)
+            evicted = []
+            with self._lock:
+                # Пока сессия открывалась, другой поток мог открыть свою к тому же устройству
+                session = self._sessions.get(device_id)
+                if session is None:
+                    session, opened = opened, None
+                    self._sessions[device_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    evicted.append(self._sessions.popitem(last=False)[1])
+            if opened is not None:
+                evicted.append(opened)
+            for old in evicted:
+                old.close()
+        session.last_used = time.time()
+        return session
+
+    def discard(self, device_id: str):
+        # Закрыть сессию (например, после ошибки соединения)
+        with self._lock:
+            session = self._sessions.pop(device_id, None)
+        if session is not None:
+            session.close()
+
+    def release(self, predicate) -> int:
+        # Закрыть сессии устройств, для которых predicate(device_id) истинно
+        with self._lock:
+            devices = [device_id for device_id in self._sessions if predicate(device_id)]
+            sessions = [self._sessions.pop(device_id) for device_id in devices]
+        for session in sessions:
+            session.close()
+        return len(sessions)
+
+    def expire_idle(self) -> int:
+        deadline = time.time() - self.idle_seconds
+        return self.release(lambda device_id: self._sessions[device_id].last_used < deadline)
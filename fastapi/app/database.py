@@ -3,6 +3,8 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 
+from app.query_metrics import TimedQueuePool, instrument_engine
+
 # Загрузка переменных окружения из .env файла для локальной разработки
 load_dotenv()
 
@@ -16,7 +18,13 @@ DATABASE_NAME = os.getenv("POSTGRES_DB", "scheduled_commands")
 
 DATABASE_URL = f"postgresql+asyncpg://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# Время запросов, число запросов на HTTP-запрос и ожидание пула собирает app/query_metrics.py;
+# SQL_ECHO=true дополнительно выводит каждый запрос
+engine = instrument_engine(create_async_engine(
+    DATABASE_URL,
+    echo=os.getenv("SQL_ECHO", "false").lower() == "true",
+    poolclass=TimedQueuePool,
+))
 
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
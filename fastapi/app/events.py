@@ -0,0 +1,193 @@
+# routers/app/events.py
+'''
+Рассылка событий о новых результатах подписчикам API (Server-Sent Events, GET /results/stream/).
+
+Результат, сохраненный create_or_update_result_for_schedule, публикуется в канал Redis pub/sub
+(RESULT_EVENTS_CHANNEL), поэтому событие получают подписчики всех реплик API, а не только той,
+что приняла результат.
+
+Каждый процесс API держит одну подписку на канал и раздает события локальным подписчикам из памяти:
+    - событие сериализуется один раз и передается всем подписчикам готовой строкой;
+    - подписчики проиндексированы по device_id, событие проверяется только у подписчиков своего устройства
+      и у подписчиков без фильтра по устройству;
+    - у каждого подписчика ограниченная очередь (RESULT_EVENTS_QUEUE_SIZE): медленный клиент теряет самые
+      старые события (счетчик dropped), но не тормозит остальных и не копит память.
+
+Настройка:
+    RESULT_EVENTS_ENABLED=true       публиковать и раздавать события
+    RESULT_EVENTS_CHANNEL=results:events
+    RESULT_EVENTS_QUEUE_SIZE=100     событий в очереди одного подписчика
+    RESULT_EVENTS_MAX_SUBSCRIBERS=10000  подписчиков на процесс API
+'''
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Ключ индекса для подписчиков без фильтра по устройству
+ANY_DEVICE = None
+
+
+@dataclass(eq=False)
+class Subscriber:
+    device_id: Optional[str] = None
+    schedule_id: Optional[str] = None
+    status: Optional[str] = None
+    queue: asyncio.Queue = field(default_factory=asyncio.Queue)
+    dropped: int = 0
+
+    def matches(self, event: dict) -> bool:
+        return (
+            (self.schedule_id is None or event.get("schedule_id") == self.schedule_id)
+            and (self.status is None or event.get("status") == self.status)
+        )
+
+    def offer(self, message: str):
+        # Переполненная очередь теряет самое старое событие
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+
+class ResultBroadcaster:
+    def __init__(self, redis_client=None):
+        self.enabled = os.getenv("RESULT_EVENTS_ENABLED", "true").lower() == "true"
+        self.channel = os.getenv("RESULT_EVENTS_CHANNEL", "results:events")
+        self.queue_size = int(os.getenv("RESULT_EVENTS_QUEUE_SIZE", "100"))
+        self.max_subscribers = int(os.getenv("RESULT_EVENTS_MAX_SUBSCRIBERS", "10000"))
+        self._redis = redis_client
+        self._subscribers = {}  # device_id (или ANY_DEVICE) -> set(Subscriber)
+        self._count = 0
+        self._listener = None
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.Redis(
+                host=os.getenv("REDIS_HOST", "scheduled_commands_redis"),
+                port=int(os.getenv("REDIS_PORT", "6379")),
+                db=0,
+                decode_responses=True,
+                # Недоступный Redis не должен надолго задерживать сохранение результата
+                socket_connect_timeout=2,
+            )
+        return self._redis
+
+    @property
+    def subscriber_count(self) -> int:
+        return self._count
+
+    async def publish(self, event: dict):
+        # Ошибка публикации не должна ломать сохранение результата: подписчики просто не получат событие
+        if not self.enabled:
+            return
+        try:
+            await self.redis.publish(self.channel, json.dumps(event, default=str))
+        except Exception as e:
+            logger.warning(f"Failed to publish result event to '{self.channel}': {e}")
+
+    def subscribe(self, device_id: Optional[str] = None, schedule_id: Optional[str] = None,
+                  status: Optional[str] = None) -> Optional[Subscriber]:
+        # None - достигнут предел подписчиков процесса
+        if self._count >= self.max_subscribers:
+            return None
+        subscriber = Subscriber(device_id, schedule_id, status, asyncio.Queue(maxsize=self.queue_size))
+        self._subscribers.setdefault(device_id, set()).add(subscriber)
+        self._count += 1
+        self._ensure_listener()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._subscribers.get(subscriber.device_id)
+        if subscribers is None or subscriber not in subscribers:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[subscriber.device_id]
+        self._count -= 1
+
+    def dispatch(self, raw: str) -> int:
+        # Раздача события из канала локальным подписчикам, возвращает число получателей
+        try:
+            event = json.loads(raw)
+        except ValueError:
+            logger.warning(f"Malformed result event: {raw[:200]}")
+            return 0
+        message = format_sse(event, raw)
+        delivered = 0
+        for key in {event.get("device_id"), ANY_DEVICE}:
+            for subscriber in self._subscribers.get(key, ()):
+                if subscriber.matches(event):
+                    subscriber.offer(message)
+                    delivered += 1
+        return delivered
+
+    def _ensure_listener(self):
+        if self.enabled and (self._listener is None or self._listener.done()):
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        # Одна подписка на канал на процесс; при обрыве соединения переподключаемся с задержкой
+        delay = 1.0
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                logger.info(f"Subscribed to result events channel '{self.channel}'")
+                delay = 1.0
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None and message.get("type") == "message":
+                        self.dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Result events subscription failed, reconnecting in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+
+def format_sse(event: dict, data: str) -> str:
+    # Кадр Server-Sent Events: id - ID результата, клиент видит его как lastEventId
+    return f"id: {event.get('id', '')}\nevent: result\ndata: {data}\n\n"
+
+
+def result_event(result) -> dict:
+    # Событие о сохраненном результате. Вывод команды не передается (он может быть большим),
+    # клиент при необходимости читает его по ID результата
+    return {
+        "id": str(result.id),
+        "schedule_id": str(result.schedule_id) if result.schedule_id else None,
+        "device_id": str(result.device_id) if result.device_id else None,
+        "status": result.status,
+        "parsed": result.parsed,
+        "duration_ms": result.duration_ms,
+        "executed_at": result.executed_at.isoformat() if result.executed_at else None,
+    }
+
+
+# Один рассыльщик на процесс API
+broadcaster = ResultBroadcaster()
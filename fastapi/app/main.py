@@ -1,11 +1,23 @@
 # routers/app/main.py (основной файл фаст апи,импортирует эндпоинты, добавляет на них префиксы)
+import asyncio
 from fastapi import FastAPI
-from app.routers import devices, commands, schedules, results
-from app.routers.results import router as results_router, device_level_router
+from app import purge, reconciler
+from app.routers import devices, commands, schedules, results, state, stats, reconcile, admin
+from app.routers import purge as purge_router
+from app.routers.results import router as results_router, device_level_router, fleet_results_router
 from app.routers.commands import router as commands_router, command_by_id_router
-from app.database import engine, Base
+from app.database import engine, Base, AsyncSessionLocal
+from app.temporal_client import get_temporal_client
+from app.events import broadcaster
+from app.on_demand import runner
+from app.profiling import ProfilingMiddleware, profile_store
+from app.query_metrics import QueryMetricsMiddleware
 
 app = FastAPI(title="Scheduled Network Commands API")
+# Профилирование запросов с заголовком X-Profile-Token (см. app/profiling.py)
+app.add_middleware(ProfilingMiddleware)
+# Статистика SQL каждого запроса: заголовок Server-Timing, предупреждения о N+1 (см. app/query_metrics.py)
+app.add_middleware(QueryMetricsMiddleware)
 
 # Создание таблиц
 @app.on_event("startup") # встроенный декоратор фастапи,который выполняет функцию один раз при запуске приложения, то есть
@@ -13,6 +25,19 @@ app = FastAPI(title="Scheduled Network Commands API")
 async def startup():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # Фоновая сверка расписаний с Workflow Temporal (RECONCILE_INTERVAL_SECONDS)
+    app.state.reconciler_task = asyncio.create_task(
+        reconciler.run_periodically(get_temporal_client, AsyncSessionLocal))
+    # Фоновая очистка удаленных устройств и расписаний пачками (PURGE_INTERVAL_SECONDS)
+    app.state.purge_task = asyncio.create_task(purge.run_periodically(AsyncSessionLocal, get_temporal_client))
+
+@app.on_event("shutdown") # при остановке закрываем подписку на события результатов (Redis pub/sub), сверку и очистку
+async def shutdown():
+    app.state.reconciler_task.cancel()
+    app.state.purge_task.cancel()
+    await broadcaster.close()
+    await runner.close()
+    await profile_store.close()
 
 @app.get("/") # хэлс чек, проверяет что сервер запущен и принимает запросы, видим сообщение об этом в консоли
 async def root():
@@ -36,4 +61,16 @@ app.include_router(
 # Подключение нового device_level_router для эндпоинта: GET /devices/{device_id}/results/
 app.include_router(device_level_router)
 # Подключение нового роутера для получения команды по ID для эндпоинта: GET /commands/{command_id}
-app.include_router(command_by_id_router)
\ No newline at end of file
+app.include_router(command_by_id_router)
+# Запросы по результатам всего парка: GET /results/parsed/, /results/search/, поток /results/stream/
+app.include_router(fleet_results_router)
+# Текущее состояние устройств: GET /devices/{device_id}/latest/, GET /fleet/state/
+app.include_router(state.router)
+# Статистика выполнения по агрегатам: GET /stats/
+app.include_router(stats.router)
+# Сверка расписаний с Temporal: POST /reconcile/, GET /reconcile/
+app.include_router(reconcile.router)
+# Задания фоновой очистки удаленных устройств и расписаний: GET /purge/
+app.include_router(purge_router.router)
+# Профилирование: GET /admin/profiles/ (см. app/profiling.py)
+app.include_router(admin.router)
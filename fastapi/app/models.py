@@ -1,25 +1,61 @@
 # routers/app/models.py модели алхимии, описывают таблицы в постгрес бд
 '''используется всегда, когда идёт работа с данными, при добавлении поля нужно пересоздавать БД, так как миграции не
 предусмотрены и нет алембик'''
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, UniqueConstraint
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Boolean, Index, DDL, event, literal_column
+from sqlalchemy.dialects.postgresql import UUID, JSONB, INET
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.sql import func
 import uuid
 from app.database import Base
 
+# Триграммный индекс по выводу команд требует расширения pg_trgm, создаем его перед таблицами
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+# Полнотекстовый поиск индексирует только начало вывода: размер tsvector в PostgreSQL ограничен 1 МБ
+FTS_MAX_CHARS = 262144
+
+
+def _fts_expression(output):
+    # Константы встраиваются литералами: с bind-параметрами планировщик не сопоставит выражение с индексом
+    return func.to_tsvector(
+        literal_column("'simple'::regconfig"),
+        func.left(func.coalesce(output, literal_column("''")), literal_column(str(FTS_MAX_CHARS))),
+    )
+
+class IPAddress(TypeDecorator):
+    # inet в PostgreSQL, строка в Python (asyncpg возвращает объекты ipaddress, а API и Workflow работают со строками)
+    impl = INET
+    cache_ok = True
+
+    def process_result_value(self, value, dialect):
+        return str(value) if value is not None else None
+
+
 class Device(Base):
     __tablename__ = "devices"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
-    ip_address = Column(String, unique=True, index=True, nullable=False)
-    device_type = Column(String, nullable=False)
+    # inet: выборка по подсети (ip_address <<= '10.20.0.0/16') идет по GiST-индексу
+    ip_address = Column(IPAddress, nullable=False)
+    device_type = Column(String, nullable=False, index=True)
+    # Произвольные атрибуты устройства для выборок, например {"site": "msk-1", "role": "access"}
+    tags = Column(JSONB, nullable=False, server_default=literal_column("'{}'::jsonb"), default=dict)
     username = Column(String, nullable=True)
     password = Column(String, nullable=True) # В реальном приложении рекомендуется шифровать пароли
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    # Время удаления: устройство скрыто из API, его данные удаляет фоновая очистка (см. app/purge.py)
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
 
-    # Уникальное ограничение на IP
-    __table_args__ = (UniqueConstraint('ip_address', name='uq_device_ip_address'),)
+    __table_args__ = (
+        # Уникальность IP среди неудаленных устройств (btree, по нему же keyset-пагинация GET /devices/query/):
+        # адрес удаленного устройства можно занять до окончания очистки
+        Index("uq_device_ip_address", ip_address, unique=True, postgresql_where=deleted_at.is_(None)),
+        # Вхождение в подсеть (<<, <<=) и пересечение (&&)
+        Index("ix_devices_ip_address_gist", ip_address, postgresql_using="gist", postgresql_ops={"ip_address": "inet_ops"}),
+        # Фильтр по атрибутам: tags @> '{"site": "msk-1"}'
+        Index("ix_devices_tags", tags, postgresql_using="gin", postgresql_ops={"tags": "jsonb_path_ops"}),
+    )
 
 class Command(Base):
     __tablename__ = "commands"
@@ -38,9 +74,15 @@ class Schedule(Base):
     command_id = Column(UUID(as_uuid=True), ForeignKey("commands.id", ondelete="CASCADE"), nullable=False, index=True)
     cron_expression = Column(String, nullable=False) # Cron-выражение для расписания
     is_active = Column(Boolean, default=True, nullable=False)
+    # Приоритет задач расписания: 'high', 'normal' или 'low' (отдельные потоки Redis для Executor'а)
+    priority = Column(String, default="normal", server_default="normal", nullable=False)
+    # Окно сглаживания запусков, сек: NULL - глобальное SCHEDULE_JITTER_SECONDS, 0 - без смещения
+    jitter_seconds = Column(Integer, nullable=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    # Время удаления: расписание скрыто из API, его результаты обрабатывает фоновая очистка (см. app/purge.py)
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
 
 class CommandResult(Base):
     __tablename__ = "command_results"
@@ -48,7 +90,119 @@ class CommandResult(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
     schedule_id = Column(UUID(as_uuid=True), ForeignKey("schedules.id", ondelete="SET NULL"), nullable=True, index=True)
     # schedule_id может быть NULL, если результат не связан с расписанием (например, выполнение по запросу)
+    # Устройство результата (денормализовано, без внешнего ключа): фильтр по устройству без join через schedules и commands
+    device_id = Column(UUID(as_uuid=True), nullable=True, index=True)
     output = Column(Text, nullable=True)
+    # Структурированный разбор вывода (парсеры Executor'а), например {"parser": "...", "interfaces": [...]}
+    parsed = Column(JSONB(none_as_null=True), nullable=True)
     status = Column(String, nullable=False) # Например, 'pending', 'success', 'failed'
+    # Длительность выполнения на Executor'е (мс), NULL для результатов без замера
+    duration_ms = Column(Integer, nullable=True)
+    # Ключ идемпотентности выполнения (один на запуск Workflow): повторная отправка того же результата
+    # (повтор Activity после таймаута, повторная доставка задачи) не создает вторую строку
+    idempotency_key = Column(String, nullable=True, unique=True)
     executed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # GIN-индекс для запросов по содержимому: parsed @> '{"interfaces": [{"status": "down"}]}'
+        Index("ix_command_results_parsed", parsed, postgresql_using="gin", postgresql_ops={"parsed": "jsonb_path_ops"}),
+        # Поиск подстроки (серийный номер, текст ошибки): output ILIKE '%...%'
+        Index("ix_command_results_output_trgm", output, postgresql_using="gin", postgresql_ops={"output": "gin_trgm_ops"}),
+        # Полнотекстовый поиск по словам, выражение должно совпадать с output_tsvector()
+        Index("ix_command_results_output_fts", _fts_expression(output), postgresql_using="gin"),
+        # Keyset-пагинация по времени выполнения
+        Index("ix_command_results_executed_at_id", executed_at, id),
+    )
+
+    # Серверные значения по умолчанию (executed_at) возвращаются через RETURNING при INSERT,
+    # они нужны проекциям на пути приема результата без дополнительного SELECT
+    __mapper_args__ = {"eager_defaults": True}
+
+
+class LatestResult(Base):
+    # Проекция "последний результат" на каждое расписание, обновляется при приеме результата.
+    # Текущее состояние парка читается из нее одним индексным сканированием, независимо от объема истории.
+    __tablename__ = "latest_results"
+
+    schedule_id = Column(UUID(as_uuid=True), ForeignKey("schedules.id", ondelete="CASCADE"), primary_key=True)
+    device_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    command_id = Column(UUID(as_uuid=True), nullable=True)
+    result_id = Column(UUID(as_uuid=True), nullable=False)
+    status = Column(String, nullable=False)
+    parsed = Column(JSONB(none_as_null=True), nullable=True)
+    executed_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
+class ResultRollup(Base):
+    # Агрегаты результатов по интервалам времени (см. app/rollups.py), обновляются при приеме результата.
+    # Статистика по устройствам, командам и типам устройств читается отсюда, без сканирования command_results.
+    __tablename__ = "result_rollups"
+
+    granularity = Column(String, primary_key=True)  # '5m' или '1h'
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    device_id = Column(UUID(as_uuid=True), primary_key=True)
+    command_id = Column(UUID(as_uuid=True), primary_key=True)
+    device_type = Column(String, nullable=True)
+
+    total = Column(Integer, default=0, nullable=False)
+    success = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    # Длительности: число замеров, сумма и максимум (мс)
+    duration_count = Column(Integer, default=0, nullable=False)
+    duration_sum_ms = Column(BigInteger, default=0, nullable=False)
+    duration_max_ms = Column(Integer, nullable=True)
+    # Гистограмма длительностей, колонки соответствуют app.rollups.HISTOGRAM_COLUMNS
+    duration_le_100 = Column(Integer, default=0, nullable=False)
+    duration_le_250 = Column(Integer, default=0, nullable=False)
+    duration_le_500 = Column(Integer, default=0, nullable=False)
+    duration_le_1000 = Column(Integer, default=0, nullable=False)
+    duration_le_2000 = Column(Integer, default=0, nullable=False)
+    duration_le_3000 = Column(Integer, default=0, nullable=False)
+    duration_le_5000 = Column(Integer, default=0, nullable=False)
+    duration_le_7500 = Column(Integer, default=0, nullable=False)
+    duration_le_10000 = Column(Integer, default=0, nullable=False)
+    duration_le_30000 = Column(Integer, default=0, nullable=False)
+    duration_le_60000 = Column(Integer, default=0, nullable=False)
+    duration_le_inf = Column(Integer, default=0, nullable=False)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        # Статистика парка и по типам устройств за период
+        Index("ix_result_rollups_granularity_bucket", granularity, bucket_start),
+        Index("ix_result_rollups_device", device_id, granularity, bucket_start),
+        Index("ix_result_rollups_command", command_id, granularity, bucket_start),
+        Index("ix_result_rollups_device_type", device_type, granularity, bucket_start),
+    )
+
+
+def output_tsvector():
+    # Выражение полнотекстового индекса ix_command_results_output_fts
+    return _fts_expression(CommandResult.output)
+
+
+class PurgeJob(Base):
+    # Фоновая очистка удаленного устройства или расписания (см. app/purge.py)
+    __tablename__ = "purge_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
+    entity_type = Column(String, nullable=False)  # 'device' или 'schedule'
+    entity_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    # Результаты удаленных расписаний: 'detach' - оставить без schedule_id (как ON DELETE SET NULL), 'delete' - удалить
+    results_mode = Column(String, nullable=False)
+    status = Column(String, default="pending", server_default="pending", nullable=False)  # pending, running, done, failed
+    results_total = Column(BigInteger, nullable=True)  # оценка при начале очистки
+    results_processed = Column(BigInteger, default=0, server_default="0", nullable=False)
+    batches = Column(Integer, default=0, server_default="0", nullable=False)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    # Обновляется после каждой пачки: задание с давним updated_at в статусе running подхватывает другая реплика
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_purge_jobs_status_created_at", status, created_at),
+    )
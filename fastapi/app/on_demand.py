@@ -0,0 +1,88 @@
+# routers/app/on_demand.py
+'''
+Выполнение команды по требованию (POST /commands/{command_id}/run) в обход расписаний и Temporal.
+
+Путь по расписанию рассчитан на пропускную способность: тик cron, Activity получения команды, поток задач,
+ожидание результата и сохранение через HTTP. Оператору, который разбирает проблему на живом устройстве,
+нужна минимальная задержка, поэтому API:
+    1. публикует задачу прямо в приоритетный поток tasks:high (с учетом TASK_PARTITIONS, как Worker);
+    2. указывает в задаче reply_list - ключ списка Redis, куда Executor положит результат (LPUSH, с TTL);
+    3. ждет результат в этом списке блокирующим BLPOP - без опроса, ответ приходит сразу после LPUSH.
+Накладные расходы сверх времени на устройстве - несколько обращений к Redis и одна вставка результата в БД.
+Если результат не пришел за timeout, клиент получает 504 с run_id; ответ Executor'а, пришедший позже,
+удалится вместе со списком по TTL.
+'''
+import json
+import logging
+import os
+import uuid
+import zlib
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Поток высокого приоритета Executor'а (см. executor/lanes.py)
+TASK_STREAM = "tasks:high"
+REPLY_KEY_PREFIX = "run-reply:"
+
+
+def task_stream_for(device_id) -> str:
+    # Шардирование по устройству: значение TASK_PARTITIONS должно совпадать с Worker'ом и Executor'ом
+    partitions = max(1, int(os.getenv("TASK_PARTITIONS", "1")))
+    if partitions <= 1:
+        return TASK_STREAM
+    return f"{TASK_STREAM}:p{zlib.crc32(str(device_id).encode()) % partitions}"
+
+
+class OnDemandRunner:
+    def __init__(self, redis_client=None):
+        self._redis = redis_client
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.Redis(
+                host=os.getenv("REDIS_HOST", "scheduled_commands_redis"),
+                port=int(os.getenv("REDIS_PORT", "6379")),
+                db=0,
+                decode_responses=True,
+                socket_connect_timeout=2,
+            )
+        return self._redis
+
+    async def dispatch(self, run_id: uuid.UUID, device, command) -> str:
+        # Публикует задачу и возвращает ключ списка, в котором ждать результат
+        reply_key = f"{REPLY_KEY_PREFIX}{run_id}"
+        task_message = {
+            "command_id": str(command.id),
+            "device_id": str(device.id),
+            "device_type": device.device_type or "",
+            "device_address": device.ip_address or "",
+            "command_string": command.command_string,
+            "idempotency_key": str(run_id),
+            "reply_list": reply_key,
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+        }
+        stream = task_stream_for(device.id)
+        message_id = await self.redis.xadd(stream, task_message)
+        logger.info(f"On-demand run {run_id} of command {command.id} published to '{stream}' with ID {message_id}")
+        return reply_key
+
+    async def wait(self, reply_key: str, timeout_seconds: float) -> Optional[dict]:
+        # Результат Executor'а или None по таймауту
+        reply = await self.redis.blpop([reply_key], timeout=timeout_seconds)
+        if reply is None:
+            return None
+        await self.redis.delete(reply_key)
+        return json.loads(reply[1])
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+
+# Один на процесс API
+runner = OnDemandRunner()
@@ -0,0 +1,91 @@
+# routers/app/output_reads.py
+'''
+Частичное чтение вывода команд (command_results.output) без загрузки всего значения в память API.
+
+Вывод вроде "show running-config" занимает десятки мегабайт, а клиенту часто нужны последние строки
+или фрагмент. Все операции вырезают нужную часть в PostgreSQL:
+    - диапазон байт (HTTP Range)    - substring(convert_to(output, 'UTF8') from ... for ...);
+    - первые/последние N строк      - left()/right() окном символов, окно растет, пока в нем не наберется N строк;
+    - весь вывод потоком            - последовательные substr() по OUTPUT_CHUNK_CHARS символов, каждый кусок
+                                      читается своим коротким запросом и сразу отдается клиенту.
+Размер вывода в байтах (octet_length) PostgreSQL берет из заголовка TOAST, не распаковывая значение.
+'''
+import os
+import re
+import uuid
+from typing import Optional, Tuple
+
+from sqlalchemy import func, literal_column, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+OUTPUT_CHUNK_CHARS = int(os.getenv("RESULT_OUTPUT_CHUNK_CHARS", "262144"))
+# Начальное окно при чтении строк с начала/конца: примерно столько символов на строку
+LINE_WINDOW_CHARS = 256
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    # Диапазон байт [start, end] включительно из заголовка Range для вывода размером size.
+    # None - диапазон не выполним (416); поддерживается один диапазон
+    match = _RANGE.fullmatch(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-N - последние N байт
+        length = int(last)
+        if length == 0 or size == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+def take_lines(text: str, lines: int, from_end: bool, complete: bool) -> Optional[str]:
+    # N строк с начала или конца окна text. complete - в окне весь вывод; иначе крайняя строка окна
+    # может быть обрезана, и она не считается. None - строк в окне не хватает, нужно окно больше
+    parts = text.splitlines(keepends=True)
+    if complete:
+        return "".join(parts[-lines:] if from_end else parts[:lines])
+    if len(parts) <= lines:
+        return None
+    return "".join(parts[-lines:] if from_end else parts[:lines])
+
+
+async def output_size(db: AsyncSession, result_id: uuid.UUID) -> Optional[int]:
+    # Размер вывода в байтах или None, если результата нет
+    stmt = select(func.coalesce(func.octet_length(models.CommandResult.output), 0)).where(
+        models.CommandResult.id == result_id)
+    return (await db.execute(stmt)).scalar()
+
+
+async def read_byte_range(db: AsyncSession, result_id: uuid.UUID, start: int, end: int) -> bytes:
+    fragment = func.substring(
+        func.convert_to(models.CommandResult.output, literal_column("'UTF8'")), start + 1, end - start + 1)
+    stmt = select(fragment).where(models.CommandResult.id == result_id)
+    return (await db.execute(stmt)).scalar() or b""
+
+
+async def read_lines(db: AsyncSession, result_id: uuid.UUID, lines: int, from_end: bool) -> str:
+    window = max(LINE_WINDOW_CHARS * lines, 4096)
+    cut = func.right if from_end else func.left
+    while True:
+        stmt = select(cut(models.CommandResult.output, window)).where(models.CommandResult.id == result_id)
+        text = (await db.execute(stmt)).scalar() or ""
+        # Окно короче запрошенного - в него попал весь вывод
+        taken = take_lines(text, lines, from_end, complete=len(text) < window)
+        if taken is not None:
+            return taken
+        window *= 4
+
+
+async def read_chunk(db: AsyncSession, result_id: uuid.UUID, offset: int, chars: int) -> str:
+    stmt = select(func.substr(models.CommandResult.output, offset + 1, chars)).where(
+        models.CommandResult.id == result_id)
+    return (await db.execute(stmt)).scalar() or ""
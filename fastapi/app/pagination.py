@@ -0,0 +1,40 @@
+# routers/app/pagination.py
+'''
+Keyset-пагинация (по курсору) для больших таблиц.
+
+В отличие от offset/limit, стоимость следующей страницы не растет с ее номером: запрос продолжает
+с последней выданной строки по индексу (executed_at, id). Курсор - непрозрачная строка
+base64("<executed_at в ISO>|<id>").
+'''
+import base64
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(executed_at: datetime, row_id: uuid.UUID) -> str:
+    raw = f"{executed_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        executed_at, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(executed_at), uuid.UUID(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=422, detail="Некорректный курсор пагинации")
+
+
+def keyset_after(executed_at_column, id_column, cursor: Optional[str]):
+    # Условие "строго после курсора" при сортировке (executed_at DESC, id DESC)
+    if not cursor:
+        return None
+    executed_at, row_id = decode_cursor(cursor)
+    return or_(
+        executed_at_column < executed_at,
+        and_(executed_at_column == executed_at, id_column < row_id),
+    )
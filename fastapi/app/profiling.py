@@ -0,0 +1,170 @@
+# routers/app/profiling.py
+'''
+Профилирование по запросу в рабочем окружении (без передеплоя).
+
+Профили снимает сэмплирующий профилировщик pyinstrument (опциональная зависимость: без него профилирование
+выключено, остальное работает) и сохраняет в формате speedscope (https://www.speedscope.app) в Redis:
+    profiles:index      - ZSET ID профилей по времени (хранится не больше PROFILE_MAX_STORED);
+    profile:{id}        - HASH: meta (сервис, метка, длительность) и data (speedscope JSON), TTL PROFILE_TTL_SECONDS.
+Профили читаются через GET /admin/profiles/ (app/routers/admin.py).
+
+Источники профилей:
+    api      - запрос с заголовком X-Profile-Token, равным PROFILING_TOKEN (ProfilingMiddleware); ID профиля
+               возвращается в заголовке ответа X-Profile-Id;
+    executor - N следующих задач Executor'а (executor/profiling.py);
+    worker   - N следующих Activity Worker'а (worker/workflows/profiling.py).
+Executor и Worker профилируют задачи, пока счетчик profiling:arm:{service} в Redis больше нуля
+(POST /admin/profiles/arm) или переменная окружения при старте задает начальное число задач.
+
+Без PROFILING_TOKEN профилирование запросов и админ-эндпоинты выключены.
+'''
+import hmac
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile-token"
+INDEX_KEY = "profiles:index"
+PROFILE_KEY_PREFIX = "profile:"
+ARM_KEY_PREFIX = "profiling:arm:"
+SERVICES = ("executor", "worker")
+
+
+def profiling_token() -> Optional[str]:
+    return os.getenv("PROFILING_TOKEN") or None
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    expected = profiling_token()
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(token.encode(), expected.encode())
+
+
+def create_profiler():
+    # Профилировщик запроса или None, если pyinstrument не установлен
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        logger.warning("Profiling requested, but pyinstrument is not installed")
+        return None
+    # async_mode: в профиль попадает только код запроса, а не других корутин цикла событий
+    return Profiler(interval=float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.001")), async_mode="enabled")
+
+
+def render_speedscope(profiler) -> str:
+    from pyinstrument.renderers import SpeedscopeRenderer
+    return profiler.output(renderer=SpeedscopeRenderer())
+
+
+class ProfileStore:
+    def __init__(self, redis_client=None):
+        self._redis = redis_client
+        self.ttl_seconds = int(os.getenv("PROFILE_TTL_SECONDS", "86400"))
+        self.max_stored = int(os.getenv("PROFILE_MAX_STORED", "200"))
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.Redis(
+                host=os.getenv("REDIS_HOST", "scheduled_commands_redis"),
+                port=int(os.getenv("REDIS_PORT", "6379")),
+                db=0,
+                decode_responses=True,
+                socket_connect_timeout=2,
+            )
+        return self._redis
+
+    async def save(self, profile_id: str, service: str, label: str, duration_ms: int, data: str):
+        meta = {"id": profile_id, "service": service, "label": label, "duration_ms": duration_ms,
+                "created_at": time.time(), "format": "speedscope"}
+        key = f"{PROFILE_KEY_PREFIX}{profile_id}"
+        pipe = self.redis.pipeline()
+        pipe.hset(key, mapping={"meta": json.dumps(meta), "data": data})
+        pipe.expire(key, self.ttl_seconds)
+        pipe.zadd(INDEX_KEY, {profile_id: meta["created_at"]})
+        # Самые старые профили вытесняются из индекса, их данные удалятся по TTL
+        pipe.zremrangebyrank(INDEX_KEY, 0, -self.max_stored - 1)
+        await pipe.execute()
+
+    async def list(self, limit: int = 50) -> list:
+        profile_ids = await self.redis.zrevrange(INDEX_KEY, 0, limit - 1)
+        if not profile_ids:
+            return []
+        pipe = self.redis.pipeline()
+        for profile_id in profile_ids:
+            pipe.hget(f"{PROFILE_KEY_PREFIX}{profile_id}", "meta")
+        return [json.loads(meta) for meta in await pipe.execute() if meta]
+
+    async def get(self, profile_id: str) -> Optional[str]:
+        return await self.redis.hget(f"{PROFILE_KEY_PREFIX}{profile_id}", "data")
+
+    async def arm(self, service: str, count: int) -> int:
+        # Профилировать count следующих задач сервиса; 0 - выключить
+        key = f"{ARM_KEY_PREFIX}{service}"
+        if count <= 0:
+            await self.redis.delete(key)
+            return 0
+        await self.redis.set(key, count, ex=self.ttl_seconds)
+        return count
+
+    async def armed(self) -> dict:
+        values = await self.redis.mget([f"{ARM_KEY_PREFIX}{service}" for service in SERVICES])
+        return {service: int(value or 0) for service, value in zip(SERVICES, values)}
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+
+# Одно хранилище на процесс API
+profile_store = ProfileStore()
+
+
+class ProfilingMiddleware:
+    # ASGI middleware: запросы без заголовка X-Profile-Token проходят без накладных расходов
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiling_token():
+            await self.app(scope, receive, send)
+            return
+        token = dict(scope["headers"]).get(PROFILE_HEADER.encode())
+        if token is None or not is_authorized(token.decode(errors="replace")):
+            await self.app(scope, receive, send)
+            return
+        profiler = create_profiler()
+        if profiler is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        label = f"{scope['method']} {scope['path']}"
+
+        async def send_with_profile_id(message):
+            # ID известен заранее: заголовок уходит до окончания профилирования
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        started = time.monotonic()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.stop()
+            duration_ms = int((time.monotonic() - started) * 1000)
+            try:
+                await profile_store.save(profile_id, "api", label, duration_ms, render_speedscope(profiler))
+                logger.info(f"Saved profile {profile_id} of '{label}' ({duration_ms} ms)")
+            except Exception as e:
+                logger.warning(f"Failed to save profile of '{label}': {e}")
@@ -0,0 +1,111 @@
+# routers/app/projections.py
+'''
+Проекции (производные таблицы), которые поддерживаются в актуальном состоянии на пути приема результата,
+в той же транзакции, что и вставка в command_results.
+'''
+from sqlalchemy import DateTime, String, column, func, literal, select, true, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models, rollups
+
+
+async def update_latest_result(db: AsyncSession, result: models.CommandResult):
+    # Upsert последнего результата расписания. command_id берется из schedules тем же запросом (INSERT ... SELECT),
+    # более старый результат (пришедший с опозданием) не перезаписывает более новый.
+    if result.schedule_id is None or result.device_id is None:
+        return
+
+    source = select(
+        models.Schedule.id,
+        literal(result.device_id, type_=models.LatestResult.device_id.type),
+        models.Schedule.command_id,
+        literal(result.id, type_=models.LatestResult.result_id.type),
+        literal(result.status),
+        literal(result.parsed, type_=models.LatestResult.parsed.type),
+        literal(result.executed_at, type_=models.LatestResult.executed_at.type),
+    ).where(models.Schedule.id == result.schedule_id)
+
+    stmt = insert(models.LatestResult).from_select(
+        ["schedule_id", "device_id", "command_id", "result_id", "status", "parsed", "executed_at"],
+        source,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.LatestResult.schedule_id],
+        set_={
+            "device_id": stmt.excluded.device_id,
+            "command_id": stmt.excluded.command_id,
+            "result_id": stmt.excluded.result_id,
+            "status": stmt.excluded.status,
+            "parsed": stmt.excluded.parsed,
+            "executed_at": stmt.excluded.executed_at,
+            "updated_at": func.now(),
+        },
+        where=stmt.excluded.executed_at >= models.LatestResult.executed_at,
+    )
+    await db.execute(stmt)
+
+
+async def update_rollups(db: AsyncSession, result: models.CommandResult):
+    # Инкремент агрегатов result_rollups за все интервалы (5 минут, час) одним INSERT ... SELECT:
+    # command_id и device_type берутся из schedules и devices тем же запросом.
+    if result.schedule_id is None or result.device_id is None:
+        return
+
+    buckets = values(
+        column("granularity", String),
+        column("bucket_start", DateTime(timezone=True)),
+        name="buckets",
+    ).data([
+        (granularity, rollups.bucket_start(result.executed_at, seconds))
+        for granularity, seconds in rollups.GRANULARITIES.items()
+    ])
+
+    duration = result.duration_ms
+    histogram_index = rollups.histogram_index(duration) if duration is not None else None
+    histogram = [
+        literal(1 if index == histogram_index else 0)
+        for index in range(len(rollups.HISTOGRAM_COLUMNS))
+    ]
+
+    source = (
+        select(
+            buckets.c.granularity,
+            buckets.c.bucket_start,
+            literal(result.device_id, type_=models.ResultRollup.device_id.type),
+            models.Schedule.command_id,
+            models.Device.device_type,
+            literal(1),
+            literal(1 if result.status == "success" else 0),
+            literal(1 if result.status == "failed" else 0),
+            literal(1 if duration is not None else 0),
+            literal(duration or 0, type_=models.ResultRollup.duration_sum_ms.type),
+            literal(duration, type_=models.ResultRollup.duration_max_ms.type),
+            *histogram,
+        )
+        .select_from(models.Schedule)
+        .outerjoin(models.Device, models.Device.id == result.device_id)
+        .join(buckets, true())
+        .where(models.Schedule.id == result.schedule_id)
+    )
+
+    stmt = insert(models.ResultRollup).from_select(
+        ["granularity", "bucket_start", "device_id", "command_id", "device_type",
+         "total", "success", "failed", "duration_count", "duration_sum_ms", "duration_max_ms",
+         *rollups.HISTOGRAM_COLUMNS],
+        source,
+    )
+    # Счетчики складываются с уже накопленными в строке интервала
+    counters = ["total", "success", "failed", "duration_count", "duration_sum_ms", *rollups.HISTOGRAM_COLUMNS]
+    rollup = models.ResultRollup.__table__.c
+    set_ = {name: rollup[name] + stmt.excluded[name] for name in counters}
+    set_.update({
+        "device_type": stmt.excluded.device_type,
+        "duration_max_ms": func.greatest(rollup.duration_max_ms, stmt.excluded.duration_max_ms),
+        "updated_at": func.now(),
+    })
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[rollup.granularity, rollup.bucket_start, rollup.device_id, rollup.command_id],
+        set_=set_,
+    )
+    await db.execute(stmt)
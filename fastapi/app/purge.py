@@ -0,0 +1,221 @@
+# routers/app/purge.py
+'''
+Фоновая очистка удаленных устройств и расписаний.
+
+DELETE /devices/{id} и DELETE .../schedules/{id} только отмечают запись (deleted_at) и создают задание
+purge_jobs - одна короткая транзакция. Раньше удаление устройства каскадно удаляло команды и расписания,
+а ON DELETE SET NULL переписывал все результаты расписаний в той же транзакции: у нагруженного устройства
+это миллионы строк, долгие блокировки и раздувание command_results.
+
+Workflow расписаний останавливаются сразу в запросе DELETE (без гарантии: при недоступном Temporal их
+остановит задание или сверка). Задания выполняет фоновый цикл в процессе API (PURGE_INTERVAL_SECONDS, 0 - выключено):
+    1. останавливает Workflow расписаний (если они еще работают) и удаляет их строки latest_results;
+    2. пачками по PURGE_BATCH_SIZE отвязывает (results_mode=detach, по умолчанию - как прежний SET NULL)
+       или удаляет (delete) результаты. Каждая пачка - отдельная короткая транзакция; строки, заблокированные
+       приемом результатов, пропускаются (SKIP LOCKED) и попадут в следующую пачку. Между пачками пауза
+       PURGE_BATCH_PAUSE_SECONDS, чтобы очистка не вытесняла прием результатов;
+    3. удаляет саму запись: результатов у расписаний уже нет, каскад затрагивает только команды и расписания.
+Прогресс (results_processed из results_total, число пачек) сохраняется после каждой пачки и доступен
+через GET /purge/{job_id}. Шаги идемпотентны: задание упавшей реплики (running без обновлений дольше
+PURGE_STALE_SECONDS) продолжает другая реплика. Агрегаты result_rollups остаются как история.
+'''
+import asyncio
+import logging
+import os
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import and_, delete, exists, func, or_, update
+from sqlalchemy.future import select
+
+from app import models
+from app.schedule_workflows import stop_schedule_workflow
+
+logger = logging.getLogger(__name__)
+
+RESULTS_MODES = ("detach", "delete")
+
+
+def results_mode() -> str:
+    mode = os.getenv("PURGE_RESULTS_MODE", "detach")
+    if mode not in RESULTS_MODES:
+        logger.warning(f"Unknown PURGE_RESULTS_MODE '{mode}', using 'detach'")
+        return "detach"
+    return mode
+
+
+def new_job(entity_type: str, entity_id) -> models.PurgeJob:
+    return models.PurgeJob(entity_type=entity_type, entity_id=entity_id, results_mode=results_mode())
+
+
+async def claim_job(db) -> Optional[models.PurgeJob]:
+    # Следующее задание: ожидающее или брошенное упавшей репликой. SKIP LOCKED - реплики берут разные задания
+    stale = timedelta(seconds=int(os.getenv("PURGE_STALE_SECONDS", "300")))
+    candidate = (
+        select(models.PurgeJob.id)
+        .where(or_(
+            models.PurgeJob.status == "pending",
+            and_(models.PurgeJob.status == "running", models.PurgeJob.updated_at < func.now() - stale),
+        ))
+        .order_by(models.PurgeJob.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(models.PurgeJob)
+        .where(models.PurgeJob.id == candidate)
+        .values(status="running", started_at=func.coalesce(models.PurgeJob.started_at, func.now()),
+                updated_at=func.now())
+        .returning(models.PurgeJob)
+        .execution_options(synchronize_session=False)
+    )
+    job = (await db.execute(stmt)).scalar_one_or_none()
+    await db.commit()
+    return job
+
+
+async def schedule_ids_of(db, job: models.PurgeJob) -> list:
+    if job.entity_type == "schedule":
+        return [job.entity_id]
+    stmt = (
+        select(models.Schedule.id)
+        .join(models.Command, models.Schedule.command_id == models.Command.id)
+        .where(models.Command.device_id == job.entity_id)
+    )
+    return list((await db.execute(stmt)).scalars())
+
+
+def _results_condition(job: models.PurgeJob, schedule_ids: list):
+    # Результаты, которые обрабатывает задание; None - обрабатывать нечего
+    by_schedule = models.CommandResult.schedule_id.in_(schedule_ids) if schedule_ids else None
+    if job.entity_type == "device" and job.results_mode == "delete":
+        # Вместе с результатами расписаний удаляются результаты запусков по требованию (schedule_id NULL)
+        by_device = models.CommandResult.device_id == job.entity_id
+        return by_device if by_schedule is None else or_(by_device, by_schedule)
+    return by_schedule
+
+
+async def stop_workflows(get_client, schedule_ids: list, reason: str):
+    # Ошибка не прерывает удаление и очистку: удаленные расписания не входят в желаемое состояние сверки
+    # (app/reconciler.py), и их Workflow остановит следующий проход
+    if not schedule_ids:
+        return
+    try:
+        client = await get_client()
+    except Exception as e:
+        logger.warning(f"Temporal is unavailable, reconciler will stop Workflows of {len(schedule_ids)} schedules: {e}")
+        return
+    semaphore = asyncio.Semaphore(int(os.getenv("RECONCILE_CONCURRENCY", "50")))
+
+    async def stop(schedule_id):
+        async with semaphore:
+            try:
+                await stop_schedule_workflow(client, schedule_id, reason=reason)
+            except Exception as e:
+                logger.warning(f"Failed to stop Workflow of deleted schedule {schedule_id}, reconciler will retry: {e}")
+
+    await asyncio.gather(*(stop(schedule_id) for schedule_id in schedule_ids))
+
+
+async def _heartbeat(db, job_id, **values):
+    stmt = (
+        update(models.PurgeJob)
+        .where(models.PurgeJob.id == job_id)
+        .values(updated_at=func.now(), **values)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(stmt)
+
+
+async def purge_batch(db, job: models.PurgeJob, condition, batch_size: int) -> int:
+    # Одна пачка результатов в своей транзакции, вместе с прогрессом задания
+    batch = (
+        select(models.CommandResult.id)
+        .where(condition)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    if job.results_mode == "delete":
+        stmt = delete(models.CommandResult).where(models.CommandResult.id.in_(batch))
+    else:
+        stmt = update(models.CommandResult).where(models.CommandResult.id.in_(batch)).values(schedule_id=None)
+    processed = (await db.execute(stmt.execution_options(synchronize_session=False))).rowcount
+    await _heartbeat(db, job.id, results_processed=models.PurgeJob.results_processed + processed,
+                     batches=models.PurgeJob.batches + 1)
+    await db.commit()
+    return processed
+
+
+async def run_job(session_factory, get_client, job: models.PurgeJob,
+                  batch_size: Optional[int] = None, pause_seconds: Optional[float] = None):
+    batch_size = batch_size or int(os.getenv("PURGE_BATCH_SIZE", "5000"))
+    pause_seconds = float(os.getenv("PURGE_BATCH_PAUSE_SECONDS", "0.1")) if pause_seconds is None else pause_seconds
+    logger.info(f"Purging {job.entity_type} {job.entity_id} (job {job.id}, results: {job.results_mode})")
+    try:
+        async with session_factory() as db:
+            schedule_ids = await schedule_ids_of(db, job)
+        # Повторная остановка после DELETE безопасна: остановленный Workflow пропускается
+        await stop_workflows(get_client, schedule_ids, reason=f"{job.entity_type} deleted")
+
+        condition = _results_condition(job, schedule_ids)
+        async with session_factory() as db:
+            # Текущее состояние (GET /state/) перестает показывать удаленные расписания сразу
+            if job.entity_type == "device":
+                await db.execute(delete(models.LatestResult).where(models.LatestResult.device_id == job.entity_id))
+            else:
+                await db.execute(delete(models.LatestResult).where(models.LatestResult.schedule_id == job.entity_id))
+            values = {}
+            if job.results_total is None:
+                # Оценка объема для прогресса; при продолжении чужого задания не пересчитывается
+                values["results_total"] = 0 if condition is None else (
+                    await db.execute(select(func.count()).select_from(models.CommandResult).where(condition))).scalar()
+            await _heartbeat(db, job.id, **values)
+            await db.commit()
+
+        while condition is not None:
+            async with session_factory() as db:
+                processed = await purge_batch(db, job, condition, batch_size)
+                # Пустая пачка: либо все обработано, либо оставшиеся строки заблокированы приемом результатов
+                if processed == 0 and not (await db.execute(select(exists().where(condition)))).scalar():
+                    break
+            await asyncio.sleep(pause_seconds)
+
+        async with session_factory() as db:
+            # Каскад удаляет команды и расписания; результаты, пришедшие после последней пачки, отвяжет SET NULL
+            if job.entity_type == "device":
+                await db.execute(delete(models.Device).where(
+                    models.Device.id == job.entity_id, models.Device.deleted_at.is_not(None)))
+            else:
+                await db.execute(delete(models.Schedule).where(
+                    models.Schedule.id == job.entity_id, models.Schedule.deleted_at.is_not(None)))
+            await _heartbeat(db, job.id, status="done", finished_at=func.now())
+            await db.commit()
+        logger.info(f"Purged {job.entity_type} {job.entity_id} (job {job.id})")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Purge job {job.id} failed: {e}", exc_info=True)
+        async with session_factory() as db:
+            await _heartbeat(db, job.id, status="failed", error=str(e)[:2000])
+            await db.commit()
+
+
+async def run_periodically(session_factory, get_client):
+    # Фоновая очистка в процессе API: задания выполняются одно за другим, без задержки между ними
+    interval = float(os.getenv("PURGE_INTERVAL_SECONDS", "5"))
+    if interval <= 0:
+        return
+    while True:
+        try:
+            async with session_factory() as db:
+                job = await claim_job(db)
+            if job is not None:
+                await run_job(session_factory, get_client, job)
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Purge loop failed: {e}", exc_info=True)
+        await asyncio.sleep(interval)
@@ -0,0 +1,175 @@
+# routers/app/query_metrics.py
+'''
+Инструментирование SQL: время запросов, число запросов на HTTP-запрос, ожидание соединения из пула.
+
+Вместо echo=True (каждый запрос в лог без времени) события движка SQLAlchemy собирают статистику в
+сборщики QueryStats, активные в текущем контексте (contextvars, поэтому запросы разных HTTP-запросов
+не смешиваются):
+    - QueryMetricsMiddleware - сборщик на каждый HTTP-запрос: итог в заголовке ответа Server-Timing
+      (db;dur=...;desc="N queries, pool wait ..."), предупреждение в лог, если запросов больше
+      SQL_REQUEST_QUERY_WARN или один и тот же запрос повторился SQL_N_PLUS_ONE_THRESHOLD раз (N+1);
+    - collect_queries() / assert_query_budget() - сборщик для блока кода и проверка бюджета запросов в тестах.
+Запросы дольше SQL_SLOW_QUERY_MS пишутся в лог app.sql.slow вместе с формой параметров (типы и размеры,
+без значений). SQL_ECHO=true возвращает прежний вывод каждого запроса.
+'''
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("app.sql.slow")
+
+SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+REQUEST_QUERY_WARN = int(os.getenv("SQL_REQUEST_QUERY_WARN", "20"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+# Длина текста запроса в логах
+STATEMENT_LOG_CHARS = 2000
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Сборщики, активные в текущем контексте (вложенные блоки видят запросы внешних)
+_collectors: ContextVar[tuple] = ContextVar("sql_query_collectors", default=())
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.pool_wait_ms = 0.0
+        self.statements = Counter()
+
+    def record(self, statement: str, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> list:
+        # Запросы, повторенные не меньше threshold раз: признак N+1
+        return [(statement, times) for statement, times in self.statements.most_common() if times >= threshold]
+
+    def summary(self) -> str:
+        return f"{self.count} queries, {self.total_ms:.1f} ms, pool wait {self.pool_wait_ms:.1f} ms"
+
+
+@contextmanager
+def collect_queries():
+    stats = QueryStats()
+    token = _collectors.set(_collectors.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _collectors.reset(token)
+
+
+@contextmanager
+def assert_query_budget(max_queries: int):
+    # Для тестов: блок должен выполнить не больше max_queries запросов
+    with collect_queries() as stats:
+        yield stats
+    if stats.count > max_queries:
+        statements = "\n".join(f"  {times} x {_shorten(statement)}" for statement, times in stats.statements.most_common())
+        raise AssertionError(f"Query budget exceeded: {stats.count} queries, budget {max_queries}\n{statements}")
+
+
+def _shorten(statement: str) -> str:
+    return _WHITESPACE.sub(" ", statement).strip()[:STATEMENT_LOG_CHARS]
+
+
+def _value_shape(value) -> str:
+    if isinstance(value, (list, tuple, set)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}({len(value)})"
+    return type(value).__name__
+
+
+def parameter_shape(parameters, executemany: bool = False) -> str:
+    # Форма параметров запроса без значений: типы и размеры
+    if executemany:
+        if not parameters:
+            return "[]"
+        return f"{len(parameters)} x {parameter_shape(parameters[0])}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {_value_shape(value)}" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(_value_shape(value) for value in parameters) + ")"
+    return _value_shape(parameters)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["query_started"].pop()) * 1000
+    for stats in _collectors.get():
+        stats.record(statement, elapsed_ms)
+    if elapsed_ms >= SLOW_QUERY_MS:
+        slow_query_logger.warning(f"Slow query {elapsed_ms:.1f} ms: {_shorten(statement)} "
+                                  f"params={parameter_shape(parameters, executemany)}")
+
+
+def _handle_error(exception_context):
+    # Запрос с ошибкой не доходит до after_cursor_execute: убираем его отметку времени
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_started"):
+        conn.info["query_started"].pop()
+
+
+def instrument_engine(engine):
+    # Подключить сбор статистики к движку (AsyncEngine или Engine)
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+    return engine
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    # Пул соединений, учитывающий время ожидания свободного (или открытия нового) соединения
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            waited_ms = (time.perf_counter() - started) * 1000
+            for stats in _collectors.get():
+                stats.pool_wait_ms += waited_ms
+
+
+class QueryMetricsMiddleware:
+    # ASGI middleware: статистика SQL каждого HTTP-запроса
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        label = f"{scope['method']} {scope['path']}"
+        with collect_queries() as stats:
+            async def send_with_timing(message):
+                # Для потоковых ответов в заголовок попадают запросы до начала ответа
+                if message["type"] == "http.response.start":
+                    timing = f'db;dur={stats.total_ms:.1f};desc="{stats.summary()}"'
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode())]}
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
+
+        repeated = stats.repeated()
+        if repeated:
+            statement, times = repeated[0]
+            logger.warning(f"Possible N+1 in {label}: query repeated {times} times ({stats.summary()}): "
+                           f"{_shorten(statement)}")
+        elif stats.count > REQUEST_QUERY_WARN:
+            logger.warning(f"{label} executed {stats.summary()}")
+        else:
+            logger.debug(f"{label}: {stats.summary()}")
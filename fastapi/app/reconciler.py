@@ -0,0 +1,199 @@
+# routers/app/reconciler.py
+'''
+Сверка расписаний в PostgreSQL с работающими Workflow в Temporal.
+
+Желаемое состояние - все активные неудаленные Schedule (один запрос с join на commands и devices),
+фактическое - все работающие Workflow с ID schedule-execution-* (постраничный list_workflows).
+По разнице:
+    - start  - активное расписание без Workflow (например, start_workflow упал при создании);
+    - stop   - Workflow без активного расписания (расписание выключено или удалено);
+    - update - Workflow запущен с другими параметрами или в другой очереди задач (отпечаток spec в memo не совпадает).
+Действия выполняются параллельно, не больше RECONCILE_CONCURRENCY одновременно; ошибка отдельного
+действия попадает в отчет и будет исправлена следующим проходом.
+
+API запускает сверку при старте и затем каждые RECONCILE_INTERVAL_SECONDS (0 - выключено). Между репликами
+API проход защищен сессионной advisory-блокировкой PostgreSQL, одновременно сверку выполняет одна реплика.
+Транзакция открыта только на чтение расписаний, обращения к Temporal выполняются вне транзакции.
+'''
+import asyncio
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.future import select
+
+from app import models
+from app.schedule_workflows import (
+    SPEC_MEMO_KEY,
+    WORKFLOW_ID_PREFIX,
+    WORKFLOW_TYPE,
+    spec_of,
+    start_schedule_workflow,
+    stop_schedule_workflow,
+    task_queue_routes,
+    workflow_input,
+)
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки сверки (произвольная константа)
+RECONCILE_LOCK_KEY = 7_041_038
+
+
+@dataclass
+class ReconcileReport:
+    desired: int = 0
+    running: int = 0
+    started: int = 0
+    stopped: int = 0
+    updated: int = 0
+    failed: int = 0
+    skipped: bool = False  # сверку выполняет другая реплика
+    seconds: float = 0.0
+    errors: list = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def plan(desired: dict, running: dict, routes: Optional[dict] = None):
+    # desired: schedule_id -> входные данные Workflow; running: schedule_id -> spec из memo (None - нет memo)
+    routes = task_queue_routes() if routes is None else routes
+    to_start = [schedule_id for schedule_id in desired if schedule_id not in running]
+    to_stop = [schedule_id for schedule_id in running if schedule_id not in desired]
+    to_update = [
+        schedule_id for schedule_id, input_data in desired.items()
+        if schedule_id in running and running[schedule_id] != spec_of(input_data, routes)
+    ]
+    return to_start, to_stop, to_update
+
+
+async def load_desired(db) -> dict:
+    stmt = (
+        select(
+            models.Schedule.id,
+            models.Schedule.command_id,
+            models.Schedule.cron_expression,
+            models.Schedule.priority,
+            models.Schedule.jitter_seconds,
+            models.Command.device_id,
+            models.Device.device_type,
+            models.Device.ip_address,
+        )
+        .join(models.Command, models.Schedule.command_id == models.Command.id)
+        .join(models.Device, models.Command.device_id == models.Device.id)
+        .where(
+            models.Schedule.is_active.is_(True),
+            # Удаленные расписания и устройства (до окончания очистки) остаются только в остановленном виде
+            models.Schedule.deleted_at.is_(None),
+            models.Device.deleted_at.is_(None),
+        )
+    )
+    result = await db.stream(stmt.execution_options(yield_per=10000))
+    desired = {}
+    async for row in result:
+        desired[str(row.id)] = workflow_input(
+            row.id, row.command_id, row.device_id, row.device_type, row.cron_expression, row.priority,
+            row.jitter_seconds, row.ip_address)
+    return desired
+
+
+async def load_running(client) -> dict:
+    query = f"WorkflowType = '{WORKFLOW_TYPE}' AND ExecutionStatus = 'Running'"
+    running = {}
+    async for execution in client.list_workflows(query, page_size=1000):
+        if not execution.id.startswith(WORKFLOW_ID_PREFIX):
+            continue
+        running[execution.id[len(WORKFLOW_ID_PREFIX):]] = await execution.memo_value(SPEC_MEMO_KEY, None)
+    return running
+
+
+async def reconcile(client, session_factory, concurrency: Optional[int] = None) -> ReconcileReport:
+    concurrency = concurrency or int(os.getenv("RECONCILE_CONCURRENCY", "50"))
+    report = ReconcileReport()
+    started_at = time.perf_counter()
+
+    async with session_factory() as lock_db:
+        # Сессионная блокировка на отдельном соединении в режиме autocommit: соединение занято до конца прохода,
+        # но транзакция не открыта, и list_workflows и RPC к Temporal не удерживают xmin и не мешают vacuum
+        lock_connection = await lock_db.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+        locked = (await lock_db.execute(text("SELECT pg_try_advisory_lock(:key)"),
+                                        {"key": RECONCILE_LOCK_KEY})).scalar()
+        if not locked:
+            report.skipped = True
+            return report
+        try:
+            # Сначала фактическое состояние, затем желаемое: расписание, созданное или измененное через API во время
+            # прохода, попадает в desired уже новым (USE_EXISTING/перезапуск с новым spec), а не останавливается
+            # и не перезапускается со старыми параметрами
+            running = await load_running(client)
+            # Короткая транзакция только на чтение desired, действия в Temporal выполняются уже без нее
+            async with session_factory() as db:
+                desired = await load_desired(db)
+            report.desired, report.running = len(desired), len(running)
+            to_start, to_stop, to_update = plan(desired, running)
+
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def apply(action: str, schedule_id: str):
+                async with semaphore:
+                    try:
+                        if action == "stop":
+                            if await stop_schedule_workflow(client, schedule_id, reason="schedule is not active"):
+                                report.stopped += 1
+                        else:
+                            await start_schedule_workflow(client, desired[schedule_id], replace=action == "update")
+                            if action == "update":
+                                report.updated += 1
+                            else:
+                                report.started += 1
+                    except Exception as e:
+                        report.failed += 1
+                        # В отчете достаточно первых ошибок, остальные видны в логе
+                        if len(report.errors) < 20:
+                            report.errors.append(f"{action} {schedule_id}: {e}")
+                        logger.warning(f"Reconcile {action} failed for schedule {schedule_id}: {e}")
+
+            await asyncio.gather(
+                *(apply("start", schedule_id) for schedule_id in to_start),
+                *(apply("stop", schedule_id) for schedule_id in to_stop),
+                *(apply("update", schedule_id) for schedule_id in to_update),
+            )
+        finally:
+            try:
+                await lock_db.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": RECONCILE_LOCK_KEY})
+            except Exception as e:
+                # Соединение с неснятой блокировкой не должно вернуться в пул: закрытое соединение снимает ее
+                logger.warning(f"Reconcile lock release failed, dropping connection: {e}")
+                await lock_connection.invalidate()
+
+    report.seconds = round(time.perf_counter() - started_at, 3)
+    logger.info(f"Reconciled schedules: desired={report.desired}, running={report.running}, "
+                f"started={report.started}, stopped={report.stopped}, updated={report.updated}, "
+                f"failed={report.failed} in {report.seconds}s")
+    return report
+
+
+# Отчет последнего прохода (GET /reconcile/)
+last_report: Optional[ReconcileReport] = None
+
+
+async def run_periodically(get_client, session_factory):
+    # Фоновая сверка в процессе API
+    global last_report
+    interval = float(os.getenv("RECONCILE_INTERVAL_SECONDS", "300"))
+    if interval <= 0:
+        return
+    # Небольшая задержка после старта: Temporal может подниматься одновременно с API
+    await asyncio.sleep(float(os.getenv("RECONCILE_START_DELAY_SECONDS", "10")))
+    while True:
+        try:
+            last_report = await reconcile(await get_client(), session_factory)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Schedule reconciliation failed: {e}", exc_info=True)
+        await asyncio.sleep(interval)
@@ -0,0 +1,71 @@
+# routers/app/rollups.py
+'''
+Агрегаты (rollups) результатов выполнения по интервалам времени.
+
+Таблица result_rollups хранит для каждого интервала (5 минут и 1 час), устройства и команды:
+    - число результатов всего, успешных и неуспешных;
+    - число, сумму и максимум длительностей выполнения;
+    - гистограмму длительностей по фиксированным границам DURATION_BUCKETS_MS.
+
+Строки обновляются инкрементально на пути приема результата (app/projections.py), статистика
+(GET /stats/) читает только агрегаты, а не сырые command_results. Гистограммы складываются между
+интервалами и устройствами, поэтому процентили считаются для любой группировки; точность процентиля
+ограничена шириной корзины (внутри корзины значение интерполируется линейно).
+'''
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Sequence
+
+# Интервалы агрегации: имя -> длина в секундах
+GRANULARITIES = {
+    "5m": 300,
+    "1h": 3600,
+}
+
+# Верхние границы корзин гистограммы длительностей (мс), последняя корзина - все, что больше
+DURATION_BUCKETS_MS = (100, 250, 500, 1000, 2000, 3000, 5000, 7500, 10000, 30000, 60000)
+
+# Колонки гистограммы в result_rollups, по одной на корзину
+HISTOGRAM_COLUMNS = [f"duration_le_{bound}" for bound in DURATION_BUCKETS_MS] + ["duration_le_inf"]
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def bucket_start(moment: datetime, seconds: int) -> datetime:
+    # Начало интервала длиной seconds, в который попадает moment (границы от эпохи, в UTC)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    offset = int((moment - _EPOCH).total_seconds()) // seconds * seconds
+    return _EPOCH + timedelta(seconds=offset)
+
+
+def histogram_index(duration_ms: int) -> int:
+    # Номер корзины гистограммы для длительности
+    for index, bound in enumerate(DURATION_BUCKETS_MS):
+        if duration_ms <= bound:
+            return index
+    return len(DURATION_BUCKETS_MS)
+
+
+def percentile(histogram: Sequence[int], pct: float, max_ms: Optional[int] = None) -> Optional[float]:
+    # Оценка процентиля по гистограмме: линейная интерполяция внутри корзины,
+    # для последней (открытой) корзины верхней границей служит максимум длительности
+    total = sum(histogram)
+    if total == 0:
+        return None
+    target = total * pct / 100.0
+    cumulative = 0
+    for index, count in enumerate(histogram):
+        if count == 0:
+            continue
+        if cumulative + count >= target:
+            lower = DURATION_BUCKETS_MS[index - 1] if index > 0 else 0
+            upper = DURATION_BUCKETS_MS[index] if index < len(DURATION_BUCKETS_MS) else max_ms
+            if upper is None:
+                return float(lower)
+            if max_ms is not None:
+                upper = min(upper, max_ms)
+                lower = min(lower, upper)
+            return lower + (upper - lower) * (target - cumulative) / count
+        cumulative += count
+    return float(max_ms) if max_ms is not None else float(DURATION_BUCKETS_MS[-1])
+
@@ -0,0 +1,56 @@
+# routers/app/routers/admin.py
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+
+from app.profiling import SERVICES, is_authorized, profile_store, profiling_token
+
+# Служебные эндпоинты профилирования (см. app/profiling.py)
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+async def require_profiling_token(x_profile_token: Optional[str] = Header(None)):
+    if not profiling_token():
+        raise HTTPException(status_code=404, detail="Профилирование выключено (PROFILING_TOKEN не задан)")
+    if not is_authorized(x_profile_token):
+        raise HTTPException(status_code=403, detail="Неверный X-Profile-Token")
+
+
+class ProfilingArm(BaseModel):
+    service: str = Field(..., example="executor")
+    count: int = Field(..., ge=0, le=1000, description="Сколько следующих задач профилировать, 0 - выключить")
+
+
+@router.get("/profiles/", dependencies=[Depends(require_profiling_token)])
+async def list_profiles(limit: int = Query(50, ge=1, le=200)):
+    """
+    Последние сохраненные профили (API, Executor, Worker) и число задач, которые еще будут профилированы.
+    """
+    return {"profiles": await profile_store.list(limit), "armed": await profile_store.armed()}
+
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_profiling_token)])
+async def read_profile(profile_id: str):
+    """
+    Профиль в формате speedscope: файл открывается на https://www.speedscope.app.
+    """
+    data = await profile_store.get(profile_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден или удален по TTL")
+    return Response(
+        content=data,
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.speedscope.json"'},
+    )
+
+
+@router.post("/profiles/arm", dependencies=[Depends(require_profiling_token)])
+async def arm_profiling(arm: ProfilingArm):
+    """
+    Профилировать count следующих задач Executor'а или Activity Worker'а (на всех репликах вместе).
+    """
+    if arm.service not in SERVICES:
+        raise HTTPException(status_code=422, detail=f"Неизвестный сервис '{arm.service}', ожидается один из {list(SERVICES)}")
+    return {"service": arm.service, "count": await profile_store.arm(arm.service, arm.count)}
@@ -1,10 +1,14 @@
 # routers/app/routers/commands.py
-from fastapi import APIRouter, Depends, HTTPException, status, Path
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import delete as sqlalchemy_delete
 from app import models, schemas
 from app.database import get_db
+from app.events import broadcaster, result_event
+from app.on_demand import runner
+import json
+import time
 import uuid
 import logging
 
@@ -17,7 +21,7 @@ router = APIRouter(prefix="/devices/{device_id}/commands", tags=["commands"])
 command_by_id_router = APIRouter(prefix="/commands", tags=["commands"])
 
 async def get_device_or_404(device_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
-    stmt = select(models.Device).where(models.Device.id == device_id)
+    stmt = select(models.Device).where(models.Device.id == device_id, models.Device.deleted_at.is_(None))
     result = await db.execute(stmt)
     device = result.scalar_one_or_none()
     if device is None:
@@ -72,19 +76,18 @@ async def read_command_for_device(
         command_id: uuid.UUID,
         db: AsyncSession = Depends(get_db)
 ):
-    # Проверяем, что устройство существует
-    await get_device_or_404(device_id, db)
-
-    # Получаем конкретную команду, принадлежащую данному устройству
-    stmt = select(models.Command).where(
-        models.Command.id == command_id,
-        models.Command.device_id == device_id
+    # Устройство и принадлежащая ему команда одним запросом: LEFT JOIN отличает отсутствующее устройство
+    stmt = (
+        select(models.Device.id, models.Command)
+        .outerjoin(models.Command, (models.Command.device_id == models.Device.id) & (models.Command.id == command_id))
+        .where(models.Device.id == device_id, models.Device.deleted_at.is_(None))
     )
-    result = await db.execute(stmt)
-    command = result.scalar_one_or_none()
-    if command is None:
+    row = (await db.execute(stmt)).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Device not found")
+    if row.Command is None:
         raise HTTPException(status_code=404, detail="Command not found for this device")
-    return command
+    return row.Command
 
 
 @command_by_id_router.get("/{command_id}", response_model=schemas.Command)
@@ -96,8 +99,12 @@ async def read_command_by_id(
     logger.info(f"Attempting to fetch command with ID: {command_id}")
 
     try:
-        # Создаем SQL-запрос для выборки команды по ID
-        stmt = select(models.Command).where(models.Command.id == command_id)
+        # Создаем SQL-запрос для выборки команды по ID (команды удаленных устройств не возвращаются)
+        stmt = (
+            select(models.Command)
+            .join(models.Device, models.Command.device_id == models.Device.id)
+            .where(models.Command.id == command_id, models.Device.deleted_at.is_(None))
+        )
 
         # Выполняем запрос асинхронно
         result = await db.execute(stmt)
@@ -129,3 +136,81 @@ async def read_command_by_id(
             detail="Internal server error while fetching command"
         )
 
+
+
+# POST /commands/{command_id}/run - выполнить команду сейчас и дождаться результата (см. app/on_demand.py)
+@command_by_id_router.post("/{command_id}/run", response_model=schemas.CommandRunResult)
+async def run_command(
+        command_id: uuid.UUID = Path(..., description="The ID of the command to run"),
+        timeout_seconds: float = Query(30.0, gt=0, le=120, description="Сколько ждать результат"),
+        save: bool = Query(True, description="Сохранить результат в command_results"),
+        db: AsyncSession = Depends(get_db)
+):
+    started = time.monotonic()
+    stmt = (
+        select(models.Command, models.Device)
+        .join(models.Device, models.Command.device_id == models.Device.id)
+        .where(models.Command.id == command_id, models.Device.deleted_at.is_(None))
+    )
+    row = (await db.execute(stmt)).first()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Command with ID {command_id} not found")
+    command, device = row
+    # Транзакция чтения завершается: соединение с БД возвращается в пул на время ожидания устройства
+    await db.rollback()
+
+    run_id = uuid.uuid4()
+    try:
+        reply_key = await runner.dispatch(run_id, device, command)
+        reply = await runner.wait(reply_key, timeout_seconds)
+    except Exception as e:
+        logger.error(f"On-demand run {run_id} of command {command_id} failed: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Task broker is unavailable")
+    if reply is None:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"No result for run {run_id} within {timeout_seconds:g}s",
+        )
+
+    parsed = json.loads(reply["parsed"]) if reply.get("parsed") else None
+    duration_ms = int(reply["duration_ms"]) if reply.get("duration_ms") else None
+    result_id = None
+    saved = False
+    if save:
+        # Результат без расписания (schedule_id NULL); проекции расписаний не обновляются
+        db_result = models.CommandResult(
+            device_id=device.id,
+            output=reply.get("output"),
+            parsed=parsed,
+            status=reply.get("status", "failed"),
+            duration_ms=duration_ms,
+            idempotency_key=str(run_id),
+        )
+        try:
+            db.add(db_result)
+            await db.commit()
+            await db.refresh(db_result)
+            saved = True
+        except Exception as e:
+            # Команда на устройстве уже выполнена: вывод возвращается клиенту, saved=false - результат не сохранен
+            await db.rollback()
+            logger.error(f"Failed to save on-demand run {run_id} of command {command_id}: {e}", exc_info=True)
+        if saved:
+            await broadcaster.publish(result_event(db_result))
+            result_id = db_result.id
+
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+    logger.info(f"On-demand run {run_id} of command {command_id} finished with status '{reply.get('status')}' "
+                f"in {elapsed_ms} ms (device {duration_ms} ms)")
+    return {
+        "run_id": run_id,
+        "command_id": command.id,
+        "device_id": device.id,
+        "result_id": result_id,
+        "saved": saved,
+        "status": reply.get("status", "failed"),
+        "output": reply.get("output"),
+        "parsed": parsed,
+        "duration_ms": duration_ms,
+        "elapsed_ms": elapsed_ms,
+    }
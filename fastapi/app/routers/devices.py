@@ -1,19 +1,27 @@
 # routers/app/routers/devices.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import delete as sqlalchemy_delete
+from sqlalchemy import delete as sqlalchemy_delete, func, or_
+from typing import List, Optional
 from app import models, schemas
 from app.database import get_db
+from app.purge import new_job, schedule_ids_of, stop_workflows
+from app.temporal_client import get_temporal_client
+import base64
+import ipaddress
+import logging
 import uuid
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 
 @router.post("/", response_model=schemas.Device, status_code=status.HTTP_201_CREATED)
 async def create_device(device: schemas.DeviceCreate, db: AsyncSession = Depends(get_db)):
-    # Проверка на уникальность IP
-    stmt = select(models.Device).where(models.Device.ip_address == device.ip_address)
+    # Проверка на уникальность IP (среди неудаленных устройств)
+    stmt = select(models.Device).where(models.Device.ip_address == device.ip_address, models.Device.deleted_at.is_(None))
     result = await db.execute(stmt)
     db_device = result.scalar_one_or_none()
     if db_device:
@@ -29,15 +37,78 @@ async def create_device(device: schemas.DeviceCreate, db: AsyncSession = Depends
 
 @router.get("/", response_model=list[schemas.Device])
 async def read_devices(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    stmt = select(models.Device).offset(skip).limit(limit)
+    stmt = select(models.Device).where(models.Device.deleted_at.is_(None)).offset(skip).limit(limit)
     result = await db.execute(stmt)
     devices = result.scalars().all()
     return devices
 
 
+def _parse_subnet(value: str) -> str:
+    try:
+        return str(ipaddress.ip_network(value, strict=False))
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Некорректная подсеть: {value}")
+
+
+def _parse_tags(values: List[str]) -> dict:
+    tags = {}
+    for value in values:
+        key, sep, tag_value = value.partition("=")
+        if not sep or not key:
+            raise HTTPException(status_code=422, detail=f"Некорректный фильтр по атрибуту: {value}, ожидается key=value")
+        tags[key] = tag_value
+    return tags
+
+
+def _encode_ip_cursor(ip_address: str) -> str:
+    return base64.urlsafe_b64encode(ip_address.encode()).decode().rstrip("=")
+
+
+def _decode_ip_cursor(cursor: str) -> str:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return str(ipaddress.ip_address(base64.urlsafe_b64decode(padded.encode()).decode()))
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=422, detail="Некорректный курсор пагинации")
+
+
+@router.get("/query/", response_model=schemas.DevicePage)
+async def query_devices(
+    subnet: List[str] = Query([], description="Подсеть, например 10.20.0.0/16 (несколько - любая из них)"),
+    device_type: List[str] = Query([], description="Тип устройства (несколько - любой из них)"),
+    tag: List[str] = Query([], description="Атрибут key=value (несколько - все сразу)"),
+    cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+    limit: int = Query(500, ge=1, le=5000),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Выборка устройств парка одним индексным запросом: вхождение в подсеть (GiST по inet),
+    тип устройства (btree) и атрибуты (GIN по tags). Устройства упорядочены по IP-адресу,
+    следующая страница - по next_cursor.
+    """
+    stmt = select(models.Device).where(models.Device.deleted_at.is_(None))
+    if subnet:
+        stmt = stmt.where(or_(*(models.Device.ip_address.op("<<=")(_parse_subnet(value)) for value in subnet)))
+    if device_type:
+        stmt = stmt.where(models.Device.device_type.in_(device_type))
+    if tag:
+        stmt = stmt.where(models.Device.tags.contains(_parse_tags(tag)))
+    if cursor:
+        stmt = stmt.where(models.Device.ip_address > _decode_ip_cursor(cursor))
+    stmt = stmt.order_by(models.Device.ip_address).limit(limit + 1)
+
+    result = await db.execute(stmt)
+    devices = result.scalars().all()
+    next_cursor = None
+    if len(devices) > limit:
+        devices = devices[:limit]
+        next_cursor = _encode_ip_cursor(devices[-1].ip_address)
+    return {"items": devices, "next_cursor": next_cursor}
+
+
 @router.get("/{device_id}", response_model=schemas.Device)
 async def read_device(device_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
-    stmt = select(models.Device).where(models.Device.id == device_id)
+    stmt = select(models.Device).where(models.Device.id == device_id, models.Device.deleted_at.is_(None))
     result = await db.execute(stmt)
     device = result.scalar_one_or_none()
     if device is None:
@@ -45,15 +116,28 @@ async def read_device(device_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
     return device
 
 
-@router.delete("/{device_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/{device_id}", response_model=schemas.PurgeJob, status_code=status.HTTP_202_ACCEPTED)
 async def delete_device(device_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
-    stmt = select(models.Device).where(models.Device.id == device_id)
+    """
+    Удалить устройство и остановить Workflow его расписаний: оно сразу скрыто из API, а команды,
+    расписания и их результаты очищаются фоновыми пачками (см. app/purge.py). Прогресс - GET /purge/{job_id}.
+    """
+    stmt = select(models.Device).where(models.Device.id == device_id, models.Device.deleted_at.is_(None))
     result = await db.execute(stmt)
     device = result.scalar_one_or_none()
     if device is None:
         raise HTTPException(status_code=404, detail="Device not found")
 
-    # Удаление устройства
-    await db.delete(device)
+    # Отметка удаления и задание очистки - одна короткая транзакция, результаты здесь не затрагиваются
+    device.deleted_at = func.now()
+    job = new_job("device", device_id)
+    db.add(job)
     await db.commit()
-    # FastAPI автоматически вернет 204 No Content для функций, которые ничего не возвращают
+    await db.refresh(job)
+
+    # Как при удалении расписания: Workflow не должны запускать команды удаленного устройства до очистки
+    try:
+        await stop_workflows(get_temporal_client, await schedule_ids_of(db, job), reason="device deleted")
+    except Exception as e:
+        logger.warning(f"Failed to stop Workflows of deleted device {device_id}, purge job will retry: {e}")
+    return job
@@ -0,0 +1,63 @@
+# routers/app/routers/purge.py
+import uuid
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import desc, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app import models, schemas
+from app.database import get_db
+
+# Задания фоновой очистки удаленных устройств и расписаний (см. app/purge.py)
+router = APIRouter(prefix="/purge", tags=["purge"])
+
+
+@router.get("/", response_model=List[schemas.PurgeJob])
+async def read_purge_jobs(
+    status: Optional[str] = Query(None, description="pending, running, done или failed"),
+    entity_id: Optional[uuid.UUID] = Query(None, description="ID удаленного устройства или расписания"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Задания очистки, сначала новые.
+    """
+    stmt = select(models.PurgeJob)
+    if status:
+        stmt = stmt.where(models.PurgeJob.status == status)
+    if entity_id:
+        stmt = stmt.where(models.PurgeJob.entity_id == entity_id)
+    stmt = stmt.order_by(desc(models.PurgeJob.created_at)).limit(limit)
+    return (await db.execute(stmt)).scalars().all()
+
+
+@router.get("/{job_id}", response_model=schemas.PurgeJob)
+async def read_purge_job(job_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    """
+    Состояние и прогресс задания очистки.
+    """
+    job = await db.get(models.PurgeJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание очистки не найдено")
+    return job
+
+
+@router.post("/{job_id}/retry", response_model=schemas.PurgeJob)
+async def retry_purge_job(job_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    """
+    Повторить упавшее задание: очистка продолжится с того места, где остановилась.
+    """
+    stmt = (
+        update(models.PurgeJob)
+        .where(models.PurgeJob.id == job_id, models.PurgeJob.status == "failed")
+        .values(status="pending", error=None, updated_at=func.now())
+        .returning(models.PurgeJob)
+        .execution_options(synchronize_session=False)
+    )
+    job = (await db.execute(stmt)).scalar_one_or_none()
+    if job is None:
+        raise HTTPException(status_code=409, detail="Повторить можно только существующее задание в статусе failed")
+    await db.commit()
+    return job
@@ -0,0 +1,38 @@
+# routers/app/routers/reconcile.py
+import logging
+
+from fastapi import APIRouter, HTTPException
+from app import reconciler
+from app.database import AsyncSessionLocal
+from app.temporal_client import get_temporal_client
+
+logger = logging.getLogger(__name__)
+
+# Сверка расписаний PostgreSQL с Workflow Temporal (см. app/reconciler.py)
+router = APIRouter(prefix="/reconcile", tags=["reconcile"])
+
+
+@router.post("/")
+async def run_reconcile():
+    """
+    Немедленно сверить активные расписания с работающими Workflow и исправить расхождения.
+    """
+    try:
+        client = await get_temporal_client()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Temporal недоступен: {e}")
+    report = await reconciler.reconcile(client, AsyncSessionLocal)
+    if report.skipped:
+        raise HTTPException(status_code=409, detail="Сверка уже выполняется")
+    reconciler.last_report = report
+    return report.as_dict()
+
+
+@router.get("/")
+async def read_last_reconcile():
+    """
+    Отчет последней сверки в этом процессе API.
+    """
+    if reconciler.last_report is None:
+        raise HTTPException(status_code=404, detail="Сверка еще не выполнялась")
+    return reconciler.last_report.as_dict()
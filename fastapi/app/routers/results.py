@@ -1,14 +1,23 @@
 # routers/app/routers/results.py
+import asyncio
+import json
 import logging
 import uuid
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status, Path
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import desc
+from sqlalchemy import desc, func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from datetime import datetime
 from app import models, schemas
-from app.database import get_db
+from app.database import AsyncSessionLocal, get_db
+from app.events import broadcaster, result_event
+from app.output_reads import OUTPUT_CHUNK_CHARS, output_size, parse_range, read_byte_range, read_chunk, read_lines
+from app.pagination import encode_cursor, keyset_after
+from app.projections import update_latest_result, update_rollups
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +30,7 @@ router = APIRouter(
 
 @router.post("/", response_model=schemas.CommandResult, status_code=status.HTTP_201_CREATED)
 async def create_or_update_result_for_schedule(
+    device_id: uuid.UUID,
     schedule_id: uuid.UUID,
     result: schemas.CommandResultCreate,
     db: AsyncSession = Depends(get_db)
@@ -29,15 +39,43 @@ async def create_or_update_result_for_schedule(
 
     logger.info(f"Создание/обновление результата для ID расписания: {schedule_id}")
     try:
-        # Создать новый объект CommandResult
-        db_result = models.CommandResult(
+        values = dict(
             schedule_id=schedule_id,
+            device_id=device_id,
             output=result.output,
-            status=result.status
+            parsed=result.parsed,
+            status=result.status,
+            duration_ms=result.duration_ms,
+            idempotency_key=result.idempotency_key,
         )
-        db.add(db_result)
+        if result.idempotency_key:
+            # Вставка только если результата с этим ключом еще нет (ON CONFLICT DO NOTHING)
+            stmt = (
+                insert(models.CommandResult)
+                .values(**values)
+                .on_conflict_do_nothing(index_elements=[models.CommandResult.idempotency_key])
+                .returning(models.CommandResult)
+            )
+            db_result = (await db.execute(stmt)).scalar_one_or_none()
+            if db_result is None:
+                # Повтор уже сохраненного результата: возвращаем сохраненную строку, проекции не трогаем
+                stmt = select(models.CommandResult).where(
+                    models.CommandResult.idempotency_key == result.idempotency_key)
+                db_result = (await db.execute(stmt)).scalar_one()
+                logger.info(f"Результат с ключом {result.idempotency_key} уже сохранен (ID: {db_result.id}), повтор пропущен")
+                return db_result
+        else:
+            # Создать новый объект CommandResult
+            db_result = models.CommandResult(**values)
+            db.add(db_result)
+            await db.flush()
+        # Проекции обновляются в той же транзакции
+        await update_latest_result(db, db_result)
+        await update_rollups(db, db_result)
         await db.commit()
         await db.refresh(db_result)
+        # Событие для подписчиков GET /results/stream/ (после commit: подписчик сразу может прочитать результат)
+        await broadcaster.publish(result_event(db_result))
         logger.info(f"Успешно создан результат с ID: {db_result.id} для ID расписания: {schedule_id}")
         return db_result
     except HTTPException:
@@ -81,6 +119,65 @@ async def read_result_by_id(
         )
 
 
+@router.get("/{result_id}/output")
+async def read_result_output(
+    request: Request,
+    device_id: uuid.UUID,
+    schedule_id: uuid.UUID,
+    result_id: uuid.UUID = Path(..., description="ID результата команды"),
+    head: Optional[int] = Query(None, ge=1, le=100000, description="Только первые N строк"),
+    tail: Optional[int] = Query(None, ge=1, le=100000, description="Только последние N строк"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Вывод команды текстом без загрузки целиком в память API: первые/последние N строк (head/tail),
+    диапазон байт (заголовок Range) или весь вывод потоком по частям.
+    """
+    if head and tail:
+        raise HTTPException(status_code=422, detail="Параметры head и tail взаимоисключающие")
+    size = await output_size(db, result_id)
+    if size is None:
+        raise HTTPException(status_code=404, detail="Результат команды не найден")
+
+    media_type = "text/plain; charset=utf-8"
+    if head or tail:
+        text = await read_lines(db, result_id, head or tail, from_end=bool(tail))
+        return Response(content=text, media_type=media_type)
+
+    range_header = request.headers.get("range")
+    if range_header:
+        byte_range = parse_range(range_header, size)
+        if byte_range is None:
+            raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                                detail="Диапазон не выполним", headers={"Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        content = await read_byte_range(db, result_id, start, end)
+        return Response(
+            content=content,
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type=media_type,
+            headers={"Content-Range": f"bytes {start}-{end}/{size}", "Accept-Ranges": "bytes"},
+        )
+
+    async def chunks():
+        # Каждая часть читается своей короткой сессией: соединение с БД не занято, пока клиент читает поток
+        offset = 0
+        while True:
+            async with AsyncSessionLocal() as chunk_db:
+                chunk = await read_chunk(chunk_db, result_id, offset, OUTPUT_CHUNK_CHARS)
+            if chunk:
+                yield chunk.encode()
+            if len(chunk) < OUTPUT_CHUNK_CHARS:
+                return
+            offset += len(chunk)
+
+    return StreamingResponse(
+        chunks(),
+        media_type=media_type,
+        headers={"Content-Length": str(size), "Accept-Ranges": "bytes"},
+    )
+
+
 # Новый роутер для эндпоинтов на уровне устройства
 device_level_router = APIRouter(tags=["device-results"])
 
@@ -116,4 +213,139 @@ async def read_results_for_device(
         return results
     except Exception as e:
         logger.error(f"Ошибка базы данных при получении результатов для устройства {device_id}: {e}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+# Роутер для запросов по результатам всего парка устройств
+fleet_results_router = APIRouter(prefix="/results", tags=["fleet-results"])
+
+
+@fleet_results_router.get("/parsed/", response_model=List[schemas.CommandResult])
+async def query_parsed_results(
+    contains: str = Query(..., description='JSON для сравнения parsed @> contains, например {"interfaces": [{"status": "down"}]}'),
+    device_type: Optional[str] = Query(None, description="Тип устройства"),
+    result_status: Optional[str] = Query(None, alias="status", description="Статус выполнения"),
+    skip: int = 0,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Найти результаты, разобранный вывод которых содержит заданный JSON-фрагмент.
+    Запрос выполняется в БД по GIN-индексу на command_results.parsed.
+    """
+    try:
+        fragment = json.loads(contains)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Параметр contains должен быть корректным JSON")
+
+    logger.info(f"Поиск результатов по parsed @> {fragment}, тип устройства: {device_type}")
+    stmt = select(models.CommandResult).where(models.CommandResult.parsed.contains(fragment))
+    if result_status:
+        stmt = stmt.where(models.CommandResult.status == result_status)
+    if device_type:
+        stmt = (
+            stmt.join(models.Schedule, models.CommandResult.schedule_id == models.Schedule.id)
+            .join(models.Command, models.Schedule.command_id == models.Command.id)
+            .join(models.Device, models.Command.device_id == models.Device.id)
+            .where(models.Device.device_type == device_type)
+        )
+    stmt = stmt.order_by(desc(models.CommandResult.executed_at)).offset(skip).limit(limit)
+
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+@fleet_results_router.get("/search/", response_model=schemas.CommandResultPage)
+async def search_results(
+    q: str = Query(..., min_length=3, description="Строка для поиска в выводе команд"),
+    mode: str = Query("substring", pattern="^(substring|words)$",
+                      description="substring - подстрока (триграммный индекс), words - слова (полнотекстовый индекс)"),
+    device_id: Optional[uuid.UUID] = None,
+    schedule_id: Optional[uuid.UUID] = None,
+    result_status: Optional[str] = Query(None, alias="status"),
+    since: Optional[datetime] = Query(None, description="executed_at >= since"),
+    until: Optional[datetime] = Query(None, description="executed_at < until"),
+    cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Поиск по выводу команд всего парка (серийный номер, текст ошибки, версия).
+    Результаты упорядочены по дате выполнения, сначала новые; следующая страница - по next_cursor.
+    """
+    logger.info(f"Поиск по выводу команд: q='{q}', mode={mode}, устройство: {device_id}, расписание: {schedule_id}")
+    if mode == "words":
+        condition = models.output_tsvector().op("@@")(func.websearch_to_tsquery(literal_column("'simple'::regconfig"), q))
+    else:
+        escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        condition = models.CommandResult.output.ilike(f"%{escaped}%", escape="\\")
+
+    stmt = select(models.CommandResult).where(condition)
+    if device_id:
+        stmt = stmt.where(models.CommandResult.device_id == device_id)
+    if schedule_id:
+        stmt = stmt.where(models.CommandResult.schedule_id == schedule_id)
+    if result_status:
+        stmt = stmt.where(models.CommandResult.status == result_status)
+    if since:
+        stmt = stmt.where(models.CommandResult.executed_at >= since)
+    if until:
+        stmt = stmt.where(models.CommandResult.executed_at < until)
+    after = keyset_after(models.CommandResult.executed_at, models.CommandResult.id, cursor)
+    if after is not None:
+        stmt = stmt.where(after)
+    stmt = stmt.order_by(desc(models.CommandResult.executed_at), desc(models.CommandResult.id)).limit(limit + 1)
+
+    result = await db.execute(stmt)
+    rows = result.scalars().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].executed_at, rows[-1].id)
+    return {"items": rows, "next_cursor": next_cursor}
+
+
+# Интервал комментариев keep-alive в потоке событий: прокси не закрывают простаивающее соединение
+STREAM_KEEPALIVE_SECONDS = 15
+
+
+@fleet_results_router.get("/stream/")
+async def stream_results(
+    request: Request,
+    device_id: Optional[uuid.UUID] = Query(None, description="Только результаты устройства"),
+    schedule_id: Optional[uuid.UUID] = Query(None, description="Только результаты расписания"),
+    result_status: Optional[str] = Query(None, alias="status", description="Только результаты с этим статусом"),
+):
+    """
+    Поток новых результатов (Server-Sent Events) вместо периодического опроса GET /devices/{device_id}/results/.
+    Каждое событие 'result' содержит ID результата, расписание, устройство, статус, разобранный вывод и длительность;
+    полный вывод читается по ID результата.
+    """
+    subscriber = broadcaster.subscribe(
+        device_id=str(device_id) if device_id else None,
+        schedule_id=str(schedule_id) if schedule_id else None,
+        status=result_status,
+    )
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="Слишком много подписчиков, повторите позже")
+    logger.info(f"Подписка на поток результатов: устройство {device_id}, расписание {schedule_id}, "
+                f"статус {result_status} (подписчиков: {broadcaster.subscriber_count})")
+
+    async def events():
+        try:
+            # Комментарий сразу после подключения: клиент видит, что подписка установлена
+            yield ": subscribed\n\n"
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(subscriber.queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+            if subscriber.dropped:
+                logger.warning(f"Подписчик потока результатов пропустил {subscriber.dropped} событий (медленный клиент)")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -2,18 +2,44 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import func
 from app import models, schemas
 from app.database import get_db
+from app.purge import new_job
 from app.temporal_client import get_temporal_client
+from app.schedule_workflows import start_schedule_workflow, stop_schedule_workflow, workflow_input
+import logging
 import uuid
 from temporalio.client import Client
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 
+async def apply_schedule_to_temporal(db_schedule: models.Schedule, device: models.Device, replace: bool = False):
+    # Привести Workflow расписания в соответствие с записью в БД: активное - запустить (или перезапустить
+    # с новыми параметрами), неактивное - остановить. Ошибка не прерывает запрос: расхождение
+    # исправит фоновая сверка (app/reconciler.py)
+    try:
+        client: Client = await get_temporal_client()
+        if db_schedule.is_active:
+            await start_schedule_workflow(
+                client,
+                workflow_input(db_schedule.id, db_schedule.command_id, device.id, device.device_type,
+                               db_schedule.cron_expression, db_schedule.priority, db_schedule.jitter_seconds,
+                               device.ip_address),
+                replace=replace,
+            )
+        else:
+            await stop_schedule_workflow(client, db_schedule.id, reason="schedule deactivated")
+    except Exception as e:
+        logger.warning(f"Failed to apply schedule {db_schedule.id} to Temporal, reconciler will retry: {e}")
+
+
 # Вспомогательная функция для получения устройства или 404
 async def get_device_or_404(device_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
-    stmt = select(models.Device).where(models.Device.id == device_id)
+    stmt = select(models.Device).where(models.Device.id == device_id, models.Device.deleted_at.is_(None))
     result = await db.execute(stmt)
     device = result.scalar_one_or_none()
     if device is None:
@@ -21,25 +47,50 @@ async def get_device_or_404(device_id: uuid.UUID, db: AsyncSession = Depends(get
     return device
 
 
+# Вспомогательная функция: устройство и его команда одним запросом или 404
+async def get_device_and_command_or_404(device_id: uuid.UUID, command_id: uuid.UUID, db: AsyncSession):
+    # LEFT JOIN отличает отсутствующее устройство от чужой или отсутствующей команды
+    stmt = (
+        select(models.Device, models.Command)
+        .outerjoin(models.Command, (models.Command.device_id == models.Device.id) & (models.Command.id == command_id))
+        .where(models.Device.id == device_id, models.Device.deleted_at.is_(None))
+    )
+    row = (await db.execute(stmt)).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Device not found")
+    if row.Command is None:
+        raise HTTPException(status_code=404, detail="Command not found for this device")
+    return row.Device, row.Command
+
+
 # Вспомогательная функция для получения команды устройства или 404
 async def get_command_for_device_or_404(
         device_id: uuid.UUID,
         command_id: uuid.UUID,
         db: AsyncSession = Depends(get_db)
 ):
-    # Сначала проверяем, что устройство существует
-    await get_device_or_404(device_id, db)
+    _, command = await get_device_and_command_or_404(device_id, command_id, db)
+    return command
 
-    # Затем проверяем, что команда существует и принадлежит этому устройству
-    stmt = select(models.Command).where(
-        models.Command.id == command_id,
-        models.Command.device_id == device_id
+
+# Вспомогательная функция: устройство и расписание его команды одним запросом или 404
+async def get_device_and_schedule_or_404(
+        device_id: uuid.UUID, command_id: uuid.UUID, schedule_id: uuid.UUID, db: AsyncSession):
+    stmt = (
+        select(models.Device, models.Command.id.label("command_id"), models.Schedule)
+        .outerjoin(models.Command, (models.Command.device_id == models.Device.id) & (models.Command.id == command_id))
+        .outerjoin(models.Schedule, (models.Schedule.command_id == models.Command.id) & (models.Schedule.id == schedule_id)
+                   & models.Schedule.deleted_at.is_(None))
+        .where(models.Device.id == device_id, models.Device.deleted_at.is_(None))
     )
-    result = await db.execute(stmt)
-    command = result.scalar_one_or_none()
-    if command is None:
+    row = (await db.execute(stmt)).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Device not found")
+    if row.command_id is None:
         raise HTTPException(status_code=404, detail="Command not found for this device")
-    return command
+    if row.Schedule is None:
+        raise HTTPException(status_code=404, detail="Schedule not found for this command")
+    return row.Device, row.Schedule
 
 
 # POST /devices/{device_id}/commands/{command_id}/schedules - создать расписание для команды
@@ -54,14 +105,16 @@ async def create_schedule_for_command(
     Создать расписание для команды.
     Если расписание активно (is_active=True), запускает Temporal Workflow.
     """
-    # Проверяем, что команда существует и принадлежит устройству
-    await get_command_for_device_or_404(device_id, command_id, db)
+    # Проверяем, что команда существует и принадлежит устройству; устройство нужно для запуска Workflow
+    device, _ = await get_device_and_command_or_404(device_id, command_id, db)
 
     # Создаем новое расписание, связывая его с command_id
     db_schedule = models.Schedule(
         command_id=command_id,
         cron_expression=schedule.cron_expression,
-        is_active=schedule.is_active
+        is_active=schedule.is_active,
+        priority=schedule.priority,
+        jitter_seconds=schedule.jitter_seconds
     )
     db.add(db_schedule)
     await db.commit()
@@ -69,35 +122,7 @@ async def create_schedule_for_command(
 
     # Если расписание активно, запускаем Workflow в Temporal
     if schedule.is_active:
-        try:
-            # Получаем клиента Temporal
-            client: Client = await get_temporal_client()
-
-            # Определяем ID Workflow
-            workflow_id = f"schedule-execution-{db_schedule.id}"
-            task_queue_name = "scheduled-tasks"
-
-            # Подготавливаем аргументы для Workflow
-            workflow_input = {
-                "schedule_id": str(db_schedule.id),
-                "command_id": str(command_id),
-                "device_id": str(device_id),
-                "cron_expression": db_schedule.cron_expression,
-            }
-
-            # Запуск Workflow
-            handle = await client.start_workflow(
-                "ScheduleExecutionWorkflow",
-                workflow_input,
-                id=workflow_id,
-                task_queue=task_queue_name,
-                cron_schedule=db_schedule.cron_expression, # <-- Вот это место,изза которого не выполнялось
-            )
-            print(f"Started Temporal Workflow with Run ID: {handle.result_run_id}")
-
-        except Exception as e:
-            # Логируем ошибку, но не прерываем создание расписания
-            print(f"Warning: Failed to start/process Temporal Workflow for schedule {db_schedule.id}: {e}")
+        await apply_schedule_to_temporal(db_schedule, device)
 
     return db_schedule
 
@@ -116,7 +141,8 @@ async def read_schedules_for_command(
 
     # Получаем список расписаний для данной команды
     stmt = select(models.Schedule).where(
-        models.Schedule.command_id == command_id
+        models.Schedule.command_id == command_id,
+        models.Schedule.deleted_at.is_(None)
     ).offset(skip).limit(limit)
     result = await db.execute(stmt)
     schedules = result.scalars().all()
@@ -131,16 +157,61 @@ async def read_schedule_for_command(
         schedule_id: uuid.UUID,
         db: AsyncSession = Depends(get_db)
 ):
-    # Проверяем, что команда существует и принадлежит устройству
-    await get_command_for_device_or_404(device_id, command_id, db)
-
-    # Получаем конкретное расписание, принадлежащее данной команде
-    stmt = select(models.Schedule).where(
-        models.Schedule.id == schedule_id,
-        models.Schedule.command_id == command_id
-    )
-    result = await db.execute(stmt)
-    schedule = result.scalar_one_or_none()
-    if schedule is None:
-        raise HTTPException(status_code=404, detail="Schedule not found for this command")
+    # Устройство, команда и расписание проверяются одним запросом
+    _, schedule = await get_device_and_schedule_or_404(device_id, command_id, schedule_id, db)
     return schedule
+
+
+# PATCH /devices/{device_id}/commands/{command_id}/schedules/{schedule_id} - изменить расписание
+@router.patch("/{schedule_id}", response_model=schemas.Schedule)
+async def update_schedule_for_command(
+        device_id: uuid.UUID,
+        command_id: uuid.UUID,
+        schedule_id: uuid.UUID,
+        schedule_update: schemas.ScheduleUpdate,
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Изменить cron, приоритет или активность расписания.
+    Workflow перезапускается с новыми параметрами, при выключении - останавливается.
+    """
+    device, db_schedule = await get_device_and_schedule_or_404(device_id, command_id, schedule_id, db)
+
+    # Поля расписания обязательные, явный null означает "не менять"; jitter_seconds=null - вернуть глобальное окно
+    update_data = {key: value for key, value in schedule_update.model_dump(exclude_unset=True).items()
+                   if value is not None or key == "jitter_seconds"}
+    for key, value in update_data.items():
+        setattr(db_schedule, key, value)
+    await db.commit()
+    await db.refresh(db_schedule)
+
+    if update_data:
+        await apply_schedule_to_temporal(db_schedule, device, replace=True)
+    return db_schedule
+
+
+# DELETE /devices/{device_id}/commands/{command_id}/schedules/{schedule_id} - удалить расписание
+@router.delete("/{schedule_id}", response_model=schemas.PurgeJob, status_code=status.HTTP_202_ACCEPTED)
+async def delete_schedule_for_command(
+        device_id: uuid.UUID,
+        command_id: uuid.UUID,
+        schedule_id: uuid.UUID,
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Удалить расписание и остановить его Workflow.
+    Результаты расписания обрабатываются фоновыми пачками (см. app/purge.py), прогресс - GET /purge/{job_id}.
+    """
+    db_schedule = await read_schedule_for_command(device_id, command_id, schedule_id, db)
+    db_schedule.deleted_at = func.now()
+    job = new_job("schedule", schedule_id)
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+
+    try:
+        client: Client = await get_temporal_client()
+        await stop_schedule_workflow(client, schedule_id, reason="schedule deleted")
+    except Exception as e:
+        logger.warning(f"Failed to stop Workflow of deleted schedule {schedule_id}, reconciler will retry: {e}")
+    return job
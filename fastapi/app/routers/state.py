@@ -0,0 +1,75 @@
+# routers/app/routers/state.py
+import logging
+import uuid
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Path, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import case, func
+from app import models, schemas
+from app.database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Текущее состояние устройств по проекции latest_results (без сканирования истории command_results)
+router = APIRouter(tags=["state"])
+
+
+@router.get("/devices/{device_id}/latest/", response_model=List[schemas.LatestResult])
+async def read_latest_results_for_device(
+    device_id: uuid.UUID = Path(..., description="ID устройства"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Последний результат каждого расписания устройства.
+    """
+    stmt = (
+        select(models.LatestResult)
+        .where(models.LatestResult.device_id == device_id)
+        .order_by(models.LatestResult.executed_at.desc())
+    )
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+@router.get("/fleet/state/", response_model=List[schemas.DeviceState])
+async def read_fleet_state(
+    state_status: Optional[str] = Query(None, alias="status", pattern="^(success|failed)$",
+                                        description="Только устройства в этом состоянии"),
+    skip: int = 0,
+    limit: int = Query(1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Текущее состояние каждого устройства парка: свертка последних результатов его расписаний.
+    Устройство в состоянии 'failed', если последний результат хотя бы одного расписания не 'success'.
+    """
+    failed = func.sum(case((models.LatestResult.status != "success", 1), else_=0))
+    stmt = (
+        select(
+            models.LatestResult.device_id,
+            func.count().label("schedules"),
+            failed.label("failed"),
+            func.max(models.LatestResult.executed_at).label("last_executed_at"),
+        )
+        .group_by(models.LatestResult.device_id)
+        .order_by(models.LatestResult.device_id)
+    )
+    if state_status == "failed":
+        stmt = stmt.having(failed > 0)
+    elif state_status == "success":
+        stmt = stmt.having(failed == 0)
+    stmt = stmt.offset(skip).limit(limit)
+
+    result = await db.execute(stmt)
+    return [
+        {
+            "device_id": row.device_id,
+            "status": "failed" if row.failed else "success",
+            "schedules": row.schedules,
+            "failed": row.failed,
+            "last_executed_at": row.last_executed_at,
+        }
+        for row in result.all()
+    ]
@@ -0,0 +1,117 @@
+# routers/app/routers/stats.py
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import func
+from app import models, rollups, schemas
+from app.database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Статистика выполнения по агрегатам result_rollups (без сканирования command_results)
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+# Поле группировки -> колонка result_rollups
+GROUP_COLUMNS = {
+    "device": models.ResultRollup.device_id,
+    "command": models.ResultRollup.command_id,
+    "device_type": models.ResultRollup.device_type,
+    "bucket": models.ResultRollup.bucket_start,
+}
+
+# Самый длинный период одного запроса: число строк агрегатов растет с числом интервалов
+MAX_RANGE = {
+    "5m": timedelta(days=7),
+    "1h": timedelta(days=93),
+}
+
+
+@router.get("/", response_model=List[schemas.ExecutionStats])
+async def read_execution_stats(
+    group_by: str = Query("device_type", pattern="^(device|command|device_type|bucket)$",
+                          description="Группировка: устройство, команда, тип устройства или интервал времени"),
+    granularity: str = Query("1h", pattern="^(5m|1h)$", description="Интервал агрегатов"),
+    since: Optional[datetime] = Query(None, description="Начало периода (по умолчанию - сутки назад)"),
+    until: Optional[datetime] = Query(None, description="Конец периода (по умолчанию - сейчас)"),
+    device_id: Optional[uuid.UUID] = Query(None),
+    command_id: Optional[uuid.UUID] = Query(None),
+    device_type: Optional[str] = Query(None),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Число выполнений, доля успешных и процентили длительности за период.
+    group_by=bucket возвращает ряд по интервалам (тренд ошибок и длительности).
+    """
+    # Время без часового пояса считается UTC
+    until = _as_utc(until) if until else datetime.now(timezone.utc)
+    since = _as_utc(since) if since else until - timedelta(days=1)
+    if since >= until:
+        raise HTTPException(status_code=422, detail="Параметр since должен быть раньше until")
+    if until - since > MAX_RANGE[granularity]:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Период для интервала {granularity} не больше {MAX_RANGE[granularity].days} дней"
+        )
+
+    rollup = models.ResultRollup
+    histogram = [func.sum(getattr(rollup, name)) for name in rollups.HISTOGRAM_COLUMNS]
+    group_column = GROUP_COLUMNS[group_by]
+    stmt = (
+        select(
+            group_column.label("key"),
+            func.sum(rollup.total).label("total"),
+            func.sum(rollup.success).label("success"),
+            func.sum(rollup.failed).label("failed"),
+            func.sum(rollup.duration_count).label("duration_count"),
+            func.sum(rollup.duration_sum_ms).label("duration_sum_ms"),
+            func.max(rollup.duration_max_ms).label("duration_max_ms"),
+            *histogram,
+        )
+        .where(
+            rollup.granularity == granularity,
+            rollup.bucket_start >= rollups.bucket_start(since, rollups.GRANULARITIES[granularity]),
+            rollup.bucket_start < until,
+        )
+        .group_by(group_column)
+        .order_by(group_column)
+        .limit(limit)
+    )
+    if device_id is not None:
+        stmt = stmt.where(rollup.device_id == device_id)
+    if command_id is not None:
+        stmt = stmt.where(rollup.command_id == command_id)
+    if device_type is not None:
+        stmt = stmt.where(rollup.device_type == device_type)
+
+    result = await db.execute(stmt)
+    stats = []
+    for row in result.all():
+        counts = [int(value or 0) for value in row[len(row) - len(histogram):]]
+        stats.append({
+            "key": None if group_by == "bucket" or row.key is None else str(row.key),
+            "bucket_start": row.key if group_by == "bucket" else None,
+            "total": row.total,
+            "success": row.success,
+            "failed": row.failed,
+            "success_rate": round(row.success / row.total, 4) if row.total else None,
+            "duration_avg_ms": round(float(row.duration_sum_ms) / row.duration_count, 1) if row.duration_count else None,
+            "duration_p50_ms": _round(rollups.percentile(counts, 50, row.duration_max_ms)),
+            "duration_p95_ms": _round(rollups.percentile(counts, 95, row.duration_max_ms)),
+            "duration_p99_ms": _round(rollups.percentile(counts, 99, row.duration_max_ms)),
+            "duration_max_ms": row.duration_max_ms,
+        })
+    return stats
+
+
+def _as_utc(moment: datetime) -> datetime:
+    return moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
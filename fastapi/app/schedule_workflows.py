@@ -0,0 +1,177 @@
+# routers/app/schedule_workflows.py
+'''
+Управление Temporal Workflow расписаний со стороны API: запуск, перезапуск с новыми параметрами и остановка.
+
+Один активный Schedule - один cron-Workflow ScheduleExecutionWorkflow с ID schedule-execution-{schedule_id}.
+В memo Workflow записывается отпечаток параметров (spec), с которыми он запущен: по нему сверка
+(app/reconciler.py) находит Workflow, запущенные со старым cron, приоритетом или типом устройства.
+
+Сглаживание нагрузки: расписания с одинаковым cron ('*/1 * * * *', '0 * * * *') срабатывают в одну секунду.
+При включенном окне (поле jitter_seconds расписания или глобально SCHEDULE_JITTER_SECONDS) каждый запуск
+Workflow ждет детерминированное смещение start_offset_seconds (хеш schedule_id по модулю окна) до выполнения.
+
+Партиции очередей задач Temporal: TASK_QUEUE_ROUTES (JSON device_type -> партиция, например
+{"router": "routers", "legacy": "slow"}) направляет Workflow устройств этого типа в очередь
+scheduled-tasks-{партиция}, остальные - в общую scheduled-tasks. Activity выполняются в очереди своего Workflow,
+поэтому тяжелый класс устройств занимает только слоты Worker'ов своей партиции (WORKER_TASK_QUEUES,
+worker/workflows/task_queues.py). Очередь входит в отпечаток spec: после изменения маршрутов сверка
+перезапускает Workflow затронутых расписаний в новой очереди.
+'''
+import hashlib
+import json
+import logging
+import os
+import zlib
+from typing import Optional
+
+from temporalio.client import Client
+from temporalio.common import WorkflowIDConflictPolicy
+from temporalio.service import RPCError, RPCStatusCode
+
+logger = logging.getLogger(__name__)
+
+WORKFLOW_TYPE = "ScheduleExecutionWorkflow"
+TASK_QUEUE = "scheduled-tasks"
+# Должен совпадать с worker/workflows/completions.py (проверяет tests/test_unit/test_shared_constants.py)
+WORKFLOW_ID_PREFIX = "schedule-execution-"
+SPEC_MEMO_KEY = "spec"
+
+
+def task_queue_routes() -> dict:
+    routes = json.loads(os.getenv("TASK_QUEUE_ROUTES") or "{}")
+    if not isinstance(routes, dict):
+        raise ValueError("TASK_QUEUE_ROUTES must be a JSON object: device_type -> partition")
+    return routes
+
+
+def task_queue_for(device_type: Optional[str], routes: Optional[dict] = None) -> str:
+    # Очередь задач Temporal для Workflow устройства; имена должны совпадать с WORKER_TASK_QUEUES у Worker'ов
+    routes = task_queue_routes() if routes is None else routes
+    partition = routes.get(device_type or "")
+    if not partition or partition == "default":
+        return TASK_QUEUE
+    return f"{TASK_QUEUE}-{partition}"
+
+
+def workflow_id_for(schedule_id) -> str:
+    return f"{WORKFLOW_ID_PREFIX}{schedule_id}"
+
+
+def _cron_field_values(field: str, low: int, high: int) -> Optional[set]:
+    # Значения поля cron (*, N, A-B, списки и шаг /N); None - синтаксис не поддерживается
+    values = set()
+    for part in field.split(","):
+        part_range, has_step, step = part.partition("/")
+        if has_step and not step.isdigit():
+            return None
+        step = int(step) if has_step else 1
+        if part_range == "*":
+            start, end = low, high
+        elif "-" in part_range:
+            first, _, last = part_range.partition("-")
+            if not first.isdigit() or not last.isdigit():
+                return None
+            start, end = int(first), int(last)
+        elif part_range.isdigit():
+            start = int(part_range)
+            end = high if has_step else start
+        else:
+            return None
+        if step <= 0 or start < low or end > high or start > end:
+            return None
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def cron_min_interval_seconds(cron_expression: str) -> Optional[int]:
+    # Наименьший интервал между соседними запусками ('*/5 * * * *' - 300, '15,45 * * * *' - 1800),
+    # None - выражение не разобрано (макросы @hourly, имена дней и т.п.).
+    # Поля дней только убирают запуски и не уменьшают интервал, поэтому считаются как '*'
+    fields = cron_expression.split()
+    if len(fields) != 5:
+        return None
+    minutes = _cron_field_values(fields[0], 0, 59)
+    hours = _cron_field_values(fields[1], 0, 23)
+    if not minutes or not hours:
+        return None
+    times = sorted(hour * 60 + minute for hour in hours for minute in minutes)
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    # Переход через полночь: от последнего запуска суток до первого запуска следующих
+    gaps.append(times[0] + 24 * 60 - times[-1])
+    return 60 * min(gaps)
+
+
+def start_offset_seconds(schedule_id, cron_expression: str, jitter_seconds: Optional[int] = None) -> int:
+    # Детерминированное смещение запуска расписания внутри окна jitter_seconds: расписания с одинаковым cron
+    # равномерно распределяются по окну, а смещение одного расписания не меняется между запусками.
+    # None - глобальное окно SCHEDULE_JITTER_SECONDS, 0 - без смещения
+    window = jitter_seconds if jitter_seconds is not None else int(os.getenv("SCHEDULE_JITTER_SECONDS", "0"))
+    # Окно - не больше половины наименьшего интервала cron за вычетом запаса на выполнение
+    # (SCHEDULE_JITTER_RESERVE_SECONDS): иначе смещение вместе с выполнением заходило бы на следующий тик,
+    # и Temporal пропускал бы его. Для неразобранного выражения интервал неизвестен - без смещения
+    interval = cron_min_interval_seconds(cron_expression)
+    if interval is None:
+        return 0
+    window = min(window, interval // 2 - int(os.getenv("SCHEDULE_JITTER_RESERVE_SECONDS", "0")))
+    if window <= 1:
+        return 0
+    return zlib.crc32(str(schedule_id).encode()) % window
+
+
+def workflow_input(schedule_id, command_id, device_id, device_type: Optional[str], cron_expression: str,
+                   priority: str, jitter_seconds: Optional[int] = None, device_address: Optional[str] = None) -> dict:
+    input_data = {
+        "schedule_id": str(schedule_id),
+        "command_id": str(command_id),
+        "device_id": str(device_id),
+        "device_type": device_type,
+        # Адрес устройства для CLI-сессии Executor'а (EXECUTOR_DEVICE_TRANSPORT=tcp)
+        "device_address": device_address,
+        "cron_expression": cron_expression,
+        "priority": priority,
+    }
+    # Поле только при ненулевом смещении: отпечаток Workflow без сглаживания не меняется
+    offset = start_offset_seconds(schedule_id, cron_expression, jitter_seconds)
+    if offset:
+        input_data["start_offset_seconds"] = offset
+    return input_data
+
+
+def spec_of(input_data: dict, routes: Optional[dict] = None) -> str:
+    # Отпечаток параметров Workflow: меняется при изменении любого поля входных данных или очереди задач.
+    # Общая очередь в отпечаток не входит - без маршрутов отпечатки прежние
+    task_queue = task_queue_for(input_data.get("device_type"), routes)
+    if task_queue != TASK_QUEUE:
+        input_data = {**input_data, "task_queue": task_queue}
+    encoded = json.dumps(input_data, sort_keys=True).encode()
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+async def start_schedule_workflow(client: Client, input_data: dict, replace: bool = False):
+    # replace=True - перезапустить уже работающий Workflow с новыми параметрами (TERMINATE_EXISTING),
+    # иначе работающий Workflow остается как есть (USE_EXISTING), повторный запуск безопасен
+    policy = WorkflowIDConflictPolicy.TERMINATE_EXISTING if replace else WorkflowIDConflictPolicy.USE_EXISTING
+    task_queue = task_queue_for(input_data.get("device_type"))
+    handle = await client.start_workflow(
+        WORKFLOW_TYPE,
+        input_data,
+        id=workflow_id_for(input_data["schedule_id"]),
+        task_queue=task_queue,
+        cron_schedule=input_data["cron_expression"],
+        id_conflict_policy=policy,
+        memo={SPEC_MEMO_KEY: spec_of(input_data)},
+    )
+    logger.info(f"Started Temporal Workflow {handle.id} on '{task_queue}' (run {handle.result_run_id}, replace={replace})")
+    return handle
+
+
+async def stop_schedule_workflow(client: Client, schedule_id, reason: str) -> bool:
+    # Остановка cron-Workflow расписания; False - Workflow уже не работает
+    try:
+        await client.get_workflow_handle(workflow_id_for(schedule_id)).terminate(reason=reason)
+    except RPCError as e:
+        if e.status == RPCStatusCode.NOT_FOUND:
+            return False
+        raise
+    logger.info(f"Terminated Temporal Workflow {workflow_id_for(schedule_id)}: {reason}")
+    return True
@@ -1,7 +1,7 @@
 # routers/app/schemas.py
 
-from pydantic import BaseModel, Field, validator
-from typing import Optional, List, Union
+from pydantic import BaseModel, Field, computed_field, validator
+from typing import Optional, List, Union, Any, Dict
 from datetime import datetime
 import uuid
 
@@ -11,6 +11,8 @@ class DeviceBase(BaseModel):
     device_type: str = Field(..., example="router")
     username: Optional[str] = Field(None, example="admin")
     password: Optional[str] = Field(None, example="secret_password")
+    # Атрибуты для выборок по парку (GET /devices/query/?tag=site=msk-1)
+    tags: Dict[str, str] = Field(default_factory=dict, example={"site": "msk-1", "role": "access"})
 
     @validator('ip_address')
     def validate_ip_address(cls, v):
@@ -30,6 +32,7 @@ class DeviceUpdate(BaseModel):
     device_type: Optional[str] = Field(None, example="switch")
     username: Optional[str] = Field(None, example="new_user")
     password: Optional[str] = Field(None, example="new_password")
+    tags: Optional[Dict[str, str]] = Field(None, example={"site": "msk-2"})
 
     @validator('ip_address')
     def validate_ip_address(cls, v):
@@ -50,6 +53,11 @@ class Device(DeviceBase):
     class Config:
         from_attributes = True # Для совместимости с ORM
 
+# Страница устройств выборки GET /devices/query/
+class DevicePage(BaseModel):
+    items: List[Device]
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы, None - страниц больше нет")
+
 # Схемы для Command
 class CommandBase(BaseModel):
     command_string: str = Field(..., example="show version")
@@ -71,10 +79,27 @@ class Command(CommandBase):
     class Config:
         from_attributes = True
 
+# Приоритеты задач (потоки tasks:high, tasks, tasks:low в Redis)
+TASK_PRIORITIES = ['high', 'normal', 'low']
+
+
+def validate_priority_value(v):
+    if v is not None and v not in TASK_PRIORITIES:
+        raise ValueError("Priority must be 'high', 'normal', or 'low'")
+    return v
+
+
 # Схемы для Schedule
 class ScheduleBase(BaseModel):
     cron_expression: str = Field(..., example="0 2 * * *") # Ежедневно в 02:00
     is_active: bool = Field(default=True, example=True)
+    priority: str = Field(default="normal", example="normal") # 'high', 'normal', 'low'
+    # Окно сглаживания запусков (сек): None - глобальная настройка, 0 - запуск точно по cron
+    jitter_seconds: Optional[int] = Field(default=None, ge=0, le=86400, example=60)
+
+    @validator('priority')
+    def validate_priority(cls, v):
+        return validate_priority_value(v)
 
 class ScheduleCreate(ScheduleBase):
     pass
@@ -82,6 +107,12 @@ class ScheduleCreate(ScheduleBase):
 class ScheduleUpdate(BaseModel):
     cron_expression: Optional[str] = Field(None, example="0 3 * * *") # Ежедневно в 03:00
     is_active: Optional[bool] = Field(None, example=False)
+    priority: Optional[str] = Field(None, example="low")
+    jitter_seconds: Optional[int] = Field(None, ge=0, le=86400, example=0)
+
+    @validator('priority')
+    def validate_priority(cls, v):
+        return validate_priority_value(v)
 
 class Schedule(ScheduleBase):
     id: uuid.UUID
@@ -96,6 +127,10 @@ class Schedule(ScheduleBase):
 class CommandResultBase(BaseModel):
     output: Optional[str] = Field(None, example="Cisco IOS Software, C2960 Software ...")
     status: str = Field(..., example="success") # 'pending', 'success', 'failed'
+    # Разобранный вывод команды (если для команды и типа устройства есть парсер)
+    parsed: Optional[Any] = Field(None, example={"parser": "show_version", "version": "15.0(2)SE4"})
+    # Длительность выполнения на Executor'е, мс (учитывается в статистике /stats/)
+    duration_ms: Optional[int] = Field(None, ge=0, example=4210)
 
 class CommandResultCreate(CommandResultBase):
     '''
@@ -105,7 +140,8 @@ class CommandResultCreate(CommandResultBase):
     или передаваться в URL. Пока делаем его обязательным в схеме,
     в будущем можно будет уточнить логику.
     '''
-    pass
+    # Ключ выполнения от Workflow: результат с уже сохраненным ключом не создается повторно
+    idempotency_key: Optional[str] = Field(None, max_length=200, example="a1b2c3d4-run-id")
 
 class CommandResultUpdate(BaseModel):
     output: Optional[str] = Field(None, example="Updated output...")
@@ -114,6 +150,8 @@ class CommandResultUpdate(BaseModel):
 class CommandResult(CommandResultBase):
     id: uuid.UUID
     schedule_id: Optional[uuid.UUID] # Может быть NULL в БД
+    device_id: Optional[uuid.UUID] = None
+    idempotency_key: Optional[str] = None
     executed_at: datetime
     created_at: datetime
 
@@ -121,6 +159,26 @@ class CommandResult(CommandResultBase):
         from_attributes = True
 
 
+# Результат выполнения по требованию (POST /commands/{command_id}/run)
+class CommandRunResult(BaseModel):
+    run_id: uuid.UUID
+    command_id: uuid.UUID
+    device_id: uuid.UUID
+    result_id: Optional[uuid.UUID] = None # ID сохраненного результата (None при save=false)
+    saved: bool = Field(False, description="Результат сохранен в command_results (false при save=false или ошибке БД)")
+    status: str = Field(..., example="success")
+    output: Optional[str] = None
+    parsed: Optional[Any] = None
+    duration_ms: Optional[int] = Field(None, description="Время выполнения на Executor'е, мс")
+    elapsed_ms: int = Field(..., description="Полное время запроса в API, мс")
+
+
+# Страница результатов при keyset-пагинации
+class CommandResultPage(BaseModel):
+    items: List[CommandResult]
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы, None - страниц больше нет")
+
+
 # Дополнительная схема для обновления результата через API
 
 class CommandResultUpdateApi(BaseModel):
@@ -131,4 +189,73 @@ class CommandResultUpdateApi(BaseModel):
     def validate_status(cls, v):
         if v not in ['pending', 'success', 'failed']:
             raise ValueError("Status must be 'pending', 'success', or 'failed'")
-        return v
\ No newline at end of file
+        return v
+
+
+# Схемы для текущего состояния (проекция latest_results)
+class LatestResult(BaseModel):
+    schedule_id: uuid.UUID
+    device_id: uuid.UUID
+    command_id: Optional[uuid.UUID]
+    result_id: uuid.UUID
+    status: str
+    parsed: Optional[Any] = None
+    executed_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class DeviceState(BaseModel):
+    device_id: uuid.UUID
+    status: str = Field(..., example="failed") # 'failed', если последний результат хотя бы одного расписания неуспешен
+    schedules: int
+    failed: int
+    last_executed_at: datetime
+
+
+# Статистика выполнения по агрегатам result_rollups (GET /stats/)
+class ExecutionStats(BaseModel):
+    key: Optional[str] = Field(None, example="router") # Значение группировки (устройство, команда, тип устройства)
+    bucket_start: Optional[datetime] = None # Начало интервала при группировке по времени
+    total: int
+    success: int
+    failed: int
+    success_rate: Optional[float] = Field(None, example=0.93)
+    duration_avg_ms: Optional[float] = None
+    duration_p50_ms: Optional[float] = None
+    duration_p95_ms: Optional[float] = None
+    duration_p99_ms: Optional[float] = None
+    duration_max_ms: Optional[int] = None
+
+
+# Задание фоновой очистки удаленного устройства или расписания (GET /purge/{job_id})
+class PurgeJob(BaseModel):
+    id: uuid.UUID
+    entity_type: str = Field(..., example="device")
+    entity_id: uuid.UUID
+    results_mode: str = Field(..., example="detach") # 'detach' - результаты остаются без расписания, 'delete' - удаляются
+    status: str = Field(..., example="running") # 'pending', 'running', 'done', 'failed'
+    results_total: Optional[int] = None
+    results_processed: int
+    batches: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    updated_at: datetime
+
+    @computed_field
+    @property
+    def progress(self) -> Optional[float]:
+        # Доля обработанных результатов, None - объем еще не оценен
+        if self.status == "done":
+            return 1.0
+        if self.results_total is None:
+            return None
+        if self.results_total == 0:
+            return 0.0
+        return round(min(self.results_processed / self.results_total, 1.0), 4)
+
+    class Config:
+        from_attributes = True
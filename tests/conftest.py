@@ -1,10 +1,20 @@
 # tests/conftest.py
+import os
+import sys
+
+# Модули Executor'а, Worker'а и фермы устройств импортируются в тестах так же, как в их контейнерах
+# (каталог сервиса - рабочий каталог); API - через PYTHONPATH, как в README
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for service_dir in ("executor", "worker", "devfarm"):
+    sys.path.append(os.path.join(ROOT_DIR, service_dir))
+
 import pytest
 import random
 import uuid
 import asyncio
 from app.main import app as application
 from app.database import Base, DATABASE_URL, get_db
+from app.query_metrics import instrument_engine
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from httpx import AsyncClient
@@ -23,7 +33,8 @@ def event_loop():
 @pytest.fixture(scope="session")
 async def test_engine():
     # Создает асинхронный движок SQLAlchemy для тестов.
-    engine = create_async_engine(DATABASE_URL, echo=False)
+    # Запросы учитываются в assert_query_budget (см. app/query_metrics.py)
+    engine = instrument_engine(create_async_engine(DATABASE_URL, echo=False))
     yield engine
     await engine.dispose()
 
@@ -0,0 +1,56 @@
+# tests/test_integration/test_device_query.py
+"""
+Выборка устройств по подсети: постраничный обход по курсору при limit меньше числа совпадений.
+"""
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_query_pages_through_mixed_subnet(client):
+    # Адреса подобраны так, что порядок inet отличается от строкового (.2 < .10 < .100)
+    matching = [
+        ("192.168.77.2", "router", {"site": "msk-1"}),
+        ("192.168.77.10", "switch", {"site": "msk-1"}),
+        ("192.168.77.11", "router", {"site": "spb-1"}),
+        ("192.168.77.100", "switch", {"site": "msk-1"}),
+        ("192.168.77.200", "router", {"site": "msk-1"}),
+    ]
+    outside = [("192.168.78.1", "router", {"site": "msk-1"}), ("10.0.0.1", "switch", {})]
+    for ip_address, device_type, tags in matching + outside:
+        response = await client.post("/devices/", json={"ip_address": ip_address, "device_type": device_type,
+                                                        "tags": tags})
+        assert response.status_code == 201
+    # Удаленное устройство подсети не выдается
+    deleted = await client.post("/devices/", json={"ip_address": "192.168.77.50", "device_type": "router"})
+    assert (await client.delete(f"/devices/{deleted.json()['id']}")).status_code == 202
+
+    pages, cursor = [], None
+    while True:
+        params = {"subnet": "192.168.77.0/24", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/devices/query/", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        pages.append([device["ip_address"] for device in page["items"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert pages == [["192.168.77.2", "192.168.77.10"], ["192.168.77.11", "192.168.77.100"], ["192.168.77.200"]]
+
+    # Подсеть вместе с типом и атрибутом, по одному устройству на страницу
+    ips, cursor = [], None
+    for _ in range(5):
+        params = {"subnet": "192.168.77.0/24", "device_type": "router", "tag": "site=msk-1", "limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        page = (await client.get("/devices/query/", params=params)).json()
+        ips += [device["ip_address"] for device in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert ips == ["192.168.77.2", "192.168.77.200"]
+
+    response = await client.get("/devices/query/", params={"subnet": "192.168.77.0/24", "cursor": "gICA"})
+    assert response.status_code == 422
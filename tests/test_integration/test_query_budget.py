@@ -0,0 +1,34 @@
+# tests/test_integration/test_query_budget.py
+"""
+Бюджеты SQL-запросов вложенных эндпоинтов: проверка устройства, команды и расписания - один запрос, а не цепочка.
+"""
+import pytest
+
+from app.query_metrics import assert_query_budget
+
+
+@pytest.mark.asyncio
+async def test_nested_lookups_query_budget(client, sample_device_data, sample_command_data):
+    device_id = (await client.post("/devices/", json=sample_device_data)).json()["id"]
+    command_id = (await client.post(f"/devices/{device_id}/commands/", json=sample_command_data)).json()["id"]
+    schedule_data = {"cron_expression": "*/5 * * * *", "is_active": False}
+    response = await client.post(f"/devices/{device_id}/commands/{command_id}/schedules/", json=schedule_data)
+    schedule_id = response.json()["id"]
+
+    with assert_query_budget(1):
+        response = await client.get(f"/devices/{device_id}/commands/{command_id}")
+    assert response.status_code == 200
+
+    with assert_query_budget(1):
+        response = await client.get(f"/devices/{device_id}/commands/{command_id}/schedules/{schedule_id}")
+    assert response.status_code == 200
+
+    # Проверка владельца и список расписаний
+    with assert_query_budget(2):
+        response = await client.get(f"/devices/{device_id}/commands/{command_id}/schedules/")
+    assert response.status_code == 200
+
+    # Чужая команда: 404 тем же одним запросом
+    with assert_query_budget(1):
+        response = await client.get(f"/devices/{device_id}/commands/{schedule_id}/schedules/{schedule_id}")
+    assert response.status_code == 404
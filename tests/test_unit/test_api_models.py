@@ -1,6 +1,6 @@
 # tests/test_unit/test_api_models.py
 import pytest
-from app.schemas import DeviceCreate, CommandCreate, ScheduleCreate
+from app.schemas import DeviceCreate, CommandCreate, ScheduleCreate, PurgeJob
 from pydantic import ValidationError
 
 
@@ -37,6 +37,15 @@ def test_device_create_invalid_ip():
     assert any("ip_address" in str(err) for err in errors) or any("value_error" in str(err) for err in errors)
 
 
+def test_device_create_tags():
+    # Тест атрибутов устройства: по умолчанию пусто, значения - строки.
+    assert DeviceCreate(ip_address="10.20.0.1", device_type="switch").tags == {}
+    device = DeviceCreate(ip_address="10.20.0.1", device_type="switch", tags={"site": "msk-1"})
+    assert device.model_dump()["tags"] == {"site": "msk-1"}
+    with pytest.raises(ValidationError):
+        DeviceCreate(ip_address="10.20.0.1", device_type="switch", tags={"site": ["msk-1"]})
+
+
 def test_command_create_missing_command_string():
     # Тест создания схемы CommandCreate без обязательного поля command_string.
     data = {
@@ -61,3 +70,31 @@ def test_schedule_create_valid_cron():
     schedule = ScheduleCreate(**data)
     assert schedule.cron_expression == data["cron_expression"]
     assert schedule.is_active == data["is_active"]
+
+
+def test_schedule_create_default_priority():
+    # Тест приоритета по умолчанию для расписания.
+    schedule = ScheduleCreate(cron_expression="*/5 * * * *")
+    assert schedule.priority == "normal"
+
+
+def test_schedule_create_invalid_priority():
+    # Тест создания схемы ScheduleCreate с неизвестным приоритетом.
+    with pytest.raises(ValidationError) as exc_info:
+        ScheduleCreate(cron_expression="*/5 * * * *", priority="urgent")
+
+    errors = exc_info.value.errors()
+    assert any("priority" in str(err.get("loc", [])) for err in errors)
+
+
+def test_purge_job_progress():
+    # Тест прогресса задания очистки: доля обработанных результатов, неизвестна до оценки объема.
+    import uuid
+    from datetime import datetime
+
+    job = dict(id=uuid.uuid4(), entity_type="device", entity_id=uuid.uuid4(), results_mode="detach",
+               status="running", results_processed=2500, batches=1, created_at=datetime.now(), updated_at=datetime.now())
+    assert PurgeJob(**job).progress is None
+    assert PurgeJob(**job, results_total=10000).progress == 0.25
+    assert PurgeJob(**{**job, "status": "done"}, results_total=0).progress == 1.0
+    assert PurgeJob(**job, results_total=10000).model_dump()["progress"] == 0.25
@@ -0,0 +1,40 @@
+# tests/test_unit/test_claim_check.py
+import json
+
+import fakeredis
+
+from workflows.claim_check import KEY_PREFIX, check_in, check_out, release
+
+
+def test_small_result_stays_in_message(monkeypatch):
+    # Тест порога: результат меньше CLAIM_CHECK_THRESHOLD_BYTES проходит через историю Workflow как есть.
+    monkeypatch.setenv("CLAIM_CHECK_THRESHOLD_BYTES", "100")
+    r = fakeredis.FakeRedis(decode_responses=True)
+    message = {"schedule_id": "s1", "status": "success", "output": "ok", "parsed": ""}
+
+    assert check_in(r, "s1", "1-0", message) is message
+    assert r.keys(f"{KEY_PREFIX}*") == []
+
+
+def test_large_result_round_trip(monkeypatch):
+    # Тест claim-check: большой вывод выносится в Redis, в сообщении остается ссылка, по ссылке данные возвращаются.
+    monkeypatch.setenv("CLAIM_CHECK_THRESHOLD_BYTES", "100")
+    monkeypatch.setenv("CLAIM_CHECK_TTL_SECONDS", "60")
+    r = fakeredis.FakeRedis(decode_responses=True)
+    output = "интерфейс up\n" * 50
+    parsed = json.dumps({"parser": "show_version", "version": "15.1"})
+    message = {"schedule_id": "s1", "status": "success", "output": output, "parsed": parsed,
+               "idempotency_key": "run-1"}
+
+    slim = check_in(r, "s1", "1-0", message)
+
+    assert "output" not in slim and "parsed" not in slim
+    assert slim["payload_ref"] == f"{KEY_PREFIX}s1:1-0"
+    assert slim["payload_bytes"] == str(len(output.encode()) + len(parsed))
+    assert slim["idempotency_key"] == "run-1" and slim["status"] == "success"
+    assert 0 < r.ttl(slim["payload_ref"]) <= 60
+
+    assert check_out(r, slim["payload_ref"]) == {"output": output, "parsed": parsed}
+    release(r, slim["payload_ref"])
+    # После сохранения результата (или истечения TTL) данных по ссылке нет
+    assert check_out(r, slim["payload_ref"]) is None
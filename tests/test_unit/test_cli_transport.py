@@ -0,0 +1,97 @@
+# tests/test_unit/test_cli_transport.py
+import asyncio
+import threading
+
+import pytest
+
+from farm import DeviceFarm
+from parsers import parse_output
+from profiles import Distribution, DeviceProfile
+from sessions import TcpCliSession
+
+
+def start_farm(monkeypatch, **profile_fields):
+    # Ферма с одним устройством 127.0.0.1 на свободном порту, в своем цикле событий
+    profile = DeviceProfile(connect_ms=Distribution.parse("fixed:0"), command_ms=Distribution.parse("fixed:0"),
+                            failure_rate=0.0, **profile_fields)
+    farm = DeviceFarm(["127.0.0.1"], [profile], host="127.0.0.1", port=0)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(farm.start(), loop).result(timeout=5)
+    monkeypatch.setenv("EXECUTOR_DEVICE_PORT", str(farm._server.sockets[0].getsockname()[1]))
+    monkeypatch.setenv("EXECUTOR_CONNECT_TIMEOUT_SECONDS", "5")
+
+    async def shutdown():
+        # Сессии, которые ферма еще обслуживает, завершаются до остановки цикла событий
+        farm._server.close()
+        sessions = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in sessions:
+            task.cancel()
+        await asyncio.gather(*sessions, return_exceptions=True)
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+    return farm, stop
+
+
+@pytest.fixture
+def farm(monkeypatch, request):
+    farm, stop = start_farm(monkeypatch, **getattr(request, "param", {}))
+    yield farm
+    stop()
+
+
+def test_session_reads_until_prompt(farm):
+    # Тест кадрирования CLI: баннер пропускается, вывод команды возвращается без приглашения.
+    session = TcpCliSession("d1", "127.0.0.1")
+    try:
+        device = farm.devices["127.0.0.1"]
+        assert session.prompt == f"\n{device.hostname}#".encode()
+
+        output = session.run("show version")
+        assert f"{device.hostname}#" not in output
+        assert parse_output("router", "show version", output)["serial"] == device.serial
+        # Следующая команда в той же сессии получает свой вывод, а не хвост предыдущего
+        assert parse_output("router", "show ip interface brief", session.run("show ip interface brief"))["interfaces"]
+    finally:
+        session.close()
+
+
+@pytest.mark.parametrize("farm", [{"output_bytes": Distribution.parse("fixed:300000")}], indirect=True)
+def test_session_large_output(farm):
+    # Тест большого вывода: ответ из многих TCP-сегментов собирается целиком до приглашения.
+    session = TcpCliSession("d1", "127.0.0.1")
+    try:
+        output = session.run("show running-config")
+        assert len(output) >= 290000
+        assert not output.endswith("#")
+        assert session.run("show version").count("\n") < 50
+    finally:
+        session.close()
+
+
+@pytest.mark.parametrize("farm", [{"hang_rate": 1.0}], indirect=True)
+def test_session_command_timeout(farm, monkeypatch):
+    # Тест зависшей команды: ожидание приглашения ограничено EXECUTOR_COMMAND_TIMEOUT_SECONDS.
+    monkeypatch.setenv("EXECUTOR_COMMAND_TIMEOUT_SECONDS", "0.2")
+    session = TcpCliSession("d1", "127.0.0.1")
+    try:
+        with pytest.raises(TimeoutError):
+            session.run("show version")
+    finally:
+        session.close()
+
+
+@pytest.mark.parametrize("farm", [{"max_sessions": 1}], indirect=True)
+def test_rejected_session_raises(farm):
+    # Тест отказа устройства: сессия сверх max_sessions закрывается фермой, открытие завершается ConnectionError.
+    first = TcpCliSession("d1", "127.0.0.1")
+    try:
+        with pytest.raises(ConnectionError, match="too many sessions"):
+            TcpCliSession("d1", "127.0.0.1")
+    finally:
+        first.close()
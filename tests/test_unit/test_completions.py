@@ -0,0 +1,115 @@
+# tests/test_unit/test_completions.py
+import asyncio
+
+import fakeredis
+import fakeredis.aioredis
+from temporalio.service import RPCError, RPCStatusCode
+
+from workflows.claim_check import KEY_PREFIX
+from workflows.completions import (
+    COMPLETIONS_STREAM,
+    CONSUMER_GROUP,
+    SIGNAL_NAME,
+    WORKFLOW_ID_PREFIX,
+    ResultCompletionConsumer,
+)
+
+
+class StubHandle:
+    def __init__(self, client, workflow_id, run_id):
+        self.client, self.workflow_id, self.run_id = client, workflow_id, run_id
+
+    async def signal(self, name, message):
+        if self.client.errors:
+            raise self.client.errors.pop(0)
+        self.client.signals.append((self.workflow_id, self.run_id, name, message))
+
+
+class StubClient:
+    # Клиент Temporal: записывает сигналы, ошибки отдает по очереди
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.signals = []
+
+    def get_workflow_handle(self, workflow_id, run_id=None):
+        return StubHandle(self, workflow_id, run_id)
+
+
+def consumer(client, server, name):
+    consumer = ResultCompletionConsumer(client, "localhost", 6379, consumer_name=name, claim_idle_seconds=1)
+    consumer._redis = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    consumer._sync_redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+    return consumer
+
+
+async def read(consumer):
+    messages = await consumer._redis.xreadgroup(CONSUMER_GROUP, consumer.consumer_name, {COMPLETIONS_STREAM: ">"})
+    for _, message_list in messages:
+        await consumer._complete_all(message_list)
+
+
+def setup_stream(server, *messages):
+    r = fakeredis.FakeRedis(server=server, decode_responses=True)
+    r.xgroup_create(COMPLETIONS_STREAM, CONSUMER_GROUP, id="0", mkstream=True)
+    return r, [r.xadd(COMPLETIONS_STREAM, message) for message in messages]
+
+
+def test_signal_to_publishing_run_and_ack():
+    # Тест сигнала: результат отправляется в запуск с run_id = ключ идемпотентности и удаляется из потока.
+    server = fakeredis.FakeServer()
+    r, _ = setup_stream(server,
+                        {"schedule_id": "s1", "idempotency_key": "run-1", "status": "success", "output": "ok"},
+                        {"schedule_id": "s2", "status": "success"})
+    client = StubClient()
+
+    asyncio.run(read(consumer(client, server, "completions_a")))
+
+    assert len(client.signals) == 1
+    workflow_id, run_id, name, message = client.signals[0]
+    assert (workflow_id, run_id, name) == (f"{WORKFLOW_ID_PREFIX}s1", "run-1", SIGNAL_NAME)
+    assert message["output"] == "ok"
+    # Оба сообщения подтверждены: без ключа идемпотентности результат отбрасывается
+    assert r.xlen(COMPLETIONS_STREAM) == 0
+    assert r.xpending(COMPLETIONS_STREAM, CONSUMER_GROUP)["pending"] == 0
+
+
+def test_failed_signal_is_reclaimed_by_other_replica():
+    # Тест XAUTOCLAIM: после ошибки сигнала сообщение остается pending, и другая реплика доставляет его повторно.
+    server = fakeredis.FakeServer()
+    r, _ = setup_stream(server, {"schedule_id": "s1", "idempotency_key": "run-1", "workflow_id": "custom-s1"})
+    client = StubClient(errors=[RPCError("unavailable", RPCStatusCode.UNAVAILABLE, b"")])
+
+    async def scenario():
+        first = consumer(client, server, "completions_a")
+        await read(first)
+        assert client.signals == []
+        assert r.xpending(COMPLETIONS_STREAM, CONSUMER_GROUP)["pending"] == 1
+
+        second = consumer(client, server, "completions_b")
+        # Сообщение еще не простаивает дольше порога
+        await second._claim_stale()
+        assert client.signals == []
+
+        second.claim_idle_ms = 10
+        await asyncio.sleep(0.02)
+        await second._claim_stale()
+
+    asyncio.run(scenario())
+
+    assert [(signal[0], signal[1]) for signal in client.signals] == [("custom-s1", "run-1")]
+    assert r.xlen(COMPLETIONS_STREAM) == 0
+    assert r.xpending(COMPLETIONS_STREAM, CONSUMER_GROUP)["pending"] == 0
+
+
+def test_closed_run_drops_result_and_payload(monkeypatch):
+    # Тест завершенного запуска: результат подтверждается без сигнала, вынесенный вывод удаляется.
+    monkeypatch.setenv("CLAIM_CHECK_THRESHOLD_BYTES", "10")
+    server = fakeredis.FakeServer()
+    r, [message_id] = setup_stream(server, {"schedule_id": "s1", "idempotency_key": "run-1", "output": "x" * 100})
+    client = StubClient(errors=[RPCError("not found", RPCStatusCode.NOT_FOUND, b"")])
+
+    asyncio.run(read(consumer(client, server, "completions_a")))
+
+    assert client.signals == []
+    assert not r.exists(f"{KEY_PREFIX}s1:{message_id}")
+    assert r.xlen(COMPLETIONS_STREAM) == 0
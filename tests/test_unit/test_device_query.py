@@ -0,0 +1,45 @@
+# tests/test_unit/test_device_query.py
+import pytest
+from fastapi import HTTPException
+
+from app.routers.devices import _decode_ip_cursor, _encode_ip_cursor, _parse_subnet, _parse_tags
+
+
+def test_parse_subnet_normalizes():
+    # Тест разбора подсети: адрес хоста в маске нормализуется до сети, одиночный адрес - до /32 и /128.
+    assert _parse_subnet("10.20.30.40/16") == "10.20.0.0/16"
+    assert _parse_subnet("10.20.30.40") == "10.20.30.40/32"
+    assert _parse_subnet("2001:db8::1/64") == "2001:db8::/64"
+
+
+@pytest.mark.parametrize("value", ["10.20.0.0/33", "10.300.0.0/16", "not-a-subnet", ""])
+def test_parse_subnet_invalid(value):
+    # Тест некорректной подсети: ошибка 422, а не 500 из PostgreSQL.
+    with pytest.raises(HTTPException) as exc_info:
+        _parse_subnet(value)
+    assert exc_info.value.status_code == 422
+
+
+def test_parse_tags():
+    # Тест фильтра по атрибутам: key=value, значение может содержать '=' и быть пустым.
+    assert _parse_tags(["site=msk-1", "expr=a=b", "empty="]) == {"site": "msk-1", "expr": "a=b", "empty": ""}
+    for value in ("site", "=msk-1"):
+        with pytest.raises(HTTPException) as exc_info:
+            _parse_tags([value])
+        assert exc_info.value.status_code == 422
+
+
+@pytest.mark.parametrize("ip_address", ["10.0.0.1", "192.168.255.254", "2001:db8::ff"])
+def test_ip_cursor_roundtrip(ip_address):
+    # Тест курсора пагинации по IP-адресу: без '=' в URL, декодируется в тот же адрес.
+    cursor = _encode_ip_cursor(ip_address)
+    assert "=" not in cursor
+    assert _decode_ip_cursor(cursor) == ip_address
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", _encode_ip_cursor("not-an-ip"), "gICA"])
+def test_ip_cursor_invalid(cursor):
+    # Тест некорректного курсора: не base64, не IP-адрес, не UTF-8 - ошибка 422.
+    with pytest.raises(HTTPException) as exc_info:
+        _decode_ip_cursor(cursor)
+    assert exc_info.value.status_code == 422
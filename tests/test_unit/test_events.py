@@ -0,0 +1,29 @@
+# tests/test_unit/test_events.py
+import asyncio
+import json
+
+from app.events import ResultBroadcaster
+
+
+def test_dispatch_filters_subscribers():
+    # Тест раздачи события подписчикам с фильтрами по устройству, расписанию и статусу.
+    async def scenario():
+        broadcaster = ResultBroadcaster()
+        broadcaster.enabled = False  # без подписки на Redis
+        everything = broadcaster.subscribe()
+        device = broadcaster.subscribe(device_id="d1")
+        other_device = broadcaster.subscribe(device_id="d2")
+        failed_only = broadcaster.subscribe(status="failed")
+
+        event = {"id": "r1", "device_id": "d1", "schedule_id": "s1", "status": "success"}
+        delivered = broadcaster.dispatch(json.dumps(event))
+
+        assert delivered == 2
+        assert everything.queue.qsize() == 1 and device.queue.qsize() == 1
+        assert other_device.queue.empty() and failed_only.queue.empty()
+        assert (await device.queue.get()).startswith("id: r1\nevent: result\n")
+
+        broadcaster.unsubscribe(device)
+        assert broadcaster.subscriber_count == 3
+
+    asyncio.run(scenario())
@@ -0,0 +1,55 @@
+# tests/test_unit/test_idempotency.py
+import fakeredis
+
+from idempotency import BUSY, DONE, KEY_PREFIX, RUN, ExecutionLedger
+
+
+def ledger():
+    return ExecutionLedger(fakeredis.FakeRedis(decode_responses=True), claim_seconds=60, ttl_seconds=3600)
+
+
+def test_ledger_run_busy_done():
+    # Тест отметок выполнения: первая копия выполняет, вторая ждет, после завершения копии подтверждаются без выполнения.
+    executions = ledger()
+
+    assert executions.begin("run-1", "executor_a:1-0") == RUN
+    # Та же копия после отложения ограничителем узнает свою отметку
+    assert executions.begin("run-1", "executor_a:1-0") == RUN
+    assert executions.begin("run-1", "executor_b:2-0") == BUSY
+    assert 1 <= executions.retry_after("run-1") <= 30
+
+    executions.complete("run-1", "success")
+    assert executions.begin("run-1", "executor_b:2-0") == DONE
+    assert executions.begin("run-1", "executor_a:1-0") == DONE
+    assert executions.r.ttl(f"{KEY_PREFIX}run-1") > 60
+
+
+def test_ledger_abandon_releases_only_own_mark():
+    # Тест снятия отметки: чужая копия не может снять отметку, своя - снимает, и другая копия выполняет задачу.
+    executions = ledger()
+    executions.begin("run-1", "executor_a:1-0")
+
+    executions.abandon("run-1", "executor_b:2-0")
+    assert executions.begin("run-1", "executor_b:2-0") == BUSY
+
+    executions.abandon("run-1", "executor_a:1-0")
+    assert executions.begin("run-1", "executor_b:2-0") == RUN
+
+
+def test_ledger_abandon_keeps_done():
+    # Тест снятия после завершения: отметка done не снимается, повторного выполнения нет.
+    executions = ledger()
+    executions.begin("run-1", "executor_a:1-0")
+    executions.complete("run-1", "failed")
+
+    executions.abandon("run-1", "executor_a:1-0")
+    assert executions.begin("run-1", "executor_b:2-0") == DONE
+
+
+def test_ledger_claim_expires():
+    # Тест падения реплики: отметка running истекает по TTL, и копия задачи выполняет команду.
+    executions = ledger()
+    executions.begin("run-1", "executor_a:1-0")
+    # Истечение TTL отметки
+    executions.r.delete(f"{KEY_PREFIX}run-1")
+    assert executions.begin("run-1", "executor_b:2-0") == RUN
@@ -0,0 +1,24 @@
+# tests/test_unit/test_output_reads.py
+from app.output_reads import parse_range, take_lines
+
+
+def test_parse_range():
+    # Тест разбора заголовка Range: диапазон, открытый конец, суффикс и невыполнимые диапазоны.
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=-50", 1000) == (950, 999)
+    assert parse_range("bytes=990-2000", 1000) == (990, 999)
+    assert parse_range("bytes=-5000", 1000) == (0, 999)
+    assert parse_range("bytes=1000-", 1000) is None
+    assert parse_range("bytes=10-5", 1000) is None
+    assert parse_range("bytes=0-1,5-9", 1000) is None
+    assert parse_range("items=0-1", 1000) is None
+
+
+def test_take_lines_window():
+    # Тест выбора строк из окна: обрезанная крайняя строка не считается, пока в окне не весь вывод.
+    assert take_lines("ine 2\nline 3\nline 4\n", 2, from_end=True, complete=False) == "line 3\nline 4\n"
+    assert take_lines("ine 3\nline 4\n", 2, from_end=True, complete=False) is None
+    assert take_lines("line 1\nline 2\nli", 2, from_end=False, complete=False) == "line 1\nline 2\n"
+    assert take_lines("line 1\nline 2", 2, from_end=False, complete=False) is None
+    assert take_lines("line 1\nline 2", 5, from_end=True, complete=True) == "line 1\nline 2"
@@ -0,0 +1,26 @@
+# tests/test_unit/test_pagination.py
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+from app.pagination import encode_cursor, decode_cursor
+
+
+def test_cursor_roundtrip():
+    # Тест кодирования и декодирования курсора keyset-пагинации.
+    executed_at = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    row_id = uuid.uuid4()
+
+    cursor = encode_cursor(executed_at, row_id)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (executed_at, row_id)
+
+
+def test_cursor_invalid():
+    # Тест некорректного курсора: ошибка 422, а не 500.
+    with pytest.raises(HTTPException) as exc_info:
+        decode_cursor("not-a-cursor")
+
+    assert exc_info.value.status_code == 422
@@ -0,0 +1,94 @@
+# tests/test_unit/test_parsers.py
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import parsers
+from parsers import find_parser, parse_in_pool, parse_output, parser
+
+IP_INTERFACE_BRIEF = """Interface              IP-Address      OK? Method Status                Protocol
+GigabitEthernet0/0     10.0.0.1        YES NVRAM  up                    up
+GigabitEthernet0/1     unassigned      YES unset  administratively down down
+"""
+
+SHOW_VERSION = """Cisco IOS Software, C2900 Software (C2900-UNIVERSALK9-M), Version 15.1(4)M4, RELEASE SOFTWARE (fc1)
+router1 uptime is 1 week, 2 days, 3 hours, 4 minutes
+Cisco CISCO2901/K9 (revision 1.0) with 483328K/40960K bytes of memory.
+Cisco C2901 (revision 1.0) processor with 483328K/40960K bytes of memory.
+Processor board ID FTX1234A5BC
+"""
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # Реестр на время теста: регистрация тестовых парсеров не влияет на встроенные
+    monkeypatch.setattr(parsers, "PARSERS", list(parsers.PARSERS))
+    return parsers.PARSERS
+
+
+def test_find_parser_prefers_device_type(registry):
+    # Тест реестра: парсер типа устройства выбирается раньше общего, команда сравнивается целиком и без учета пробелов.
+    @parser(r"show ip int(erface)? br(ief)?", device_types=("switch",), name="switch_brief")
+    def switch_brief(output):
+        return {"switch": True}
+
+    assert find_parser("switch", "show  ip   interface brief")[0] == "switch_brief"
+    assert find_parser("router", "sh ip int br")[0] == "ip_interface_brief"
+    assert find_parser("router", "SHOW VERSION")[0] == "show_version"
+    # Шаблон должен совпасть со всей командой
+    assert find_parser("router", "show version | include uptime") is None
+
+
+def test_no_parser_returns_none():
+    # Тест запасного пути: для команды без парсера разбор не выполняется и пул не используется.
+    class Pool:
+        def submit(self, *args):
+            raise AssertionError("pool must not be used")
+
+    assert find_parser("router", "show running-config") is None
+    assert parse_output("router", "show running-config", "hostname r1") is None
+    assert parse_in_pool(Pool(), "router", "show running-config", "hostname r1") is None
+    assert parse_in_pool(None, None, None, "output") is None
+
+
+def test_ip_interface_brief_parser():
+    # Тест встроенного парсера show ip interface brief: заголовок пропускается, unassigned и admin-down нормализуются.
+    parsed = parse_output("router", "show ip interface brief", IP_INTERFACE_BRIEF)
+
+    assert parsed == {
+        "parser": "ip_interface_brief",
+        "interfaces": [
+            {"name": "GigabitEthernet0/0", "ip_address": "10.0.0.1", "status": "up", "protocol": "up"},
+            {"name": "GigabitEthernet0/1", "ip_address": None, "status": "admin-down", "protocol": "down"},
+        ],
+    }
+
+
+def test_show_version_parser():
+    # Тест встроенного парсера show version: версия, серийный номер, время работы и модель.
+    parsed = parse_output("router", "show version", SHOW_VERSION)
+
+    assert parsed == {
+        "parser": "show_version",
+        "version": "15.1(4)M4",
+        "serial": "FTX1234A5BC",
+        "uptime": "1 week, 2 days, 3 hours, 4 minutes",
+        "model": "C2901",
+    }
+
+
+def test_malformed_output_in_process_pool():
+    # Тест нераспознанного вывода: в пуле процессов разбор возвращает None, а не исключение.
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        assert parse_in_pool(pool, "router", "show ip interface brief", "% Invalid input detected at '^' marker.") is None
+        assert parse_in_pool(pool, "router", "show version", "\x00\xff garbage\n\n") is None
+        assert parse_in_pool(pool, "router", "show version", "") is None
+
+
+def test_failing_parser_does_not_raise(registry):
+    # Тест ошибки парсера: исключение внутри парсера не прерывает задачу, результат разбора - None.
+    @parser(r"show broken", name="broken")
+    def broken(output):
+        raise ValueError("unexpected format")
+
+    assert parse_in_pool(None, "router", "show broken", "output") is None
@@ -0,0 +1,55 @@
+# tests/test_unit/test_partitions.py
+import time
+
+import fakeredis
+
+from lanes import WeightedLaneReader
+from partitions import PartitionMembership, PendingReclaimer
+
+
+def test_claim_pending_respects_idle_threshold():
+    # Тест XAUTOCLAIM без шардирования: задача упавшей реплики забирается только после порога простоя.
+    r = fakeredis.FakeRedis(decode_responses=True)
+    r.xgroup_create("tasks", "executor_group", id="0", mkstream=True)
+    message_id = r.xadd("tasks", {"command_string": "show version"})
+    # Реплика executor_a прочитала задачу и упала, не подтвердив ее
+    r.xreadgroup("executor_group", "executor_a", {"tasks": ">"})
+
+    membership = PartitionMembership(r, "executor_b", partitions=1)
+    assert not membership.sharded
+    assert membership.claim_pending(["tasks"], "executor_group", min_idle_ms=60_000) == []
+
+    time.sleep(0.02)
+    claimed = membership.claim_pending(["tasks"], "executor_group", min_idle_ms=10)
+    assert claimed == [("tasks", message_id, {"command_string": "show version"})]
+    assert r.xpending("tasks", "executor_group")["consumers"] == [{"name": "executor_b", "pending": 1}]
+
+
+def test_sharded_takeover_reclaims_young_pending_later():
+    # Тест перебалансировки: задачи ушедшей реплики, слишком свежие для забора при получении партиций,
+    # забираются новым владельцем следующим периодическим XAUTOCLAIM.
+    r = fakeredis.FakeRedis(decode_responses=True)
+    membership = PartitionMembership(r, "executor_b", partitions=2)
+    reader = WeightedLaneReader(r, "executor_group", "executor_b", weights={"normal": 1}, membership=membership)
+    reader.ensure_groups()
+    message_ids = [r.xadd(f"tasks:p{p}", {"device_id": f"d{p}"}) for p in range(2)]
+    # Реплика executor_a прочитала задачи обеих партиций и ушла
+    r.xreadgroup("executor_group", "executor_a", {"tasks:p0": ">", "tasks:p1": ">"})
+
+    membership.heartbeat()
+    acquired, _ = membership.take_changes()
+    assert acquired == {0, 1}
+    # Забор при получении партиций: задачи простаивают меньше EXECUTOR_MEMBER_TTL_SECONDS и остаются у executor_a
+    assert membership.claim_pending(reader.streams_for(acquired), "executor_group") == []
+
+    reclaimer = PendingReclaimer(membership, reader.streams_for, "executor_group", idle_seconds=300)
+    assert reclaimer.poll(set()) == []
+    reclaimer.idle_ms, reclaimer.next_claim = 10, 0.0
+    time.sleep(0.02)
+    # Задачу, которую реплика уже выполняет, периодический забор не возвращает повторно
+    # (ID в потоках партиций могут совпадать, задача определяется парой поток и ID)
+    claimed = reclaimer.poll({("tasks:p1", message_ids[1])})
+    assert [(stream, message_id) for stream, message_id, _ in claimed] == [("tasks:p0", message_ids[0])]
+    assert r.xpending("tasks:p0", "executor_group")["consumers"] == [{"name": "executor_b", "pending": 1}]
+    # Следующий забор - не раньше чем через половину порога
+    assert reclaimer.poll(set()) == []
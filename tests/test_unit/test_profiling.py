@@ -0,0 +1,32 @@
+# tests/test_unit/test_profiling.py
+import asyncio
+
+from app.profiling import ProfilingMiddleware, is_authorized
+
+
+def test_profiling_token_check(monkeypatch):
+    # Тест проверки токена: без PROFILING_TOKEN профилирование выключено для любого заголовка.
+    monkeypatch.delenv("PROFILING_TOKEN", raising=False)
+    assert not is_authorized("secret")
+    monkeypatch.setenv("PROFILING_TOKEN", "secret")
+    assert is_authorized("secret")
+    assert not is_authorized("wrong")
+    assert not is_authorized(None)
+
+
+def test_profiling_middleware_passes_unauthorized(monkeypatch):
+    # Тест middleware: запрос с неверным токеном проходит без профилирования и без заголовка X-Profile-Id.
+    monkeypatch.setenv("PROFILING_TOKEN", "secret")
+    sent = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"x-profile-token", b"wrong")]}
+    asyncio.run(ProfilingMiddleware(app)(scope, None, send))
+    assert sent[0]["headers"] == []
+    assert sent[1]["body"] == b"ok"
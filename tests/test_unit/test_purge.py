@@ -0,0 +1,241 @@
+# tests/test_unit/test_purge.py
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.dialects import postgresql
+
+from app import models, purge
+from app.database import get_db
+from app.main import app as application
+from app.routers import devices
+
+
+def sql(stmt) -> str:
+    # Текст запроса PostgreSQL со значениями параметров, в одну строку
+    return " ".join(str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})).split())
+
+
+class StubResult:
+    def __init__(self, value=None, rows=()):
+        self.value, self.rows = value, list(rows)
+
+    def scalar(self):
+        return self.value
+
+    def scalar_one_or_none(self):
+        return self.value
+
+    def scalars(self):
+        return iter(self.rows)
+
+
+class StubSession:
+    # Сессия БД: ответы выбираются по тексту запроса, выполненные запросы запоминаются
+    def __init__(self, answer=None):
+        self.answer = answer or (lambda text: StubResult())
+        self.statements = []
+        self.added = []
+        self.commits = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt, *args):
+        text = sql(stmt)
+        self.statements.append(text)
+        return self.answer(text)
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    async def commit(self):
+        self.commits += 1
+
+    async def refresh(self, obj):
+        # Значения по умолчанию, которые задала бы БД
+        now = datetime.now(timezone.utc)
+        obj.id = obj.id or uuid.uuid4()
+        obj.status = obj.status or "pending"
+        obj.results_processed = obj.results_processed or 0
+        obj.batches = obj.batches or 0
+        obj.created_at = obj.created_at or now
+        obj.updated_at = obj.updated_at or now
+
+
+def test_claim_job_takes_pending_or_stale_running(monkeypatch):
+    # Тест выбора задания: ожидающее или running без обновлений дольше PURGE_STALE_SECONDS, без ожидания блокировок.
+    monkeypatch.setenv("PURGE_STALE_SECONDS", "120")
+    session = StubSession()
+
+    assert asyncio.run(purge.claim_job(session)) is None
+
+    statement = session.statements[0]
+    assert statement.startswith("UPDATE purge_jobs SET status='running'")
+    assert ("WHERE purge_jobs.status = 'pending' OR purge_jobs.status = 'running' "
+            "AND purge_jobs.updated_at < now() - make_interval(secs=>120.0)") in statement
+    assert "ORDER BY purge_jobs.created_at" in statement and "FOR UPDATE SKIP LOCKED" in statement
+    # started_at первого запуска сохраняется при продолжении брошенного задания
+    assert "started_at=coalesce(purge_jobs.started_at, now())" in statement
+    assert session.commits == 1
+
+
+def purge_job(**values):
+    return models.PurgeJob(id=uuid.uuid4(), entity_type="device", entity_id=uuid.uuid4(), results_mode="detach",
+                           results_total=None, **values)
+
+
+def run_purge(monkeypatch, job, batches, remaining, answer=None):
+    # Выполняет run_job: purge_batch возвращает batches по очереди, проверка остатка - remaining по очереди
+    calls, sessions, stopped = [], [], []
+
+    async def purge_batch(db, job, condition, batch_size):
+        calls.append(batch_size)
+        return batches.pop(0)
+
+    async def schedule_ids_of(db, job):
+        return ["s1", "s2"]
+
+    async def stop_workflows(get_client, schedule_ids, reason):
+        stopped.append((schedule_ids, reason))
+
+    def default_answer(text):
+        if text.startswith("SELECT EXISTS"):
+            return StubResult(remaining.pop(0))
+        if text.startswith("SELECT count(*)"):
+            return StubResult(7)
+        return StubResult()
+
+    def session_factory():
+        sessions.append(StubSession(answer or default_answer))
+        return sessions[-1]
+
+    monkeypatch.setattr(purge, "purge_batch", purge_batch)
+    monkeypatch.setattr(purge, "schedule_ids_of", schedule_ids_of)
+    monkeypatch.setattr(purge, "stop_workflows", stop_workflows)
+    asyncio.run(purge.run_job(session_factory, None, job, batch_size=3, pause_seconds=0))
+    return calls, [statement for session in sessions for statement in session.statements], stopped
+
+
+def test_run_job_batches_until_nothing_left(monkeypatch):
+    # Тест цикла пачек: пустая пачка при заблокированных строках не завершает очистку, пустая без остатка - завершает.
+    job = purge_job()
+    batches, remaining = [3, 3, 0, 1, 0], [True, False]
+
+    calls, statements, stopped = run_purge(monkeypatch, job, batches, remaining)
+
+    assert calls == [3] * 5
+    assert batches == [] and remaining == []
+    assert stopped == [(["s1", "s2"], "device deleted")]
+    # Объем оценивается один раз, затем удаляется само устройство и задание завершается
+    assert sum(statement.startswith("SELECT count(*)") for statement in statements) == 1
+    assert statements[-2].startswith("DELETE FROM devices")
+    assert "status='done'" in statements[-1] and "finished_at=now()" in statements[-1]
+
+
+def test_run_job_without_schedules_skips_batches(monkeypatch):
+    # Тест устройства без расписаний (режим detach): обрабатывать нечего, пачки не выполняются.
+    job = purge_job()
+    monkeypatch.setattr(purge, "_results_condition", lambda job, schedule_ids: None)
+
+    calls, statements, _ = run_purge(monkeypatch, job, [], [])
+
+    assert calls == []
+    assert statements[-2].startswith("DELETE FROM devices")
+
+
+def test_run_job_failure_marks_failed(monkeypatch):
+    # Тест ошибки очистки: задание переходит в failed с текстом ошибки, его можно повторить (POST /purge/{id}/retry).
+    job = purge_job()
+
+    def answer(text):
+        if text.startswith("SELECT EXISTS"):
+            raise RuntimeError("connection lost")
+        return StubResult(0)
+
+    _, statements, _ = run_purge(monkeypatch, job, [0], [], answer)
+
+    assert "status='failed', error='connection lost'" in statements[-1]
+
+
+def request(session, method, path):
+    async def scenario():
+        application.dependency_overrides[get_db] = lambda: session
+        try:
+            async with AsyncClient(transport=ASGITransport(app=application), base_url="http://test") as ac:
+                return await ac.request(method, path)
+        finally:
+            application.dependency_overrides.clear()
+    return asyncio.run(scenario())
+
+
+def test_delete_device_202_and_stops_workflows(monkeypatch):
+    # Тест DELETE /devices/{id}: 202 с заданием очистки, Workflow расписаний устройства останавливаются сразу.
+    device = SimpleNamespace(id=uuid.uuid4(), deleted_at=None)
+    schedule_ids = [uuid.uuid4(), uuid.uuid4()]
+    terminated = []
+
+    def answer(text):
+        if text.startswith("SELECT schedules.id"):
+            return StubResult(rows=schedule_ids)
+        return StubResult(device)
+
+    class Handle:
+        def __init__(self, workflow_id):
+            self.workflow_id = workflow_id
+
+        async def terminate(self, reason):
+            terminated.append((self.workflow_id, reason))
+
+    class Client:
+        def get_workflow_handle(self, workflow_id):
+            return Handle(workflow_id)
+
+    async def get_temporal_client():
+        return Client()
+
+    monkeypatch.setattr(devices, "get_temporal_client", get_temporal_client)
+    session = StubSession(answer)
+
+    response = request(session, "DELETE", f"/devices/{device.id}")
+
+    assert response.status_code == 202
+    body = response.json()
+    assert (body["entity_type"], body["entity_id"], body["status"]) == ("device", str(device.id), "pending")
+    assert device.deleted_at is not None and session.commits == 1
+    assert sorted(terminated) == sorted((f"schedule-execution-{s}", "device deleted") for s in schedule_ids)
+
+
+def test_delete_device_temporal_unavailable(monkeypatch):
+    # Тест недоступного Temporal: удаление все равно принимается, Workflow остановит задание очистки.
+    device = SimpleNamespace(id=uuid.uuid4(), deleted_at=None)
+
+    async def get_temporal_client():
+        raise ConnectionError("temporal is down")
+
+    monkeypatch.setattr(devices, "get_temporal_client", get_temporal_client)
+    session = StubSession(lambda text: StubResult(device, rows=[uuid.uuid4()]))
+
+    assert request(session, "DELETE", f"/devices/{device.id}").status_code == 202
+
+
+def test_retry_only_failed_job():
+    # Тест POST /purge/{id}/retry: failed -> pending одним условным UPDATE, иначе 409.
+    job = purge_job(status="pending", results_processed=10, batches=2, error=None)
+    asyncio.run(StubSession().refresh(job))
+    session = StubSession(lambda text: StubResult(job))
+
+    response = request(session, "POST", f"/purge/{job.id}/retry")
+
+    assert response.status_code == 200 and response.json()["status"] == "pending"
+    statement = session.statements[0]
+    assert "SET status='pending', error=NULL" in statement
+    assert "AND purge_jobs.status = 'failed'" in statement and session.commits == 1
+
+    # Задание не в статусе failed (или не найдено): UPDATE ничего не изменил
+    assert request(StubSession(), "POST", f"/purge/{job.id}/retry").status_code == 409
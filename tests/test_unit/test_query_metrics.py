@@ -0,0 +1,33 @@
+# tests/test_unit/test_query_metrics.py
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.query_metrics import assert_query_budget, collect_queries, instrument_engine, parameter_shape
+
+
+def test_parameter_shape_hides_values():
+    # Тест формы параметров: в лог медленных запросов попадают типы и размеры, но не значения.
+    assert parameter_shape((uuid.uuid4(), "secret", 5)) == "(UUID, str(6), int)"
+    assert parameter_shape({"ids": [1, 2, 3], "flag": None}) == "{ids: list[3], flag: NoneType}"
+    assert parameter_shape([(1,), (2,)], executemany=True) == "2 x (int)"
+
+
+def test_query_budget():
+    # Тест бюджета запросов: вложенные сборщики видят запросы блока, превышение бюджета - AssertionError.
+    engine = instrument_engine(create_engine("sqlite://"))
+    with engine.connect() as conn:
+        with collect_queries() as outer:
+            with assert_query_budget(2) as stats:
+                conn.execute(text("SELECT 1"))
+                conn.execute(text("SELECT 1"))
+            assert stats.count == 2
+            with pytest.raises(AssertionError, match="2 x SELECT 1"):
+                with assert_query_budget(1):
+                    conn.execute(text("SELECT 1"))
+                    conn.execute(text("SELECT 1"))
+        assert outer.count == 4
+        assert outer.repeated(threshold=4) == [("SELECT 1", 4)]
+        conn.execute(text("SELECT 1"))
+    assert outer.count == 4
@@ -0,0 +1,94 @@
+# tests/test_unit/test_ratelimit.py
+import fakeredis
+import pytest
+
+import ratelimit
+from ratelimit import DeviceRateLimiter, Limit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "time", clock.time)
+    return clock
+
+
+@pytest.fixture
+def r():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def test_defaults_do_not_limit(r, monkeypatch):
+    # Тест настроек по умолчанию: без RATE_LIMIT_* задачи не ограничиваются и Redis не используется.
+    for name in ("RATE_LIMIT_DEVICE_CONCURRENCY", "RATE_LIMIT_DEVICE_RATE", "RATE_LIMIT_DEVICE_BURST",
+                 "RATE_LIMIT_DEVICE_TYPES"):
+        monkeypatch.delenv(name, raising=False)
+    limiter = DeviceRateLimiter(r)
+
+    assert not limiter.device_limit.enabled
+    permits = [limiter.acquire("d1", "router") for _ in range(100)]
+    assert all(permit is not None and wait == 0 for permit, wait in permits)
+    assert r.keys(f"{ratelimit.KEY_PREFIX}*") == []
+
+
+def test_token_bucket(r, clock):
+    # Тест token bucket: burst команд сразу, затем ожидание пополнения со скоростью rate.
+    limiter = DeviceRateLimiter(r, device_limit=Limit(rate=2, burst=3), type_limits={})
+
+    assert all(limiter.acquire("d1", "router")[0] is not None for _ in range(3))
+    permit, wait = limiter.acquire("d1", "router")
+    assert permit is None and wait == pytest.approx(0.5)
+    # Другое устройство ограничивается своей корзиной
+    assert limiter.acquire("d2", "router")[0] is not None
+
+    clock.now += 0.5
+    assert limiter.acquire("d1", "router")[0] is not None
+    assert limiter.acquire("d1", "router")[0] is None
+    # Корзина не наполняется больше burst
+    clock.now += 60
+    assert sum(limiter.acquire("d1", "router")[0] is not None for _ in range(5)) == 3
+
+
+def test_semaphore_release_and_lease_expiry(r, clock):
+    # Тест семафора: не больше concurrency задач, место освобождается release или по истечении аренды.
+    limiter = DeviceRateLimiter(r, device_limit=Limit(concurrency=2), type_limits={}, lease_seconds=10)
+
+    first, _ = limiter.acquire("d1", "router")
+    second, _ = limiter.acquire("d1", "router")
+    permit, wait = limiter.acquire("d1", "router")
+    assert first is not None and second is not None
+    assert permit is None and 0 < wait <= 1.0
+
+    limiter.release(first)
+    third, _ = limiter.acquire("d1", "router")
+    assert third is not None
+    assert limiter.acquire("d1", "router")[0] is None
+
+    # Реплика упала, не освободив аренды: после RATE_LIMIT_LEASE_SECONDS места снова свободны
+    clock.now += 11
+    assert limiter.acquire("d1", "router")[0] is not None
+
+
+def test_acquire_is_all_or_nothing(r, clock):
+    # Тест атомарности: отказ по лимиту типа устройства не списывает токены и аренды устройства.
+    limiter = DeviceRateLimiter(r, device_limit=Limit(concurrency=5, rate=1, burst=1),
+                                type_limits={"router": Limit(concurrency=1)})
+
+    held, _ = limiter.acquire("d1", "router")
+    assert held is not None
+    clock.now += 1
+    permit, wait = limiter.acquire("d2", "router")
+    assert permit is None and wait > 0
+    assert r.zcard(f"{ratelimit.KEY_PREFIX}sem:device:d2") == 0
+    assert not r.exists(f"{ratelimit.KEY_PREFIX}bucket:device:d2")
+
+    limiter.release(held)
+    assert limiter.acquire("d2", "router")[0] is not None
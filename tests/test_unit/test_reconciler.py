@@ -0,0 +1,204 @@
+# tests/test_unit/test_reconciler.py
+import asyncio
+import uuid
+
+from app import reconciler
+from app.reconciler import plan
+from app.schedule_workflows import (TASK_QUEUE, cron_min_interval_seconds, spec_of, start_offset_seconds,
+                                    task_queue_for, workflow_input)
+
+
+def test_reconcile_plan():
+    # Тест сверки: запуск недостающих, остановка лишних и перезапуск измененных Workflow.
+    def schedule(cron):
+        schedule_id = uuid.uuid4()
+        return str(schedule_id), workflow_input(schedule_id, uuid.uuid4(), uuid.uuid4(), "router", cron, "normal")
+
+    missing, unchanged, changed = schedule("*/5 * * * *"), schedule("0 * * * *"), schedule("0 2 * * *")
+    desired = dict([missing, unchanged, changed])
+    orphan = str(uuid.uuid4())
+    running = {
+        unchanged[0]: spec_of(unchanged[1]),
+        changed[0]: spec_of({**changed[1], "cron_expression": "0 3 * * *"}),
+        orphan: None,
+    }
+
+    to_start, to_stop, to_update = plan(desired, running)
+
+    assert to_start == [missing[0]]
+    assert to_stop == [orphan]
+    assert to_update == [changed[0]]
+
+
+def test_start_offset_within_cron_period(monkeypatch):
+    # Тест смещения запуска: детерминированно, внутри окна и не дальше половины интервала cron.
+    monkeypatch.delenv("SCHEDULE_JITTER_RESERVE_SECONDS", raising=False)
+    schedule_ids = [uuid.uuid4() for _ in range(200)]
+
+    offsets = [workflow_input(s, uuid.uuid4(), uuid.uuid4(), "router", "*/1 * * * *", "normal", jitter_seconds=300)
+               .get("start_offset_seconds", 0) for s in schedule_ids]
+    assert all(0 <= offset < 30 for offset in offsets)
+    assert len(set(offsets)) > 20
+
+    again = workflow_input(schedule_ids[0], uuid.uuid4(), uuid.uuid4(), "router", "*/1 * * * *", "normal",
+                           jitter_seconds=300)
+    assert again.get("start_offset_seconds", 0) == offsets[0]
+    # 0 - без смещения, поле не добавляется во входные данные
+    assert "start_offset_seconds" not in workflow_input(
+        schedule_ids[0], uuid.uuid4(), uuid.uuid4(), "router", "0 * * * *", "normal", jitter_seconds=0)
+
+
+def test_start_offset_capped_by_min_interval(monkeypatch):
+    # Тест окна смещения: интервал считается по полям минут и часов, запас на выполнение вычитается из окна.
+    monkeypatch.setenv("SCHEDULE_JITTER_RESERVE_SECONDS", "15")
+    assert cron_min_interval_seconds("*/5 * * * *") == 300
+    # Неравномерный шаг: после :55 следующий запуск через 4 минуты
+    assert cron_min_interval_seconds("*/7 * * * *") == 240
+    assert cron_min_interval_seconds("15,45 * * * *") == 1800
+    assert cron_min_interval_seconds("0 9-17/4 * * *") == 4 * 3600
+    # Дни недели не уменьшают интервал: для рабочих дней оценка снизу - сутки
+    assert cron_min_interval_seconds("0 9 * * 1-5") == 86400
+
+    schedule_ids = [uuid.uuid4() for _ in range(200)]
+    for cron, limit in (("*/5 * * * *", 150 - 15), ("15,45 * * * *", 900 - 15), ("0 9 * * 1-5", 43200 - 15)):
+        offsets = [start_offset_seconds(s, cron, 86400) for s in schedule_ids]
+        assert all(0 <= offset < limit for offset in offsets) and max(offsets) > limit // 2
+
+
+def test_start_offset_unknown_interval_is_zero():
+    # Тест неразобранного cron: интервал неизвестен, смещение не применяется при любом окне.
+    for cron in ("@hourly", "0 9 * *", "H/5 * * * *", "*/0 * * * *", "61 * * * *", "0 22-2 * * *"):
+        assert cron_min_interval_seconds(cron) is None
+        assert start_offset_seconds(uuid.uuid4(), cron, 86400) == 0
+
+
+def test_task_queue_routes_change_spec():
+    # Тест партиций очередей: маршрут по device_type, смена очереди перезапускает Workflow.
+    routes = {"router": "routers", "switch": "default"}
+    assert task_queue_for("router", routes) == f"{TASK_QUEUE}-routers"
+    assert task_queue_for("switch", routes) == TASK_QUEUE
+    assert task_queue_for(None, routes) == TASK_QUEUE
+
+    schedule_id = uuid.uuid4()
+    input_data = workflow_input(schedule_id, uuid.uuid4(), uuid.uuid4(), "router", "0 * * * *", "normal")
+    # Без маршрутов отпечаток прежний
+    running = {str(schedule_id): spec_of(input_data, {})}
+    assert plan({str(schedule_id): input_data}, running, {})[2] == []
+    assert plan({str(schedule_id): input_data}, running, routes)[2] == [str(schedule_id)]
+
+
+class LockResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class LockConnection:
+    def __init__(self):
+        self.invalidated = False
+
+    async def invalidate(self):
+        self.invalidated = True
+
+
+class LockSession:
+    # Сессия БД: запоминает запросы, режим соединения и открытые/закрытые сессии в общем журнале
+    def __init__(self, journal, locked=True, unlock_error=None):
+        self.journal, self.locked, self.unlock_error = journal, locked, unlock_error
+        self.lock_connection = LockConnection()
+
+    async def __aenter__(self):
+        self.journal.append(("open", self))
+        return self
+
+    async def __aexit__(self, *exc):
+        self.journal.append(("close", self))
+        return False
+
+    async def connection(self, execution_options=None):
+        self.journal.append(("connection", execution_options))
+        return self.lock_connection
+
+    async def execute(self, stmt, *args, **kwargs):
+        self.journal.append(("execute", str(stmt)))
+        if "unlock" in str(stmt) and self.unlock_error:
+            raise self.unlock_error
+        return LockResult(self.locked)
+
+
+def test_reconcile_loads_running_before_desired(monkeypatch):
+    # Тест порядка сверки: расписание, созданное между чтением Temporal и PostgreSQL, запускается, а не останавливается.
+    calls = []
+    created = workflow_input(uuid.uuid4(), uuid.uuid4(), uuid.uuid4(), "router", "0 * * * *", "normal")
+    journal = []
+
+    async def load_running(client):
+        calls.append("running")
+        return {}
+
+    async def load_desired(db):
+        calls.append("desired")
+        journal.append(("desired", db))
+        # Расписание создано через API после чтения работающих Workflow
+        return {created["schedule_id"]: created}
+
+    started, stopped = [], []
+
+    async def start(client, input_data, replace=False):
+        journal.append(("start", input_data["schedule_id"]))
+        started.append((input_data["schedule_id"], replace))
+
+    async def stop(client, schedule_id, reason):
+        stopped.append(schedule_id)
+        return True
+
+    monkeypatch.setattr(reconciler, "load_running", load_running)
+    monkeypatch.setattr(reconciler, "load_desired", load_desired)
+    monkeypatch.setattr(reconciler, "start_schedule_workflow", start)
+    monkeypatch.setattr(reconciler, "stop_schedule_workflow", stop)
+
+    report = asyncio.run(reconciler.reconcile(object(), lambda: LockSession(journal)))
+
+    assert calls == ["running", "desired"]
+    assert started == [(created["schedule_id"], False)] and stopped == []
+    assert report.started == 1 and report.stopped == 0
+
+    # Блокировка сессионная, на соединении в autocommit; desired читается в отдельной сессии,
+    # которая закрывается до обращений к Temporal, блокировка снимается в конце прохода
+    lock_db, desired_db = journal[0][1], journal[3][1]
+    assert desired_db is not lock_db
+    assert journal == [
+        ("open", lock_db),
+        ("connection", {"isolation_level": "AUTOCOMMIT"}),
+        ("execute", "SELECT pg_try_advisory_lock(:key)"),
+        ("open", desired_db),
+        ("desired", desired_db),
+        ("close", desired_db),
+        ("start", created["schedule_id"]),
+        ("execute", "SELECT pg_advisory_unlock(:key)"),
+        ("close", lock_db),
+    ]
+    assert not lock_db.lock_connection.invalidated
+
+
+def test_reconcile_lock_busy_or_unlock_failed(monkeypatch):
+    # Тест блокировки сверки: занята другой репликой - проход пропускается, не снята - соединение не возвращается в пул.
+    journal = []
+    report = asyncio.run(reconciler.reconcile(object(), lambda: LockSession(journal, locked=False)))
+    assert report.skipped and [entry for entry in journal if entry[0] == "open"] == [journal[0]]
+
+    async def empty(*args):
+        return {}
+
+    monkeypatch.setattr(reconciler, "load_running", empty)
+    monkeypatch.setattr(reconciler, "load_desired", empty)
+    sessions = []
+
+    def session_factory():
+        sessions.append(LockSession([], unlock_error=ConnectionError("connection lost")))
+        return sessions[-1]
+
+    report = asyncio.run(reconciler.reconcile(object(), session_factory))
+    assert not report.skipped and sessions[0].lock_connection.invalidated
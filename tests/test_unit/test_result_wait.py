@@ -0,0 +1,60 @@
+# tests/test_unit/test_result_wait.py
+import asyncio
+
+import fakeredis
+import pytest
+import redis
+
+from workflows.completions import run_results_stream
+from workflows.schedule_workflow import wait_for_result_from_redis
+
+
+class RecordingRedis(fakeredis.FakeRedis):
+    # Запоминает записи, которые ожидание результата прочитало из потоков
+    read = []
+
+    def xread(self, *args, **kwargs):
+        messages = super().xread(*args, **kwargs)
+        for _, entries in messages or []:
+            RecordingRedis.read.extend(entry_id for entry_id, _ in entries)
+        return messages
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    server = fakeredis.FakeServer()
+    RecordingRedis.read = []
+    monkeypatch.setattr(redis, "Redis", lambda *args, **kwargs: RecordingRedis(server=server, decode_responses=True))
+    return RecordingRedis(server=server, decode_responses=True)
+
+
+def test_wait_reads_only_own_run_stream(fake_redis):
+    # Тест ожидания результата: второй запуск читает только свой поток ответов, а не накопленные
+    # результаты других расписаний и прошлых запусков; поток запуска удаляется после чтения.
+    for i in range(50):
+        fake_redis.xadd("results", {"schedule_id": f"other-{i}", "status": "success"})
+    fake_redis.xadd(run_results_stream("run-1"), {"schedule_id": "s1", "status": "failed", "idempotency_key": "run-1"})
+    own_id = fake_redis.xadd(run_results_stream("run-2"),
+                             {"schedule_id": "s1", "status": "success", "output": "ok", "idempotency_key": "run-2"})
+
+    result = asyncio.run(wait_for_result_from_redis(
+        {"schedule_id": "s1", "reply_to": run_results_stream("run-2"), "idempotency_key": "run-2"}))
+
+    assert result["status"] == "success" and result["output"] == "ok"
+    assert RecordingRedis.read == [own_id]
+    assert not fake_redis.exists(run_results_stream("run-2"))
+    assert fake_redis.xlen(run_results_stream("run-1")) == 1
+    assert fake_redis.xlen("results") == 50
+
+
+def test_wait_skips_result_of_other_run(fake_redis):
+    # Тест сопоставления по ключу идемпотентности: поздний ответ другой задачи того же расписания
+    # в потоке запуска пропускается, возвращается результат с ключом этого запуска.
+    stream = run_results_stream("run-2")
+    fake_redis.xadd(stream, {"schedule_id": "s1", "status": "failed", "idempotency_key": "run-1"})
+    fake_redis.xadd(stream, {"schedule_id": "s1", "status": "success", "idempotency_key": "run-2"})
+
+    result = asyncio.run(wait_for_result_from_redis(
+        {"schedule_id": "s1", "reply_to": stream, "idempotency_key": "run-2"}))
+
+    assert result["status"] == "success" and result["idempotency_key"] == "run-2"
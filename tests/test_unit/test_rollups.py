@@ -0,0 +1,26 @@
+# tests/test_unit/test_rollups.py
+from datetime import datetime, timezone
+
+from app import models
+from app.rollups import HISTOGRAM_COLUMNS, bucket_start, histogram_index, percentile
+
+
+def test_bucket_start():
+    # Тест начала интервала агрегации (5 минут и час).
+    moment = datetime(2024, 5, 1, 12, 38, 15, tzinfo=timezone.utc)
+
+    assert bucket_start(moment, 300) == datetime(2024, 5, 1, 12, 35, tzinfo=timezone.utc)
+    assert bucket_start(moment, 3600) == datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_histogram_percentile():
+    # Тест оценки процентилей по гистограмме длительностей.
+    histogram = [0] * len(HISTOGRAM_COLUMNS)
+    for duration_ms in (3100, 3500, 4200, 4800, 6900):
+        histogram[histogram_index(duration_ms)] += 1
+
+    assert 3000 <= percentile(histogram, 50, max_ms=6900) <= 5000
+    assert 5000 <= percentile(histogram, 99, max_ms=6900) <= 6900
+    assert percentile([0] * len(HISTOGRAM_COLUMNS), 50) is None
+    # Колонки гистограммы модели совпадают с границами корзин
+    assert all(hasattr(models.ResultRollup, name) for name in HISTOGRAM_COLUMNS)
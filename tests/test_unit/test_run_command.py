@@ -0,0 +1,145 @@
+# tests/test_unit/test_run_command.py
+import asyncio
+import json
+import uuid
+from types import SimpleNamespace
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.database import get_db
+from app.main import app as application
+from app.on_demand import TASK_STREAM
+from app.routers import commands
+
+
+class StubResult:
+    def __init__(self, row):
+        self.row = row
+
+    def first(self):
+        return self.row
+
+
+class StubSession:
+    # Сессия БД: запрос команды возвращает заданную строку, записи результатов запоминаются;
+    # commit_error - ошибка при сохранении результата
+    def __init__(self, row, commit_error=None):
+        self.row = row
+        self.added = []
+        self.commit_error = commit_error
+        self.rollbacks = 0
+
+    async def execute(self, stmt):
+        return StubResult(self.row)
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    async def commit(self):
+        if self.commit_error:
+            raise self.commit_error
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # Клиент Redis раннера создается в цикле событий запроса (см. run) и после теста сбрасывается
+    monkeypatch.setattr(commands.runner, "_redis", None)
+    return fakeredis.FakeServer()
+
+
+def run(server, session, path, params, executor=None):
+    # Запрос к API; executor - корутина, которая отвечает на задачи вместо Executor'а
+    async def scenario():
+        commands.runner._redis = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+        application.dependency_overrides[get_db] = lambda: session
+        try:
+            async with AsyncClient(transport=ASGITransport(app=application), base_url="http://test") as ac:
+                if executor is None:
+                    return await ac.post(path, params=params)
+                responder = asyncio.create_task(executor())
+                try:
+                    return await ac.post(path, params=params)
+                finally:
+                    responder.cancel()
+        finally:
+            application.dependency_overrides.clear()
+    return asyncio.run(scenario())
+
+
+def command_row():
+    device = SimpleNamespace(id=uuid.uuid4(), device_type="router", ip_address="10.0.0.1")
+    command = SimpleNamespace(id=uuid.uuid4(), command_string="show version")
+    return command, device
+
+
+async def executor():
+    # Executor: отвечает на каждую задачу успешным выводом show version
+    r, last_id = commands.runner.redis, "0"
+    while True:
+        for _, messages in await r.xread({TASK_STREAM: last_id}, block=100) or []:
+            for last_id, task in messages:
+                reply = {"status": "success", "output": "Version 15.1", "duration_ms": "12",
+                         "parsed": json.dumps({"parser": "show_version", "version": "15.1"})}
+                await r.lpush(task["reply_list"], json.dumps(reply))
+
+
+def test_run_unknown_command_404(server):
+    # Тест 404: команды нет (или устройство удалено) - задача не публикуется.
+    response = run(server, StubSession(None), f"/commands/{uuid.uuid4()}/run", {})
+    redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+
+    assert response.status_code == 404
+    assert redis.exists(TASK_STREAM) == 0
+
+
+def test_run_timeout_504(server):
+    # Тест 504: Executor не ответил за timeout_seconds, ответ содержит run_id опубликованной задачи.
+    command, device = command_row()
+    session = StubSession((command, device))
+
+    response = run(server, session, f"/commands/{command.id}/run", {"timeout_seconds": 0.2})
+    redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+
+    assert response.status_code == 504
+    tasks = redis.xrange(TASK_STREAM)
+    assert len(tasks) == 1
+    assert tasks[0][1]["idempotency_key"] in response.json()["detail"]
+    assert session.added == []
+
+
+def test_run_without_save(server):
+    # Тест save=false: результат Executor'а возвращается клиенту, в command_results ничего не пишется.
+    command, device = command_row()
+    session = StubSession((command, device))
+
+    response = run(server, session, f"/commands/{command.id}/run", {"save": "false", "timeout_seconds": 5}, executor)
+    redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "success" and body["result_id"] is None and body["saved"] is False
+    assert body["parsed"] == {"parser": "show_version", "version": "15.1"}
+    assert body["duration_ms"] == 12 and body["device_id"] == str(device.id)
+    assert session.added == []
+    # Список ответа удаляется после получения результата
+    assert redis.keys("run-reply:*") == []
+
+
+def test_run_save_failure_returns_output(server):
+    # Тест ошибки сохранения: команда уже выполнена - вывод возвращается с saved=false, а не 500.
+    command, device = command_row()
+    session = StubSession((command, device), commit_error=ConnectionError("connection lost"))
+
+    response = run(server, session, f"/commands/{command.id}/run", {"timeout_seconds": 5}, executor)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["output"] == "Version 15.1" and body["status"] == "success"
+    assert body["saved"] is False and body["result_id"] is None
+    assert len(session.added) == 1 and session.rollbacks == 2
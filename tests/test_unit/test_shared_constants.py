@@ -0,0 +1,49 @@
+# tests/test_unit/test_shared_constants.py
+'''
+Константы, общие для сервисов. API, Worker и Executor собираются из отдельных каталогов и не импортируют
+код друг друга, поэтому значения продублированы; тесты не дают им разойтись.
+'''
+import importlib.util
+import os
+
+import lanes
+import profiling as executor_profiling
+from app import on_demand, profiling, schedule_workflows
+from workflows import completions
+from workflows import profiling as worker_profiling
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def executor_main():
+    # executor/main.py загружается по пути: модуль main есть и у фермы устройств
+    spec = importlib.util.spec_from_file_location("executor_main", os.path.join(ROOT_DIR, "executor", "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_workflow_id_prefix_matches():
+    # Тест ID Workflow: потребитель результатов Worker'а адресует сигналы тем же Workflow, которые запускает API.
+    assert completions.WORKFLOW_ID_PREFIX == schedule_workflows.WORKFLOW_ID_PREFIX
+    assert schedule_workflows.workflow_id_for("s1") == f"{completions.WORKFLOW_ID_PREFIX}s1"
+
+
+def test_run_results_prefix_matches():
+    # Тест потоков ответов запусков: Executor ставит TTL именно на те потоки, которые ждет Worker.
+    assert executor_main().RUN_RESULTS_PREFIX == completions.RUN_RESULTS_PREFIX
+    assert completions.run_results_stream("run-1").startswith(completions.RUN_RESULTS_PREFIX)
+
+
+def test_on_demand_stream_is_high_lane():
+    # Тест запуска по требованию: API публикует задачи в поток высокого приоритета, который читает Executor.
+    assert on_demand.TASK_STREAM == lanes.LANE_STREAMS["high"]
+
+
+def test_profiling_keys_match():
+    # Тест профилирования: счетчики и профили Executor'а и Worker'а читает и задает API.
+    for service_profiling in (executor_profiling, worker_profiling):
+        assert service_profiling.INDEX_KEY == profiling.INDEX_KEY
+        assert service_profiling.PROFILE_KEY_PREFIX == profiling.PROFILE_KEY_PREFIX
+    assert executor_profiling.ARM_KEY == f"{profiling.ARM_KEY_PREFIX}executor"
+    assert worker_profiling.ARM_KEY == f"{profiling.ARM_KEY_PREFIX}worker"
@@ -19,6 +19,7 @@
 # worker/main.py
 import asyncio
 import logging
+import os
 from temporalio.client import Client
 from temporalio.worker import Worker
 
@@ -30,6 +31,9 @@ from workflows.schedule_workflow import (
     save_result_to_api,
     fetch_command_details  # <-- Получить данные о команде из БД (через апи)
 )
+from workflows.completions import ResultCompletionConsumer, completion_mode
+from workflows.task_queues import subscriptions_from_env
+from workflows.profiling import ActivityProfiler, ProfilingInterceptor
 
 logging.basicConfig(level=logging.INFO) # включаем систему логирования
 
@@ -55,24 +59,47 @@ async def main():
         logging.error(f"Failed to connect to Temporal: {e}")
         return
 
-    # Создание и запуск Worker'а
+    # Создание и запуск Worker'ов: по одному на каждую очередь задач из WORKER_TASK_QUEUES (см. workflows/task_queues.py)
     try:
-        worker = Worker(
-            client,
-            task_queue="scheduled-tasks",  # Должна совпадать с task_queue_name в API
-            workflows=[ScheduleExecutionWorkflow],  # Список классов Workflow
-            activities=[
-                publish_task_to_redis,
-                wait_for_result_from_redis,
-                save_result_to_api,
-                fetch_command_details
-            ],
+        subscriptions = subscriptions_from_env()
+        # Профилирование N следующих Activity (WORKER_PROFILE_ACTIVITIES или POST /admin/profiles/arm в API)
+        profiler = ActivityProfiler(
+            redis_host=os.getenv("REDIS_HOST", "scheduled_commands_redis"),
+            redis_port=int(os.getenv("REDIS_PORT", "6379")),
         )
-        logging.info("Starting Temporal Worker...")
-        await worker.run()
+        workers = [
+            Worker(
+                client,
+                task_queue=subscription.task_queue,  # Должна совпадать с очередью, выбранной в API (TASK_QUEUE_ROUTES)
+                workflows=[ScheduleExecutionWorkflow],  # Список классов Workflow
+                activities=[
+                    publish_task_to_redis,
+                    wait_for_result_from_redis,
+                    save_result_to_api,
+                    fetch_command_details
+                ],
+                max_concurrent_activities=subscription.max_concurrent_activities,
+                max_concurrent_workflow_tasks=subscription.max_concurrent_workflow_tasks,
+                interceptors=[ProfilingInterceptor(profiler)],
+            )
+            for subscription in subscriptions
+        ]
+        for subscription in subscriptions:
+            logging.info(f"Starting Temporal Worker on '{subscription.task_queue}' "
+                         f"(activities={subscription.max_concurrent_activities}, "
+                         f"workflow tasks={subscription.max_concurrent_workflow_tasks})...")
+        runs = [worker.run() for worker in workers]
+        if completion_mode() == "signal":
+            # Результаты Executor'а доставляются в Workflow сигналами (см. workflows/completions.py)
+            consumer = ResultCompletionConsumer(
+                client,
+                redis_host=os.getenv("REDIS_HOST", "scheduled_commands_redis"),
+                redis_port=int(os.getenv("REDIS_PORT", "6379")),
+            )
+            runs.append(consumer.run())
+        await asyncio.gather(*runs)
     except Exception as e:
         logging.error(f"Error while running Temporal Worker: {e}")
 
-
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
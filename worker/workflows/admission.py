@@ -0,0 +1,110 @@
+# worker/workflows/admission.py
+'''
+Контроль допуска (admission control) задач в потоки Redis.
+
+Перед публикацией задачи Worker смотрит на отставание группы executor_group в целевом потоке:
+    - lag     - сколько записей еще не выдано ни одному Executor'у (XINFO GROUPS, Redis 7+; иначе XLEN);
+    - pending - сколько выдано, но еще не подтверждено (выполняется или зависло).
+
+Состояния:
+    open      - ниже мягких порогов, публикуем сразу;
+    throttled - между мягким и жестким порогом, публикуем с задержкой, растущей линейно до BACKPRESSURE_MAX_DELAY_SECONDS;
+    deferred  - выше жесткого порога, не публикуем: Activity завершается ошибкой и Temporal повторяет ее с backoff.
+
+Так при аварии или всплеске очередь не растет без предела, и задачи не упираются в 5-минутный таймаут ожидания
+результата: они ждут допуска до публикации. Текущее состояние пишется в хеш backpressure:{stream} (TTL 60 сек)
+и в лог, чтобы его было видно снаружи.
+'''
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY_PREFIX = "backpressure:"
+CONSUMER_GROUP = "executor_group"
+
+
+@dataclass
+class AdmissionDecision:
+    state: str  # 'open', 'throttled', 'deferred'
+    lag: int
+    pending: int
+    delay_seconds: float = 0.0
+
+
+class AdmissionController:
+    def __init__(self):
+        self.lag_soft = int(os.getenv("BACKPRESSURE_LAG_SOFT", "1000"))
+        self.lag_hard = int(os.getenv("BACKPRESSURE_LAG_HARD", "5000"))
+        self.pending_soft = int(os.getenv("BACKPRESSURE_PENDING_SOFT", "500"))
+        self.pending_hard = int(os.getenv("BACKPRESSURE_PENDING_HARD", "2000"))
+        self.max_delay_seconds = float(os.getenv("BACKPRESSURE_MAX_DELAY_SECONDS", "10"))
+        # Замеры кэшируются, чтобы не делать XINFO на каждую публикацию
+        self.cache_seconds = float(os.getenv("BACKPRESSURE_CACHE_SECONDS", "1"))
+        self._cache = {}
+
+    def measure(self, r, stream: str):
+        cached = self._cache.get(stream)
+        if cached and time.monotonic() - cached[0] < self.cache_seconds:
+            return cached[1], cached[2]
+
+        lag, pending = None, 0
+        try:
+            for group in r.xinfo_groups(stream):
+                if group["name"] == CONSUMER_GROUP:
+                    lag = group.get("lag")
+                    pending = group["pending"]
+                    break
+        except Exception as e:
+            # Потока еще нет - задач тоже нет
+            logger.debug(f"Failed to read consumer groups for '{stream}': {e}")
+        if lag is None:
+            # Redis < 7 или группа еще не создана: оценка сверху длиной потока
+            lag = r.xlen(stream)
+
+        self._cache[stream] = (time.monotonic(), lag, pending)
+        return lag, pending
+
+    def decide(self, lag: int, pending: int) -> AdmissionDecision:
+        if lag >= self.lag_hard or pending >= self.pending_hard:
+            return AdmissionDecision("deferred", lag, pending)
+        pressure = max(
+            _fraction(lag, self.lag_soft, self.lag_hard),
+            _fraction(pending, self.pending_soft, self.pending_hard),
+        )
+        if pressure <= 0:
+            return AdmissionDecision("open", lag, pending)
+        return AdmissionDecision("throttled", lag, pending, delay_seconds=pressure * self.max_delay_seconds)
+
+    def check(self, r, stream: str) -> AdmissionDecision:
+        lag, pending = self.measure(r, stream)
+        decision = self.decide(lag, pending)
+        if decision.state != "open":
+            logger.warning(f"Backpressure on '{stream}': state={decision.state}, lag={lag}, pending={pending}, "
+                           f"delay={decision.delay_seconds:.1f}s")
+        try:
+            key = f"{STATE_KEY_PREFIX}{stream}"
+            r.hset(key, mapping={
+                "state": decision.state,
+                "lag": lag,
+                "pending": pending,
+                "delay_seconds": round(decision.delay_seconds, 2),
+                "updated_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+            })
+            r.expire(key, 60)
+        except Exception as e:
+            logger.debug(f"Failed to store backpressure state for '{stream}': {e}")
+        return decision
+
+
+def _fraction(value: int, soft: int, hard: int) -> float:
+    # Доля пути от мягкого порога к жесткому (0 - ниже мягкого)
+    if value < soft:
+        return 0.0
+    return min(1.0, (value - soft) / max(1, hard - soft))
+
+
+# Один контроллер на процесс Worker'а (общий кэш замеров)
+admission_controller = AdmissionController()
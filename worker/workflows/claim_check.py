@@ -0,0 +1,58 @@
+# worker/workflows/claim_check.py
+'''
+Claim-check для больших результатов выполнения.
+
+Результат Activity, входные данные следующей Activity и результат Workflow сохраняются в истории Temporal.
+Вывод вроде "show running-config" (мегабайты) попадал бы туда несколько раз за каждый запуск: растут история,
+нагрузка на БД Temporal и время replay.
+
+Поэтому wait_for_result_from_redis выносит вывод и разобранный вывод, если вместе они больше
+CLAIM_CHECK_THRESHOLD_BYTES, в отдельный ключ Redis (result-payload:{schedule_id}:{message_id}, TTL
+CLAIM_CHECK_TTL_SECONDS). Через Workflow проходит только ссылка payload_ref. save_result_to_api по ссылке
+достает данные, отправляет их в API и удаляет ключ; если результат так и не сохранен, ключ удалится по TTL.
+'''
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "result-payload:"
+# Поля сообщения Executor'а, которые выносятся из истории Workflow
+PAYLOAD_FIELDS = ("output", "parsed")
+
+
+def threshold_bytes() -> int:
+    return int(os.getenv("CLAIM_CHECK_THRESHOLD_BYTES", "16384"))
+
+
+def check_in(r, schedule_id: str, message_id: str, message: dict) -> dict:
+    # Возвращает сообщение для истории Workflow: большие поля заменены ссылкой payload_ref
+    payload = {name: message.get(name) or "" for name in PAYLOAD_FIELDS}
+    size = sum(len(value.encode()) for value in payload.values())
+    if size <= threshold_bytes():
+        return message
+
+    key = f"{KEY_PREFIX}{schedule_id}:{message_id}"
+    r.set(key, json.dumps(payload), ex=int(os.getenv("CLAIM_CHECK_TTL_SECONDS", "86400")))
+    logger.info(f"Stored {size} bytes of result payload for schedule {schedule_id} in '{key}'")
+    slim = {name: value for name, value in message.items() if name not in PAYLOAD_FIELDS}
+    slim["payload_ref"] = key
+    slim["payload_bytes"] = str(size)
+    return slim
+
+
+def check_out(r, ref: str):
+    # Данные по ссылке или None, если ключ уже удален (истек TTL)
+    raw = r.get(ref)
+    if raw is None:
+        return None
+    return json.loads(raw)
+
+
+def release(r, ref: str):
+    try:
+        r.delete(ref)
+    except Exception as e:
+        # Ключ все равно удалится по TTL
+        logger.warning(f"Failed to delete result payload '{ref}': {e}")
@@ -0,0 +1,141 @@
+# worker/workflows/completions.py
+'''
+Асинхронное завершение ожидания результата (RESULT_COMPLETION_MODE=signal).
+
+В режиме poll (по умолчанию) Activity wait_for_result_from_redis занимает слот Worker'а и ждет результат
+в потоке ответов своего запуска (results:run:{run_id}) все время выполнения команды - до 5 минут на каждый
+запуск. В режиме signal:
+    - publish_task_to_redis просит Executor ответить в поток results:completions (поле задачи reply_to);
+    - Workflow ждет сигнал result_ready на таймере Temporal (wait_condition): слоты Activity и память Worker'а
+      не заняты, ожидающие Workflow вытесняются из кэша и восстанавливаются по истории при сигнале;
+    - ResultCompletionConsumer (запускается в процессе Worker'а) читает results:completions группой
+      completions_group и отправляет результат сигналом точно в тот запуск Workflow, который опубликовал
+      задачу (workflow_id из задачи, run_id = ключ идемпотентности задачи).
+Сигнал отправляется до XACK: при падении реплики сообщение остается pending, и его забирает (XAUTOCLAIM)
+другая реплика через RESULT_CONSUMER_CLAIM_IDLE_SECONDS. Повторный сигнал Workflow игнорирует. Если запуск
+уже завершился (например, по таймауту ожидания), результат отбрасывается.
+
+Большой вывод выносится в Redis так же, как в режиме poll (см. claim_check.py): сигнал попадает в историю Workflow.
+'''
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+COMPLETIONS_STREAM = "results:completions"
+# Поток ответов одного запуска в режиме poll; префикс должен совпадать с executor/main.py (TTL потока)
+RUN_RESULTS_PREFIX = "results:run:"
+CONSUMER_GROUP = "completions_group"
+SIGNAL_NAME = "result_ready"
+# Должен совпадать с WORKFLOW_ID_PREFIX в API (проверяет tests/test_unit/test_shared_constants.py)
+WORKFLOW_ID_PREFIX = "schedule-execution-"
+
+
+def completion_mode() -> str:
+    # poll - Activity ждет результат в потоке своего запуска results:run:{run_id},
+    # signal - Workflow ждет сигнал от ResultCompletionConsumer
+    return os.getenv("RESULT_COMPLETION_MODE", "poll")
+
+
+def run_results_stream(idempotency_key: str) -> str:
+    # Executor пишет результат задачи в поток из ее поля reply_to: в режиме poll это поток только этого запуска,
+    # поэтому ожидание не просматривает результаты других расписаний и прошлых запусков
+    return f"{RUN_RESULTS_PREFIX}{idempotency_key}"
+
+
+def result_timeout_seconds() -> int:
+    return int(os.getenv("RESULT_WAIT_TIMEOUT_SECONDS", "300"))
+
+
+class ResultCompletionConsumer:
+    def __init__(self, client, redis_host: str, redis_port: int, consumer_name: str = None,
+                 concurrency: int = None, batch_size: int = None, claim_idle_seconds: int = None):
+        self.client = client
+        self.redis_host = redis_host
+        self.redis_port = redis_port
+        self.consumer_name = consumer_name or f"completions_{uuid.uuid4().hex}"
+        self.concurrency = concurrency or int(os.getenv("RESULT_CONSUMER_CONCURRENCY", "200"))
+        self.batch_size = batch_size or int(os.getenv("RESULT_CONSUMER_BATCH", "500"))
+        self.claim_idle_ms = 1000 * (claim_idle_seconds or int(os.getenv("RESULT_CONSUMER_CLAIM_IDLE_SECONDS", "60")))
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def run(self):
+        import redis
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.Redis(host=self.redis_host, port=self.redis_port, db=0, decode_responses=True)
+        # Синхронный клиент для claim_check (выполняется в потоке, чтобы не блокировать цикл событий)
+        self._sync_redis = redis.Redis(host=self.redis_host, port=self.redis_port, db=0, decode_responses=True)
+        try:
+            await self._redis.xgroup_create(COMPLETIONS_STREAM, CONSUMER_GROUP, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+        logger.info(f"Result completion consumer '{self.consumer_name}' is reading '{COMPLETIONS_STREAM}'")
+        loop = asyncio.get_running_loop()
+        next_claim = 0.0
+        try:
+            while True:
+                try:
+                    if loop.time() >= next_claim:
+                        await self._claim_stale()
+                        next_claim = loop.time() + self.claim_idle_ms / 1000.0 / 2
+                    messages = await self._redis.xreadgroup(
+                        CONSUMER_GROUP, self.consumer_name, {COMPLETIONS_STREAM: ">"},
+                        count=self.batch_size, block=5000)
+                    for _, message_list in messages or []:
+                        await self._complete_all(message_list)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Result completion consumer error: {e}")
+                    await asyncio.sleep(1)
+        finally:
+            await self._redis.close()
+            self._sync_redis.close()
+
+    async def _claim_stale(self):
+        # Результаты, которые взяла и не подтвердила упавшая реплика
+        claimed = await self._redis.xautoclaim(
+            COMPLETIONS_STREAM, CONSUMER_GROUP, self.consumer_name,
+            min_idle_time=self.claim_idle_ms, start_id="0-0", count=self.batch_size)
+        await self._complete_all(claimed[1])
+
+    async def _complete_all(self, message_list):
+        await asyncio.gather(*(self._complete(message_id, message)
+                               for message_id, message in message_list if message))
+
+    async def _complete(self, message_id: str, message: dict):
+        from temporalio.service import RPCError, RPCStatusCode
+        from workflows.claim_check import check_in, release
+
+        async with self._semaphore:
+            schedule_id = message.get("schedule_id")
+            run_id = message.get("idempotency_key")
+            if not schedule_id or not run_id:
+                logger.warning(f"Result {message_id} without schedule_id or idempotency_key dropped")
+                await self._ack(message_id)
+                return
+
+            message = await asyncio.to_thread(check_in, self._sync_redis, schedule_id, message_id, message)
+            workflow_id = message.get("workflow_id") or f"{WORKFLOW_ID_PREFIX}{schedule_id}"
+            handle = self.client.get_workflow_handle(workflow_id, run_id=run_id)
+            try:
+                await handle.signal(SIGNAL_NAME, message)
+            except RPCError as e:
+                if e.status != RPCStatusCode.NOT_FOUND:
+                    # Сообщение остается pending и будет повторено после XAUTOCLAIM
+                    logger.warning(f"Failed to signal result {message_id} to schedule {schedule_id}: {e}")
+                    return
+                # Запуск уже завершен (таймаут ожидания, расписание остановлено): результат никому не нужен
+                logger.info(f"Workflow run {run_id} of schedule {schedule_id} is closed, result {message_id} dropped")
+                if message.get("payload_ref"):
+                    await asyncio.to_thread(release, self._sync_redis, message["payload_ref"])
+            await self._ack(message_id)
+
+    async def _ack(self, message_id: str):
+        await self._redis.xack(COMPLETIONS_STREAM, CONSUMER_GROUP, message_id)
+        await self._redis.xdel(COMPLETIONS_STREAM, message_id)
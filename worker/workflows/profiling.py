@@ -0,0 +1,137 @@
+# worker/workflows/profiling.py
+'''
+Профилирование Activity по запросу (см. также routers/app/profiling.py).
+
+Профилируются N следующих Activity этого Worker'а:
+    WORKER_PROFILE_ACTIVITIES           - сколько Activity профилировать после старта (по умолчанию 0);
+    profiling:arm:worker в Redis        - общий для всех реплик счетчик, задается POST /admin/profiles/arm.
+Профиль (сэмплирующий pyinstrument в async-режиме: в него попадает только код своей Activity, а не соседние
+корутины цикла событий) сохраняется в Redis в формате speedscope и читается через GET /admin/profiles/{id}.
+Код Workflow не профилируется: он выполняется в песочнице Temporal и должен оставаться детерминированным.
+'''
+import inspect
+import json
+import logging
+import os
+import time
+import uuid
+
+from temporalio import activity
+from temporalio.worker import ActivityInboundInterceptor, ExecuteActivityInput, Interceptor
+
+logger = logging.getLogger(__name__)
+
+# Ключи должны совпадать с routers/app/profiling.py
+ARM_KEY = "profiling:arm:worker"
+INDEX_KEY = "profiles:index"
+PROFILE_KEY_PREFIX = "profile:"
+
+# Уменьшение счетчика, только если он положительный
+TAKE_SCRIPT = """
+local left = tonumber(redis.call('GET', KEYS[1]) or '0')
+if left > 0 then
+    redis.call('DECR', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+
+class ActivityProfiler:
+    def __init__(self, redis_host: str, redis_port: int):
+        self.redis_host = redis_host
+        self.redis_port = redis_port
+        self.local_left = int(os.getenv("WORKER_PROFILE_ACTIVITIES", "0"))
+        self.interval = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.001"))
+        self.ttl_seconds = int(os.getenv("PROFILE_TTL_SECONDS", "86400"))
+        self.max_stored = int(os.getenv("PROFILE_MAX_STORED", "200"))
+        # Счетчик в Redis проверяется не чаще раза в секунду, пока он пуст
+        self._idle_until = 0.0
+        self._redis = None
+        self._available = None
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.Redis(host=self.redis_host, port=self.redis_port, db=0, decode_responses=True)
+        return self._redis
+
+    def _profiler_available(self) -> bool:
+        if self._available is None:
+            try:
+                import pyinstrument  # noqa: F401
+                self._available = True
+            except ImportError:
+                logger.warning("Activity profiling requested, but pyinstrument is not installed")
+                self._available = False
+        return self._available
+
+    async def take(self) -> bool:
+        # Брать ли следующую Activity на профилирование
+        if self.local_left > 0:
+            self.local_left -= 1
+            return self._profiler_available()
+        if time.monotonic() < self._idle_until:
+            return False
+        try:
+            taken = bool(await self.redis.eval(TAKE_SCRIPT, 1, ARM_KEY))
+        except Exception as e:
+            logger.warning(f"Failed to check profiling counter: {e}")
+            taken = False
+        if not taken:
+            self._idle_until = time.monotonic() + 1.0
+            return False
+        return self._profiler_available()
+
+    async def save(self, label: str, duration_ms: int, data: str) -> str:
+        profile_id = uuid.uuid4().hex
+        meta = {"id": profile_id, "service": "worker", "label": label, "duration_ms": duration_ms,
+                "created_at": time.time(), "format": "speedscope"}
+        key = f"{PROFILE_KEY_PREFIX}{profile_id}"
+        pipe = self.redis.pipeline()
+        pipe.hset(key, mapping={"meta": json.dumps(meta), "data": data})
+        pipe.expire(key, self.ttl_seconds)
+        pipe.zadd(INDEX_KEY, {profile_id: meta["created_at"]})
+        pipe.zremrangebyrank(INDEX_KEY, 0, -self.max_stored - 1)
+        await pipe.execute()
+        return profile_id
+
+
+class _ProfilingActivityInbound(ActivityInboundInterceptor):
+    def __init__(self, next: ActivityInboundInterceptor, profiler: ActivityProfiler):
+        super().__init__(next)
+        self.profiler = profiler
+
+    async def execute_activity(self, input: ExecuteActivityInput):
+        # Синхронные Activity выполняются в отдельном потоке, async-профилировщик их не видит
+        if not inspect.iscoroutinefunction(input.fn):
+            return await super().execute_activity(input)
+        if not await self.profiler.take():
+            return await super().execute_activity(input)
+        from pyinstrument import Profiler
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        info = activity.info()
+        label = f"{info.activity_type} ({info.workflow_id})"
+        profiler = Profiler(interval=self.profiler.interval, async_mode="enabled")
+        started = time.monotonic()
+        profiler.start()
+        try:
+            return await super().execute_activity(input)
+        finally:
+            profiler.stop()
+            duration_ms = int((time.monotonic() - started) * 1000)
+            try:
+                profile_id = await self.profiler.save(label, duration_ms, profiler.output(renderer=SpeedscopeRenderer()))
+                logger.info(f"Saved profile {profile_id} of '{label}' ({duration_ms} ms)")
+            except Exception as e:
+                logger.warning(f"Failed to save profile of '{label}': {e}")
+
+
+class ProfilingInterceptor(Interceptor):
+    def __init__(self, profiler: ActivityProfiler):
+        self.profiler = profiler
+
+    def intercept_activity(self, next: ActivityInboundInterceptor) -> ActivityInboundInterceptor:
+        return _ProfilingActivityInbound(next, self.profiler)
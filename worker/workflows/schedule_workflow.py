@@ -6,6 +6,7 @@ from temporalio import workflow, activity
 from temporalio.common import RetryPolicy
 from temporalio.exceptions import ApplicationError
 import json
+import zlib
 
 # Настройка логгирования
 logger = logging.getLogger(__name__)
@@ -14,6 +15,15 @@ logger = logging.getLogger(__name__)
 # Импорты для Redis и HTTP внутри Activity
 # так как они выполняются отдельно от Workflow
 
+from workflows.completions import SIGNAL_NAME, run_results_stream
+
+# Потоки задач по приоритетам, читаются Executor'ом с весами (см. executor/lanes.py)
+TASK_STREAMS = {
+    "high": "tasks:high",
+    "normal": "tasks",
+    "low": "tasks:low",
+}
+
 @activity.defn  # воркфлоу это план, активности -  шаги плана
 async def fetch_command_details(command_id: str) -> dict:
     # Получение деталей команды по command_id через API.
@@ -64,75 +74,122 @@ async def publish_task_to_redis(input_data: dict) -> bool:
     REDIS_HOST = os.getenv("REDIS_HOST", "scheduled_commands_redis")
     REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 
-    logger.info(f"Publishing task to Redis Stream 'tasks' at {REDIS_HOST}:{REDIS_PORT}")
+    # Неизвестный или отсутствующий приоритет (старые Workflow) - обычный поток 'tasks'
+    stream_name = TASK_STREAMS.get(input_data.get("priority"), TASK_STREAMS["normal"])
+
+    # Шардирование по устройству: значение TASK_PARTITIONS должно совпадать с Executor'ом (executor/partitions.py)
+    partitions = max(1, int(os.getenv("TASK_PARTITIONS", "1")))
+    if partitions > 1:
+        partition = zlib.crc32(str(input_data.get("device_id")).encode()) % partitions
+        stream_name = f"{stream_name}:p{partition}"
+
+    logger.info(f"Publishing task to Redis Stream '{stream_name}' at {REDIS_HOST}:{REDIS_PORT}")
 
     try:
         r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
 
+        # Контроль допуска: при отставании Executor'ов публикация замедляется или откладывается
+        from workflows.admission import admission_controller
+        decision = admission_controller.check(r, stream_name)
+        activity.heartbeat({"backpressure": decision.state, "lag": decision.lag, "pending": decision.pending})
+        if decision.state == "deferred":
+            # Temporal повторит Activity с backoff (см. retry_policy в ScheduleExecutionWorkflow)
+            raise ApplicationError(
+                f"Backpressure on '{stream_name}': lag={decision.lag}, pending={decision.pending}, publishing deferred",
+                type="Backpressure",
+            )
+        if decision.state == "throttled":
+            await asyncio.sleep(decision.delay_seconds)
+
+        # Режим signal: Executor отвечает в поток, который читает ResultCompletionConsumer (см. workflows/completions.py)
+        from workflows.completions import COMPLETIONS_STREAM, completion_mode, result_timeout_seconds
+        signal_mode = completion_mode() == "signal"
+
         task_message = {
             "schedule_id": input_data.get("schedule_id"),
             "command_id": input_data.get("command_id"),
             "device_id": input_data.get("device_id"),
+            "device_type": input_data.get("device_type") or "",
+            "device_address": input_data.get("device_address") or "",
             "command_string": input_data.get("command_string", ""),
+            "idempotency_key": input_data.get("idempotency_key") or "",
             "timestamp": datetime.utcnow().isoformat() + "Z"
         }
 
-        msg_id = r.xadd("tasks", task_message)
-        logger.info(f"Task published to Redis Stream 'tasks' with ID: {msg_id}")
+        if signal_mode:
+            # Куда отправить результат: поток для ResultCompletionConsumer и ID Workflow для сигнала
+            task_message["reply_to"] = COMPLETIONS_STREAM
+            task_message["workflow_id"] = activity.info().workflow_id
+        elif input_data.get("reply_to"):
+            # Режим poll: поток ответов этого запуска, его читает wait_for_result_from_redis
+            task_message["reply_to"] = input_data["reply_to"]
+
+        msg_id = r.xadd(stream_name, task_message)
+        logger.info(f"Task published to Redis Stream '{stream_name}' with ID: {msg_id}")
+        if signal_mode:
+            # Режим записывается в историю: Workflow выбирает способ ожидания по результату Activity
+            return {"completion": "signal", "timeout_seconds": result_timeout_seconds()}
         return True
 
+    except ApplicationError:
+        raise
     except Exception as e:
         logger.error(f"Failed to publish task to Redis: {e}")
         raise ApplicationError(f"Failed to publish task: {str(e)}")
 
 
 @activity.defn
-async def wait_for_result_from_redis(schedule_id: str) -> dict:
-    # Ожидание результата из Redis Streams.
+async def wait_for_result_from_redis(input_data: dict) -> dict:
+    # Ожидание результата в потоке ответов запуска (reply_to задачи, см. workflows/completions.py).
+    # В потоке только ответы этого запуска: группа потребителей не нужна, чтение идет с начала потока
     import redis
     import os
 
     REDIS_HOST = os.getenv("REDIS_HOST", "scheduled_commands_redis")
     REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 
-    logger.info(f"Waiting for result for schedule {schedule_id} from Redis Stream 'results'")
+    schedule_id = input_data.get("schedule_id")
+    stream_name = input_data.get("reply_to")
+    # Результат принимается только с ключом этого запуска: поздний ответ другой задачи не выдается за свой
+    idempotency_key = input_data.get("idempotency_key")
+    logger.info(f"Waiting for result for schedule {schedule_id} from Redis Stream '{stream_name}'")
 
     try:
         r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
 
-        consumer_group = f"worker_group_{schedule_id}"
-        stream_name = "results"
-
-        try:
-            r.xgroup_create(stream_name, consumer_group, id='0', mkstream=True)
-        except redis.exceptions.ResponseError as e:
-            if "BUSYGROUP" not in str(e):
-                raise
-            else:
-                logger.info(f"Consumer group '{consumer_group}' already exists for stream '{stream_name}'")
-
         start_time = datetime.utcnow()
         timeout_duration = timedelta(minutes=5)
+        last_id = "0"
 
-        while datetime.utcnow() - start_time < timeout_duration:
-            messages = r.xreadgroup(consumer_group, "worker_instance_1", {stream_name: '>'}, count=1, block=5000)
-
-            if messages:
-                for stream, message_list in messages:
-                    for message_id, message_dict in message_list:
-                        logger.info(f"Received message from Redis: ID={message_id}, Data={message_dict}")
-
-                        if message_dict.get("schedule_id") == schedule_id:
-                            logger.info(f"Found result for schedule {schedule_id}")
-                            r.xack(stream_name, consumer_group, message_id)
-                            r.xdel(stream_name, message_id)
-                            return message_dict
-                        else:
-                            logger.debug(f"Message {message_id} is not for schedule {schedule_id}, skipping...")
-            else:
-                logger.debug("No messages received in the last 5 seconds, checking timeout...")
-
-        raise ApplicationError(f"Timeout waiting for result for schedule {schedule_id}")
+        try:
+            while datetime.utcnow() - start_time < timeout_duration:
+                messages = r.xread({stream_name: last_id}, count=10, block=5000)
+
+                if messages:
+                    for stream, message_list in messages:
+                        for message_id, message_dict in message_list:
+                            last_id = message_id
+                            logger.info(f"Received message from Redis: ID={message_id}, "
+                                        f"schedule_id={message_dict.get('schedule_id')}, "
+                                        f"idempotency_key={message_dict.get('idempotency_key')}")
+
+                            if message_dict.get("idempotency_key") == idempotency_key:
+                                logger.info(f"Found result for schedule {schedule_id} (run {idempotency_key})")
+                                # Большой вывод не должен попадать в историю Workflow: выносим его в Redis
+                                from workflows.claim_check import check_in
+                                return check_in(r, schedule_id, message_id, message_dict)
+                            else:
+                                logger.warning(f"Message {message_id} is not for run {idempotency_key}, skipping...")
+                else:
+                    logger.debug("No messages received in the last 5 seconds, checking timeout...")
+
+            raise ApplicationError(f"Timeout waiting for result for schedule {schedule_id}")
+        finally:
+            # Поток нужен только на время ожидания; ответ, пришедший позже, удалится по TTL (см. executor/main.py)
+            try:
+                r.delete(stream_name)
+            except redis.exceptions.RedisError as e:
+                logger.warning(f"Failed to delete result stream '{stream_name}': {e}")
 
     except ApplicationError:
         raise
@@ -154,12 +211,30 @@ async def save_result_to_api(input_data: dict) -> bool:
     schedule_id = input_data.get("schedule_id")
     device_id = input_data.get("device_id")
     result_data = input_data.get("result_data")
+    payload_ref = input_data.get("payload_ref")
 
     if not schedule_id or not device_id or not result_data:
         error_msg = "Missing required data for saving result to API"
         logger.error(error_msg)
         raise ApplicationError(error_msg)
 
+    if payload_ref:
+        # Claim-check: вывод хранится в Redis, через историю Workflow прошла только ссылка
+        import redis
+        from workflows.claim_check import check_out
+        r = redis.Redis(host=os.getenv("REDIS_HOST", "scheduled_commands_redis"),
+                        port=int(os.getenv("REDIS_PORT", "6379")), db=0, decode_responses=True)
+        payload = check_out(r, payload_ref)
+        if payload is None:
+            # Повтор не поможет: данные удалены по TTL
+            raise ApplicationError(f"Result payload '{payload_ref}' for schedule {schedule_id} has expired",
+                                   non_retryable=True)
+        result_data = {
+            **result_data,
+            "output": payload["output"],
+            "parsed": json.loads(payload["parsed"]) if payload["parsed"] else None,
+        }
+
     url = f"{API_BASE_URL}/devices/{device_id}/schedules/{schedule_id}/result/"
     logger.info(f"Calling API to save result: POST {url}")
 
@@ -168,6 +243,9 @@ async def save_result_to_api(input_data: dict) -> bool:
             response = await client.post(url, json=result_data, timeout=30.0)
             response.raise_for_status()
             logger.info(f"Successfully saved result to API for schedule {schedule_id}. Status: {response.status_code}")
+            if payload_ref:
+                from workflows.claim_check import release
+                release(r, payload_ref)
             return True
     except httpx.HTTPStatusError as e:
         error_msg = f"HTTP error {e.response.status_code} while saving result to API: {e.response.text}"
@@ -185,6 +263,20 @@ async def save_result_to_api(input_data: dict) -> bool:
 
 @workflow.defn
 class ScheduleExecutionWorkflow:
+    def __init__(self):
+        # Результат, доставленный сигналом result_ready (RESULT_COMPLETION_MODE=signal)
+        self._result = None
+
+    @workflow.signal(name=SIGNAL_NAME)
+    def result_ready(self, result: dict):
+        # Результат чужой задачи (ключ идемпотентности другого запуска) не принимается
+        if result.get("idempotency_key") != workflow.info().run_id:
+            workflow.logger.warning(f"Ignored result with idempotency_key {result.get('idempotency_key')}")
+            return
+        # Повторный сигнал (повторная доставка из потока) не заменяет полученный результат
+        if self._result is None:
+            self._result = result
+
     @workflow.run
     async def run(self, input_data: dict):
         # Основной Workflow для выполнения команды по расписанию.
@@ -199,11 +291,25 @@ class ScheduleExecutionWorkflow:
         schedule_id = input_data.get("schedule_id")
         command_id = input_data.get("command_id")
         device_id = input_data.get("device_id")
+        device_type = input_data.get("device_type")
         cron_expression = input_data.get("cron_expression")
+        priority = input_data.get("priority", "normal")
+        start_offset_seconds = input_data.get("start_offset_seconds", 0)
+        # Ключ идемпотентности запуска: run_id не меняется при replay и повторах Activity, поэтому повторная
+        # публикация задачи не выполняет команду на устройстве второй раз (Executor), а повторное сохранение
+        # не создает второй результат (API)
+        idempotency_key = workflow.info().run_id
 
         try:
             logger.info(f"Waiting for next execution time based on cron: {cron_expression}")
 
+            # Сглаживание нагрузки: расписания с одинаковым cron стартуют в одну секунду, поэтому запуск
+            # смещается на детерминированное для расписания время (вычисляется в API, см. app/schedule_workflows.py).
+            # Таймер Temporal: Worker не занят ожиданием
+            if start_offset_seconds:
+                logger.info(f"Delaying execution by {start_offset_seconds}s to spread load")
+                await workflow.sleep(timedelta(seconds=start_offset_seconds))
+
             # Получаем command_string из API
             logger.info(f"Fetching command details for command_id: {command_id}")
             command_details = await workflow.execute_activity(
@@ -220,28 +326,55 @@ class ScheduleExecutionWorkflow:
             logger.info(f"Successfully fetched command_string: '{command_string}'")
 
             # Публикуем задачу в Redis
-            logger.info("Publishing task to Redis Stream 'tasks'...")
+            logger.info(f"Publishing task to Redis with priority '{priority}'...")
             task_data = {
                 "schedule_id": schedule_id,
                 "command_id": command_id,
                 "device_id": device_id,
-                "command_string": command_string
+                "device_type": device_type,
+                "device_address": input_data.get("device_address"),
+                "command_string": command_string,
+                "priority": priority,
+                "idempotency_key": idempotency_key,
+                # Поток ответов запуска для режима poll
+                "reply_to": run_results_stream(idempotency_key)
             }
-            await workflow.execute_activity(
+            # При backpressure публикация откладывается: повторы с backoff, но не дольше 10 минут.
+            # Если cron-запуск не успел опубликоваться за это время, он завершается ошибкой,
+            # а следующий запуск по расписанию стартует как обычно
+            publish_result = await workflow.execute_activity(
                 publish_task_to_redis,
                 task_data,
                 start_to_close_timeout=timedelta(seconds=30),
-                retry_policy=RetryPolicy(maximum_attempts=3)
+                schedule_to_close_timeout=timedelta(minutes=10),
+                retry_policy=RetryPolicy(
+                    initial_interval=timedelta(seconds=5),
+                    backoff_coefficient=2.0,
+                    maximum_interval=timedelta(minutes=1),
+                    maximum_attempts=0
+                )
             )
 
-            # Ждем результата из Redis
-            logger.info("Waiting for result from Redis Stream 'results'...")
-            result_data = await workflow.execute_activity(
-                wait_for_result_from_redis,
-                schedule_id,
-                start_to_close_timeout=timedelta(minutes=6),
-                retry_policy=RetryPolicy(maximum_attempts=1)
-            )
+            if isinstance(publish_result, dict) and publish_result.get("completion") == "signal":
+                # Ждем сигнал с результатом: таймер Temporal вместо Activity, слот Worker'а не занят
+                logger.info("Waiting for result signal...")
+                try:
+                    await workflow.wait_condition(
+                        lambda: self._result is not None,
+                        timeout=timedelta(seconds=publish_result["timeout_seconds"]),
+                    )
+                except asyncio.TimeoutError:
+                    raise ApplicationError(f"Timeout waiting for result for schedule {schedule_id}")
+                result_data = self._result
+            else:
+                # Ждем результата из Redis
+                logger.info(f"Waiting for result from Redis Stream '{task_data['reply_to']}'...")
+                result_data = await workflow.execute_activity(
+                    wait_for_result_from_redis,
+                    {"schedule_id": schedule_id, "reply_to": task_data["reply_to"], "idempotency_key": idempotency_key},
+                    start_to_close_timeout=timedelta(minutes=6),
+                    retry_policy=RetryPolicy(maximum_attempts=1)
+                )
 
             logger.info(f"Received result from executor: {result_data}")
 
@@ -252,9 +385,17 @@ class ScheduleExecutionWorkflow:
                 "device_id": device_id,
                 "result_data": {
                     "output": result_data.get("output"),
-                    "status": result_data.get("status")
+                    "status": result_data.get("status"),
+                    # Executor передает разобранный вывод JSON-строкой (поля потоков Redis - строки)
+                    "parsed": json.loads(result_data["parsed"]) if result_data.get("parsed") else None,
+                    "duration_ms": int(result_data["duration_ms"]) if result_data.get("duration_ms") else None,
+                    # Ключ, с которым Executor выполнил задачу (совпадает с ключом запуска, см. проверку выше)
+                    "idempotency_key": result_data.get("idempotency_key") or idempotency_key
                 }
             }
+            if result_data.get("payload_ref"):
+                # Большой вывод вынесен в Redis (см. workflows/claim_check.py), Activity достанет его по ссылке
+                save_result_input["payload_ref"] = result_data["payload_ref"]
             await workflow.execute_activity(
                 save_result_to_api,
                 save_result_input,
@@ -0,0 +1,59 @@
+# worker/workflows/task_queues.py
+'''
+Очереди задач Temporal, которые обслуживает Worker.
+
+API направляет Workflow в очередь по типу устройства (TASK_QUEUE_ROUTES, fastapi/app/schedule_workflows.py):
+общая очередь scheduled-tasks и партиции scheduled-tasks-{партиция}. Worker подписывается на часть очередей:
+    WORKER_TASK_QUEUES=default,routers:400,slow:20:10
+Элемент списка - партиция[:Activity[:Workflow-задачи]], где default - общая очередь, а числа - предел одновременных
+Activity и задач Workflow в этой очереди (по умолчанию WORKER_MAX_CONCURRENT_ACTIVITIES и
+WORKER_MAX_CONCURRENT_WORKFLOW_TASKS). Для каждой очереди запускается отдельный temporalio Worker со своими
+слотами: долгие Activity медленного класса устройств не занимают слоты остальных, а мощность распределяется
+числом реплик Worker'а на партицию и пределами в WORKER_TASK_QUEUES.
+'''
+import os
+from dataclasses import dataclass
+
+# Должна совпадать с TASK_QUEUE в API
+TASK_QUEUE = "scheduled-tasks"
+
+
+@dataclass
+class QueueSubscription:
+    task_queue: str
+    max_concurrent_activities: int
+    max_concurrent_workflow_tasks: int
+
+
+def queue_name(partition: str) -> str:
+    if not partition or partition == "default":
+        return TASK_QUEUE
+    return f"{TASK_QUEUE}-{partition}"
+
+
+def parse_subscriptions(spec: str, default_activities: int, default_workflow_tasks: int) -> list:
+    subscriptions = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        partition, *limits = item.split(":")
+        if len(limits) > 2 or not all(limit.isdigit() and int(limit) > 0 for limit in limits):
+            raise ValueError(f"Invalid task queue subscription '{item}', expected partition[:activities[:workflow_tasks]]")
+        task_queue = queue_name(partition.strip())
+        subscriptions[task_queue] = QueueSubscription(
+            task_queue=task_queue,
+            max_concurrent_activities=int(limits[0]) if limits else default_activities,
+            max_concurrent_workflow_tasks=int(limits[1]) if len(limits) > 1 else default_workflow_tasks,
+        )
+    if not subscriptions:
+        raise ValueError("WORKER_TASK_QUEUES does not contain any task queue")
+    return list(subscriptions.values())
+
+
+def subscriptions_from_env() -> list:
+    return parse_subscriptions(
+        os.getenv("WORKER_TASK_QUEUES", "default"),
+        int(os.getenv("WORKER_MAX_CONCURRENT_ACTIVITIES", "100")),
+        int(os.getenv("WORKER_MAX_CONCURRENT_WORKFLOW_TASKS", "100")),
+    )